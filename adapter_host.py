@@ -0,0 +1,110 @@
+import hashlib
+
+from peft import PeftModel
+
+from conversation import PROMPT_TEMPLATES
+
+BASE_ADAPTER = "__base__"  # peft's name for "no adapter" in a mixed batch
+
+# ---------------------------
+# Several LoRA adapters on one resident base model
+# ---------------------------
+class AdapterHost:
+    """
+    Loads the base model once (see inference_server.load_model) and keeps any number of LoRA
+    adapters registered on it. Each extra adapter costs only its LoRA weights instead of a full
+    model. Requests name their adapter, and one forward pass can serve rows for different adapters
+    (peft's adapter_names). Adapters can be added and removed while serving; the caller must make
+    sure no forward pass runs concurrently (ContinuousBatchEngine.model_lock).
+
+    Sessions that do not name an adapter are assigned one by route(), with stable per-session
+    buckets so A/B traffic splits do not flip adapters mid-conversation.
+
+    Each adapter records the prompt template it was trained on (a key of
+    conversation.PROMPT_TEMPLATES), so the server prompts it and checks its output accordingly.
+    """
+    def __init__(self, base_model, tokenizer):
+        self.base_model = base_model
+        self.tokenizer = tokenizer
+        self.model = None  # PeftModel once the first adapter is registered
+        self.paths = {}  # adapter name -> path or hub id
+        self.traffic = {}  # adapter name -> routing weight
+        self.templates = {}  # adapter name -> prompt template name
+
+    def register(self, name, path, weight=None, template="context"):
+        if name in self.paths:
+            raise ValueError(f"adapter '{name}' is already registered")
+        if template not in PROMPT_TEMPLATES:
+            raise ValueError(f"unknown prompt template '{template}'")
+        if self.model is None:
+            self.model = PeftModel.from_pretrained(self.base_model, path, adapter_name=name)
+        else:
+            self.model.load_adapter(path, adapter_name=name)
+        self.model.eval()
+        self.paths[name] = path
+        self.templates[name] = template
+        if weight is not None or not self.traffic:
+            self.traffic[name] = 1.0 if weight is None else weight
+
+    def unregister(self, name):
+        if name not in self.paths:
+            raise KeyError(name)
+        if len(self.paths) == 1:
+            raise ValueError("cannot unregister the last adapter")
+        self.model.delete_adapter(name)
+        del self.paths[name]
+        del self.templates[name]
+        self.traffic.pop(name, None)
+        if not self.traffic:
+            # The only routed adapter is gone: split evenly over the ones that are left
+            self.traffic = {remaining: 1.0 for remaining in self.paths}
+
+    def set_traffic(self, weights):
+        """weights: adapter name -> share of the sessions that do not ask for a specific adapter."""
+        unknown = set(weights) - set(self.paths)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        traffic = {name: weight for name, weight in weights.items() if weight > 0}
+        if not traffic:
+            raise ValueError("traffic split needs at least one adapter with a positive weight")
+        self.traffic = traffic
+
+    def route(self, session_id):
+        """Adapter for a session, from a hash of its id so the choice is stable across turns."""
+        traffic = self.traffic or {name: 1.0 for name in self.paths}
+        if not traffic:
+            return BASE_ADAPTER
+        names = sorted(traffic)
+        total = sum(traffic[name] for name in names)
+        point = int(hashlib.md5(session_id.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF * total
+        for name in names:
+            point -= traffic[name]
+            if point <= 0:
+                return name
+        return names[-1]
+
+    def resolve(self, name, session_id):
+        """The adapter a request should use; raises KeyError for unknown names."""
+        name = name or self.route(session_id)
+        if name != BASE_ADAPTER and name not in self.paths:
+            raise KeyError(name)
+        return name
+
+    # ---------------------------
+    # Memory accounting
+    # ---------------------------
+    def adapter_bytes(self, name):
+        return sum(p.numel() * p.element_size() for n, p in self.model.named_parameters() if f".{name}." in n)
+
+    def base_bytes(self):
+        model = self.model if self.model is not None else self.base_model
+        return sum(p.numel() * p.element_size() for n, p in model.named_parameters()
+                   if not any(f".{name}." in n for name in self.paths))
+
+    def stats(self):
+        return {
+            "base_mb": self.base_bytes() / 2**20,
+            "adapters": {name: {"path": path, "mb": self.adapter_bytes(name) / 2**20,
+                                "traffic": self.traffic.get(name, 0.0), "template": self.templates[name]}
+                         for name, path in self.paths.items()},
+        }
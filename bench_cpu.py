@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import statistics
+import time
+
+from conversation import train_prompt_style_context
+from cpu_backend import export_gguf, load_cpu_model, CpuChatModel
+
+# ------------------------------
+# Backends
+# ------------------------------
+class TransformersBackend:
+    """The current path: unsloth 4-bit on the GPU, or the merged model in float32 on the CPU with plain transformers."""
+    def __init__(self, loader, model_name, merged_dir, max_seq_length):
+        import torch
+        from transformers import StoppingCriteriaList
+        from pipeline_stopping import PipelineStoppingCriteria
+        from text_streaming import CapturingTextStreamer
+        self.torch = torch
+        self.StoppingCriteriaList = StoppingCriteriaList
+        self.PipelineStoppingCriteria = PipelineStoppingCriteria
+        self.CapturingTextStreamer = CapturingTextStreamer
+        if loader == "unsloth":
+            from unsloth import FastLanguageModel
+            self.model, self.tokenizer = FastLanguageModel.from_pretrained(
+                model_name=model_name, max_seq_length=max_seq_length, dtype=None, load_in_4bit=True,
+            )
+            FastLanguageModel.for_inference(self.model)
+        else:
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(merged_dir)
+            self.model = AutoModelForCausalLM.from_pretrained(merged_dir, torch_dtype=torch.float32).eval()
+
+    def generate(self, prompt, user_input, max_new_tokens):
+        inputs = self.tokenizer([prompt], return_tensors="pt").to(self.model.device)
+        first_token_time = []
+        streamer = self.CapturingTextStreamer(self.tokenizer, print_output=False,
+                                              on_text=lambda text: first_token_time.append(time.perf_counter()))
+        stopping = self.PipelineStoppingCriteria(self.tokenizer, inputs.input_ids.shape[1], user_input)
+        start = time.perf_counter()
+        with self.torch.no_grad():
+            outputs = self.model.generate(**inputs, streamer=streamer, max_new_tokens=max_new_tokens, do_sample=False,
+                                          stopping_criteria=self.StoppingCriteriaList([stopping]),
+                                          pad_token_id=self.tokenizer.eos_token_id)
+        end = time.perf_counter()
+        num_tokens = outputs.shape[1] - inputs.input_ids.shape[1]
+        first = first_token_time[0] if first_token_time else end
+        return {
+            "text": stopping.clean(streamer.generated_text.strip()),
+            "ttft": first - start,
+            "num_tokens": num_tokens,
+            "tokens_per_second": (num_tokens - 1) / (end - first) if num_tokens > 1 and end > first else 0.0,
+        }
+
+class GgufBackend:
+    def __init__(self, gguf_path, max_seq_length, threads):
+        self.model = CpuChatModel(load_cpu_model(gguf_path, max_seq_length, n_threads=threads))
+
+    def generate(self, prompt, user_input, max_new_tokens):
+        return self.model.generate(prompt, max_new_tokens)
+
+# ------------------------------
+# Benchmark
+# ------------------------------
+def load_prompts(dataset_path, count):
+    """The first count dataset inputs as single-turn context prompts."""
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        samples = json.load(f)
+    return [(train_prompt_style_context.format("", s["input"], ""), s["input"]) for s in samples[:count]]
+
+def run(name, backend, prompts, max_new_tokens):
+    backend.generate(*prompts[0], max_new_tokens)  # warm-up
+    results = [backend.generate(prompt, user_input, max_new_tokens) for prompt, user_input in prompts]
+    ttfts = [r["ttft"] * 1000 for r in results]
+    total_tokens = sum(r["num_tokens"] for r in results)
+    rates = [r["tokens_per_second"] for r in results if r["tokens_per_second"] > 0]
+    print(f"\n--- {name} ---")
+    print(f"Median TTFT:      {statistics.median(ttfts):8.1f} ms (max {max(ttfts):.1f} ms)")
+    print(f"Decode tokens/s:  {statistics.mean(rates) if rates else 0.0:8.1f}")
+    print(f"Generated tokens: {total_tokens}")
+    return [r["text"] for r in results]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the quantized CPU backend with the transformers path.")
+    parser.add_argument("--model", default="novak247/massage_assistant_context_lora")
+    parser.add_argument("--quantization", default="q4_k_m")
+    parser.add_argument("--output_dir", default="cpu_models")
+    parser.add_argument("--baseline", default="hf", choices=["unsloth", "hf", "none"],
+                        help="unsloth (4-bit GPU, the chat scripts' path) or hf (merged float32 on the CPU)")
+    parser.add_argument("--dataset", default="datasets/massage_robot_dataset_v2.json")
+    parser.add_argument("--prompts", default=20, type=int)
+    parser.add_argument("--threads", default=None, type=int)
+    parser.add_argument("--max_seq_length", default=2048, type=int)
+    parser.add_argument("--max_new_tokens", default=150, type=int)
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.dataset, args.prompts)
+    start = time.perf_counter()
+    gguf_path = export_gguf(args.model, args.output_dir, args.quantization)
+    gguf = GgufBackend(gguf_path, args.max_seq_length, args.threads)
+    print(f"GGUF ready in {time.perf_counter() - start:.1f} s ({os.path.getsize(gguf_path) / 2**20:.0f} MB)")
+    gguf_texts = run(f"llama.cpp {args.quantization}", gguf, prompts, args.max_new_tokens)
+    del gguf
+
+    if args.baseline != "none":
+        name = args.model.rstrip("/").split("/")[-1]
+        merged_dir = os.path.join(args.output_dir, f"{name}-merged")
+        baseline = TransformersBackend(args.baseline, args.model, merged_dir, args.max_seq_length)
+        baseline_texts = run(f"transformers ({args.baseline})", baseline, prompts, args.max_new_tokens)
+        agree = sum(a == b for a, b in zip(gguf_texts, baseline_texts))
+        print(f"\nIdentical responses: {agree}/{len(prompts)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import random
+import statistics
+from collections import Counter
+
+from pipeline_executor import PipelineExecutor, DetectionCache
+from pipeline_optimizer import optimize
+from pipeline_parser import Start, Stop, DetectBodyPart, AutomaticMassage, parse_pipeline
+from robot_simulator import SimulatedRobot, BlockingSimulatedRobot, run_commands, format_trace
+
+# ------------------------------
+# Plans
+# ------------------------------
+def load_plans(dataset_path, count):
+    """Reference pipelines of a dataset file (v2 or create_context_dataset.py output) as command lists."""
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        samples = json.load(f)
+    plans = []
+    for sample in samples[:count]:
+        response = sample["response"]
+        plans.append(parse_pipeline("\n".join(response) if isinstance(response, list) else response))
+    return plans
+
+def build_sessions(plans, session_length=8, parts_per_session=2, seed=0):
+    """
+    Concatenates consecutive plans into massage sessions, as one client would issue them: one
+    start() ... stop() per session, and the body parts remapped onto parts_per_session parts, so
+    the same areas are detected and moved to repeatedly. Single dataset plans almost never repeat
+    a detection, which would leave nothing for the optimizer or the detection cache to save.
+    """
+    rng = random.Random(seed)
+    all_parts = sorted({command.part for plan in plans for command in plan
+                        if isinstance(command, (DetectBodyPart, AutomaticMassage))})
+    sessions = []
+    for i in range(0, len(plans), session_length):
+        session_parts = rng.sample(all_parts, min(parts_per_session, len(all_parts)))
+        mapping = {}
+        commands = [Start()]
+        for plan in plans[i:i + session_length]:
+            for command in plan:
+                if isinstance(command, (Start, Stop)):
+                    continue
+                if isinstance(command, (DetectBodyPart, AutomaticMassage)):
+                    part = mapping.setdefault(command.part, rng.choice(session_parts))
+                    command = command._replace(part=part)
+                commands.append(command)
+        sessions.append(commands + [Stop()])
+    return sessions
+
+# ------------------------------
+# Configurations
+# ------------------------------
+def run_direct(plans, robot, use_optimizer):
+    """Plans run one after another on the simulator's coroutines."""
+    async def run():
+        detected = None
+        for plan in plans:
+            if not robot.started and not (plan and isinstance(plan[0], Start)):
+                await robot.start()  # the operator restarts the robot after a stop()
+            if use_optimizer:
+                plan, _ = optimize(plan)
+            detected = await run_commands(robot, plan, detected)
+    asyncio.run(run())
+
+def run_executor(plans, robot, use_optimizer, ttl):
+    """Plans go through PipelineExecutor with a DetectionCache, as in context_chat.py."""
+    blocking = BlockingSimulatedRobot(robot)
+    # The TTL runs on the simulated clock, so it means the same whatever --time_scale is
+    cache = DetectionCache(blocking.detect_body_parts, ttl=ttl, clock=lambda: robot.clock)
+    executor = PipelineExecutor(blocking, cache)
+    for plan in plans:
+        if not robot.started and not (plan and isinstance(plan[0], Start)):
+            blocking.start()
+        if use_optimizer:
+            plan, _ = optimize(plan)
+        for command in plan:
+            executor.submit(command)
+        executor.wait()
+        executor.reset()
+    executor.close()
+    blocking.close()
+    return executor.detection_cache.stats()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated robot time of dataset pipelines with and without the optimizer and detection cache.")
+    parser.add_argument("--dataset", default="datasets/massage_robot_dataset_v2.json")
+    parser.add_argument("--plans", default=300, type=int)
+    parser.add_argument("--session_length", default=8, type=int,
+                        help="Dataset plans concatenated into one session (1 runs the plans as they are)")
+    parser.add_argument("--parts_per_session", default=2, type=int,
+                        help="Body parts each session's detections and massages are remapped onto")
+    parser.add_argument("--time_scale", default=0.0, type=float,
+                        help="Fraction of the simulated durations actually slept (0 runs instantly)")
+    parser.add_argument("--ttl", default=30.0, type=float, help="Detection cache TTL in seconds")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--show_trace", default=0, type=int, help="Print the trace of the first N calls of each run")
+    args = parser.parse_args()
+
+    plans = load_plans(args.dataset, args.plans)
+    if args.session_length > 1:
+        plans = build_sessions(plans, args.session_length, args.parts_per_session, args.seed)
+    configs = [
+        ("sequential", False, False),
+        ("optimizer", True, False),
+        ("executor + detection cache", False, True),
+        ("optimizer + detection cache", True, True),
+    ]
+    baseline = None
+    for name, use_optimizer, use_cache in configs:
+        robot = SimulatedRobot(time_scale=args.time_scale, seed=args.seed)
+        cache_stats = run_executor(plans, robot, use_optimizer, args.ttl) if use_cache else None
+        if not use_cache:
+            run_direct(plans, robot, use_optimizer)
+        total = robot.simulated_time()
+        baseline = baseline or total
+        calls = Counter(event.call.split("(")[0] for event in robot.trace)
+        durations = [event.duration for event in robot.trace]
+        print(f"\n--- {name} ---")
+        print(f"Simulated robot time: {total:8.1f} s ({total / baseline:.0%} of sequential), "
+              f"median call {statistics.median(durations) * 1000:.0f} ms")
+        print("Calls:", ", ".join(f"{call} {n}" for call, n in sorted(calls.items())))
+        if cache_stats is not None:
+            print(f"Detection cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                  f"{cache_stats['perception_calls']} perception calls")
+        if args.show_trace:
+            print(format_trace(robot.trace[:args.show_trace]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import random
+import time
+
+from inference_server import ContinuousBatchEngine, ChatService, load_model
+
+# A few of the phrasings produced by create_context_dataset.py
+MESSAGES = [
+    "Start the massage robot",
+    "Please locate my shoulders",
+    "Reduce massage pressure by 20%",
+    "shoulders",
+    "Then neck; increase force level by 30%",
+    "Return to the home position",
+    "Stop",
+]
+
+async def session(service, session_id, turns):
+    for _ in range(turns):
+        async for _chunk in service.chat(session_id, random.choice(MESSAGES)):
+            pass
+
+async def run_load(service, sessions, turns):
+    engine_task = asyncio.create_task(service.engine.run())
+    start = time.perf_counter()
+    await asyncio.gather(*[session(service, f"station-{i}", turns) for i in range(sessions)])
+    wall = time.perf_counter() - start
+    engine_task.cancel()
+    return wall
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the continuous batching engine (no HTTP).")
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM",
+                        help="Model name or path; the default tiny model runs on CPU")
+    parser.add_argument("--loader", default="hf", choices=["unsloth", "hf"])
+    parser.add_argument("--sessions", default=8, type=int, help="Concurrent robot sessions")
+    parser.add_argument("--turns", default=3, type=int, help="Messages per session")
+    parser.add_argument("--max_batch_size", default=8, type=int)
+    parser.add_argument("--max_new_tokens", default=64, type=int)
+    args = parser.parse_args()
+
+    random.seed(0)
+    model, tokenizer = load_model(args.model, args.loader)
+    # Batch size 1 is the one-process-per-station baseline
+    for batch_size in sorted({1, args.max_batch_size}):
+        engine = ContinuousBatchEngine(model, tokenizer, max_batch_size=batch_size)
+        service = ChatService(engine, tokenizer, max_new_tokens=args.max_new_tokens)
+        wall = asyncio.run(run_load(service, args.sessions, args.turns))
+        stats = engine.stats()
+        print(f"\n--- max_batch_size={batch_size}, {args.sessions} sessions x {args.turns} turns ---")
+        print(f"Generated tokens:        {stats['generated_tokens']}")
+        print(f"Aggregate tokens/s:      {stats['generated_tokens'] / wall:.1f} (wall), "
+              f"{stats['tokens_per_second']:.1f} (engine busy time)")
+        print(f"Median TTFT:             {stats['median_ttft_ms']:.1f} ms")
+        for session_id, ttft in sorted(stats["ttft_ms_per_session"].items()):
+            print(f"  {session_id:<12} TTFT mean {ttft['mean']:8.1f} ms, max {ttft['max']:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import time
+
+from transformers import AutoTokenizer
+
+from text_streaming import IncrementalDetokenizer, CapturingTextStreamer
+
+# ------------------------------
+# Streamer variants
+# ------------------------------
+def per_token_decode(tokenizer, token_ids):
+    """The original CapturingTextStreamer.on_token: decode each token alone and concatenate."""
+    text = ""
+    for token in token_ids:
+        text += tokenizer.decode([token], skip_special_tokens=True)
+    return text
+
+def full_redecode(tokenizer, token_ids):
+    """What TextStreamer.put() does: decode the whole cached buffer again on every token."""
+    cache, printed, text = [], 0, ""
+    for token in token_ids:
+        cache.append(token)
+        decoded = tokenizer.decode(cache, skip_special_tokens=True)
+        text += decoded[printed:]
+        printed = len(decoded)
+    return text
+
+def incremental(tokenizer, token_ids):
+    detokenizer = IncrementalDetokenizer(tokenizer)
+    for token in token_ids:
+        detokenizer.add([token])
+    detokenizer.flush()
+    return detokenizer.text
+
+def capturing_streamer(tokenizer, token_ids):
+    streamer = CapturingTextStreamer(tokenizer, skip_prompt=False, print_output=False)
+    for token in token_ids:
+        streamer.put([token])
+    streamer.end()
+    return streamer.generated_text
+
+# ------------------------------
+# Benchmark
+# ------------------------------
+def response_tokens(tokenizer, dataset_path, count):
+    """Token ids of dataset responses joined by newlines, cut to count tokens."""
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        samples = json.load(f)
+    token_ids = []
+    for sample in samples:
+        response = sample["response"]
+        if isinstance(response, list):
+            response = "\n".join(response)
+        token_ids += tokenizer.encode(response + "\n", add_special_tokens=False)
+        if len(token_ids) >= count:
+            break
+    return token_ids[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure streamer overhead per generated token.")
+    parser.add_argument("--tokenizer", default="novak247/massage_assistant_context_lora",
+                        help="Tokenizer to benchmark with (HF repo id or local path)")
+    parser.add_argument("--dataset", default="datasets/massage_robot_dataset_v2.json",
+                        help="Dataset whose responses are used as the token stream")
+    parser.add_argument("--lengths", default="150,1000", help="Comma separated stream lengths in tokens")
+    parser.add_argument("--repeats", default=5, type=int, help="Best-of repeats per measurement")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    variants = [
+        ("per-token decode", per_token_decode),
+        ("TextStreamer re-decode", full_redecode),
+        ("IncrementalDetokenizer", incremental),
+        ("CapturingTextStreamer", capturing_streamer),
+    ]
+
+    for length in [int(n) for n in args.lengths.split(",")]:
+        token_ids = response_tokens(tokenizer, args.dataset, length)
+        reference = tokenizer.decode(token_ids, skip_special_tokens=True)
+        print(f"\n--- {len(token_ids)} tokens ---")
+        for name, fn in variants:
+            best = float("inf")
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                text = fn(tokenizer, token_ids)
+                best = min(best, time.perf_counter() - start)
+            exact = "exact" if text == reference else "MISMATCH"
+            print(f"{name:<24} {best / len(token_ids) * 1e6:8.1f} us/token  ({exact})")
+
+if __name__ == "__main__":
+    main()
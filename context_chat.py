@@ -3,15 +3,47 @@ os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "0"
 os.environ["HF_HUB_DISABLE_PROGRESS_BAR"] = "0"
 
 from unsloth import FastLanguageModel
-from transformers import TextStreamer
+from transformers import StoppingCriteriaList
+import time
 import torch
 
+from pipeline_grammar import PipelineGrammar, GrammarTokenIndex, PipelineGrammarLogitsProcessor, constrained_generate
+from pipeline_stopping import PipelineStoppingCriteria
+from pipeline_parser import IncrementalPipelineParser, parse_pipeline
+from pipeline_executor import PipelineExecutor, LoggingRobot, DetectionCache
+from perception import SimulatedPerception
+from pipeline_optimizer import StreamingOptimizer, compile_pipeline, report
+from text_streaming import CapturingTextStreamer
+from kv_cache import PrefixCache, ChatSession
+from prompt_lookup import speculative_generate
+from response_cache import ResponseCache
+from rule_parser import RuleBasedParser
+from semantic_cache import SentenceEncoder, SemanticCache
+from conversation import (train_prompt_style_context, context_preamble, context_suffix_template,
+                          ConversationHistory, trim_history, history_token_budget)
+
 # ---------------------------
 # 1. Load your model/tokenizer
 # ---------------------------
 max_seq_length = 2048
+max_new_tokens = 150
 dtype = None
 load_in_4bit = True
+use_prefix_cache = True  # Prefill the static preamble once and reuse its KV cache every turn
+use_session_cache = True  # Keep the KV cache across turns and only prefill new tokens (needs use_prefix_cache)
+use_grammar_constraints = True  # Only decode valid pipelines and fast-forward over forced tokens
+use_structural_stop = True  # Stop as soon as the pipeline is complete instead of at max_new_tokens
+use_streaming_executor = True  # Run each pipeline line on the robot as soon as it has been generated
+use_detection_cache = True  # Reuse body-part detections until they expire, home()/stop() or the client moves
+detection_cache_ttl = 30.0  # Seconds
+use_pipeline_optimizer = True  # Drop repeated detections and fold back-to-back moves/force changes before execution
+use_prompt_lookup = True  # Draft tokens from n-gram matches in the prompt/history and verify them in one pass
+use_rule_parser = True  # Answer templated commands with the deterministic parser instead of the model
+use_response_cache = True  # Answer repeated (history, input) pairs without running the model
+response_cache_path = "response_cache.json"  # None keeps the cache in memory only
+use_semantic_cache = True  # Answer paraphrases of earlier inputs from a nearest-neighbour index
+semantic_cache_threshold = 0.9  # Minimum cosine similarity for a semantic hit
+semantic_cache_seed = "massage_robot_dataset_with_mixed_commands.json"  # create_context_dataset.py output; None starts with an empty index
 
 model, tokenizer = FastLanguageModel.from_pretrained(
     model_name="novak247/massage_assistant_context_lora",  # or your trained model
@@ -22,75 +54,53 @@ model, tokenizer = FastLanguageModel.from_pretrained(
 FastLanguageModel.for_inference(model)  # Enable faster inference
 
 # ---------------------------
-# 2. Define prompt style with context
-# ---------------------------
-train_prompt_style_context = """Below is a conversation that provides instructions for operating a massage robot. The conversation history provides context to help generate an executable Python pipeline using only the provided functions.
-Before answering, carefully consider the conversation history to infer any missing actions.
-
-### Instruction:
-You are provided with high-level instructions for operating a massage robot. Create an executable pipeline in Python that structures task execution through a sub-task pipeline. This pipeline should be composed exclusively of the functions listed below in the Capabilities section, arranged in a logical and correct order so that it can be directly executed. Your response should only consist of the pipeline without additional information.
-
-Capabilities:
-    start() → Initializes the robot.
-    stop() → Stops the robot.
-    home() → Moves the robot to the home position.
-    [x, y, z] = detect_body_part(part_name) → Detects the specified body part and returns the coordinates.
-    move_to([x, y, z]) → Moves the robot to the specified coordinates.
-    change_force(mode, value) → Adjusts the massage force based on the specified mode:
-        - If mode is 'absolute', then value is any real number, setting the force directly.
-        - If mode is 'relative', then value is between -1 and 1, modifying the current force F as:
-          F_new = (1 + value) * F
-    automatic_massage(part_name) → Automatically massages the specified body part.
-
-
-### Conversation History:
-{}
-### Latest User Input:
-{}
-
-### Response:
-{}"""
-
-
-# ---------------------------
-# 3. Custom Text Streamer to capture output
-# ---------------------------
-class CapturingTextStreamer(TextStreamer):
-    def __init__(self, tokenizer, skip_prompt=True, skip_special_tokens=True):
-        super().__init__(tokenizer, skip_prompt=skip_prompt, skip_special_tokens=skip_special_tokens)
-        self.generated_text = ""
-    def on_token(self, token):
-        text = self.tokenizer.decode([token], skip_special_tokens=True)
-        print(text, end="", flush=True)
-        self.generated_text += text
-    def reset(self):
-        self.generated_text = ""
-
-# ---------------------------
-# 4. Function to trim conversation history by removing full turns from the beginning
-# ---------------------------
-def trim_history(history_list, max_context_len):
-    """
-    Given a list of conversation blocks (each block a complete "User: ...\nAssistant: ..." turn),
-    remove the earliest blocks until the total tokens (when joined) are within available_token_budget.
-    """
-    while len(history_list) > max_context_len:
-        history_list.pop(0)
-    return history_list
-
-# ---------------------------
-# 5. Create a function to interact in real time with conversation context and dynamic history trimming
+# 2. Create a function to interact in real time with conversation context and dynamic history trimming
 # ---------------------------
 def chat_loop():
     """
     Runs an interactive terminal chat session with conversation context.
     The conversation history is maintained as full turns and trimmed by removing whole turns
-    if the input token count exceeds the set limit.
+    if the prompt would leave less than max_new_tokens of the max_seq_length window.
     Type 'exit' or 'quit' to stop.
     """
-    # We'll maintain conversation history as a list of strings, where each entry is:
+    # We'll maintain conversation history as a list of turns (with their token counts), where each entry is:
     # "User: {user_text}\nAssistant: {assistant_response}"
-    conversation_history = []
+    conversation_history = ConversationHistory(tokenizer)
+    preamble_tokens = len(tokenizer(context_preamble).input_ids)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    prefix_cache = PrefixCache(model, tokenizer, context_preamble, device) if use_prefix_cache else None
+    session = ChatSession(prefix_cache) if prefix_cache is not None and use_session_cache else None
+    grammar = PipelineGrammar(layout="lines")
+    grammar_index = None
+    grammar_processor = None
+    if use_grammar_constraints:
+        print("Indexing the vocabulary for grammar-constrained decoding...")
+        grammar_index = GrammarTokenIndex(tokenizer, grammar)
+        grammar_processor = PipelineGrammarLogitsProcessor(grammar_index, tokenizer.eos_token_id)
+    executor = None
+    if use_streaming_executor:
+        perception = SimulatedPerception()
+        robot = LoggingRobot(perception)
+        detection_cache = None
+        if use_detection_cache:
+            detection_cache = DetectionCache(robot.detect_body_parts, ttl=detection_cache_ttl)
+            perception.on_movement(detection_cache.invalidate)
+        executor = PipelineExecutor(robot, detection_cache)
+    optimizer = None
+    if executor is not None and use_pipeline_optimizer:
+        optimizer = StreamingOptimizer(executor.submit)
+    # Where parsed commands go: through the optimizer, straight to the executor, or nowhere
+    submit = optimizer.feed if optimizer is not None else executor.submit if executor is not None else None
+    response_cache = ResponseCache(path=response_cache_path) if use_response_cache else None
+    rule_parser = RuleBasedParser() if use_rule_parser else None
+    semantic_cache = None
+    if use_semantic_cache:
+        print("Building the semantic cache index...")
+        semantic_cache = SemanticCache(SentenceEncoder(), threshold=semantic_cache_threshold)
+        if semantic_cache_seed is not None and os.path.exists(semantic_cache_seed):
+            semantic_cache.seed_from_dataset(semantic_cache_seed, layout=grammar.layout)
+        elif semantic_cache_seed is not None:
+            print(f"{semantic_cache_seed} not found (run create_context_dataset.py); starting with an empty index.")
     
     print("Massage Assistant Terminal with Context and History Trimming.\nType 'exit' to quit.\n")
     
@@ -106,38 +116,156 @@ def chat_loop():
             break
 
         # Generate the prompt:
-        # First, trim the history if needed
-        history_text = trim_history(conversation_history, max_context_len=3)
-        prompt = train_prompt_style_context.format(history_text, user_input, "")
-        
-        # Tokenize the prompt and move to GPU if available
-        inputs = tokenizer([prompt], return_tensors="pt")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        inputs = inputs.to(device)
+        # First, trim the history so the prompt plus the response fits into max_seq_length
+        token_budget = history_token_budget(conversation_history, user_input, preamble_tokens, max_seq_length, max_new_tokens)
+        history_text = trim_history(conversation_history, token_budget)
+
+        # Answer without the model if the input is plain templated phrasing or a repeated turn
+        start = time.perf_counter()
+        fast_response, source = None, None
+        if rule_parser is not None:
+            fast_response, source = rule_parser.respond(user_input), "rule parser"
+        if fast_response is None and response_cache is not None:
+            fast_response, source = response_cache.get(history_text, user_input), "response cache"
+        if fast_response is None and semantic_cache is not None:
+            fast_response, similarity = semantic_cache.lookup(user_input, history_text)
+            source = f"semantic cache, similarity {similarity:.3f}"
+        lookup_time = time.perf_counter() - start
+        if fast_response is not None:
+            print("\nAssistant: " + fast_response + "\n")
+            if executor is not None:
+                for command in parse_pipeline(fast_response):
+                    submit(command)
+                if optimizer is not None:
+                    optimizer.flush()
+                    print(f"[optimizer] {report(optimizer.plan)}")
+                    optimizer.reset()
+                executor.wait()
+                executor.reset()
+            print(f"[{source}] answered in {lookup_time * 1e6:.0f} us")
+            if source == "response cache":
+                stats = response_cache.stats()
+                print(f"[response cache] {stats['hits']} hits, {stats['misses']} misses")
+            elif semantic_cache is not None and source.startswith("semantic cache"):
+                stats = semantic_cache.stats()
+                print(f"[semantic cache] hit rate {stats['hit_rate']:.0%}, mean lookup {stats['mean_lookup_ms']:.1f} ms, "
+                      f"{stats['size']} entries in {stats['index_mb']:.1f} MB")
+            conversation_history.append("User: " + user_input + "\n" + "Assistant: " + fast_response)
+            continue
+
+        if session is not None:
+            # Reuse the cache of everything shared with the previous turn's prompt + response
+            suffix = context_suffix_template.format(history_text, user_input, "")
+            input_ids, attention_mask, past_key_values = session.build_inputs(suffix)
+        elif prefix_cache is not None:
+            # Only the suffix is tokenized; the preamble tokens come from the cache
+            suffix = context_suffix_template.format(history_text, user_input, "")
+            input_ids, attention_mask, past_key_values = prefix_cache.build_inputs(suffix)
+        else:
+            # Tokenize the prompt and move to GPU if available
+            prompt = train_prompt_style_context.format(history_text, user_input, "")
+            inputs = tokenizer([prompt], return_tensors="pt").to(device)
+            input_ids, attention_mask, past_key_values = inputs.input_ids, inputs.attention_mask, None
         
-        # Create our custom streamer
-        text_streamer = CapturingTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        # Create our custom streamer; completed pipeline lines go straight to the executor
+        parser = IncrementalPipelineParser(submit) if submit is not None else None
+        text_streamer = CapturingTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                              on_text=parser.feed if parser is not None else None)
+        stopping_criteria = None
+        if use_structural_stop:
+            stopping_criteria = PipelineStoppingCriteria(tokenizer, input_ids.shape[1], user_input, grammar)
         
         print("\nAssistant: ", end="", flush=True)
         
         # Generate and stream output (the response part)
-        _ = model.generate(
-            input_ids=inputs.input_ids,
-            attention_mask=inputs.attention_mask,
-            streamer=text_streamer,
-            max_new_tokens=150,
-            pad_token_id=tokenizer.eos_token_id
-        )
+        generation_start = time.perf_counter()
+        if use_prompt_lookup:
+            outputs = speculative_generate(
+                model, input_ids, attention_mask,
+                past_key_values=past_key_values,
+                streamer=text_streamer,
+                max_new_tokens=max_new_tokens,
+                stopping_criteria=stopping_criteria,
+                eos_token_id=tokenizer.eos_token_id,
+                grammar_index=grammar_index
+            )
+        elif grammar_processor is not None:
+            outputs = constrained_generate(
+                model, input_ids, attention_mask, grammar_processor,
+                past_key_values=past_key_values,
+                streamer=text_streamer,
+                max_new_tokens=max_new_tokens,
+                stopping_criteria=stopping_criteria
+            )
+        else:
+            outputs = model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                streamer=text_streamer,
+                max_new_tokens=max_new_tokens,
+                stopping_criteria=StoppingCriteriaList([stopping_criteria]) if stopping_criteria is not None else None,
+                pad_token_id=tokenizer.eos_token_id,
+                return_dict_in_generate=True
+            )
+        generation_time = time.perf_counter() - generation_start
+        num_new_tokens = outputs.sequences.shape[1] - input_ids.shape[1]
         
         generated_response = text_streamer.generated_text.strip()
         print("\n")
+        if stopping_criteria is not None:
+            generated_response = stopping_criteria.clean(generated_response)
+            if stopping_criteria.reason is not None:
+                print(f"[stop] ended early on {stopping_criteria.reason}")
+        if optimizer is not None:
+            optimizer.flush()
+            print(f"[optimizer] {report(optimizer.plan)}")
+            optimizer.reset()
+        elif use_pipeline_optimizer:
+            print(f"[optimizer] {report(compile_pipeline(generated_response))}")
+        if executor is not None:
+            executor.wait()
+            print(f"[executor] ran {len(executor.timings)} of {len(parser.commands)} streamed commands")
+            if executor.detection_cache is not None:
+                stats = executor.detection_cache.stats()
+                print(f"[detection cache] {stats['hits']} hits, {stats['misses']} misses, "
+                      f"{stats['perception_calls']} perception calls, {stats['invalidations']} invalidations")
+            executor.reset()
+        # Wall clock including prefill; compare runs with use_prompt_lookup on and off, since
+        # tokens per forward pass ignores that verifying a draft costs more than one decode step
+        print(f"[timing] {num_new_tokens} tokens in {generation_time * 1000:.0f} ms "
+              f"({num_new_tokens / max(generation_time, 1e-9):.1f} tokens/s)")
+        if use_prompt_lookup:
+            print(f"[lookup] drafted {outputs.num_drafted}, accepted {outputs.num_accepted} "
+                  f"({outputs.acceptance_rate:.0%}); {num_new_tokens} tokens in {outputs.num_forward_passes} "
+                  f"forward passes ({num_new_tokens / max(outputs.num_forward_passes, 1):.2f} tokens/forward pass), "
+                  f"{outputs.num_forced_tokens} forced")
+        elif grammar_processor is not None:
+            print(f"[grammar] {num_new_tokens} tokens in {outputs.num_forward_passes} forward passes "
+                  f"({outputs.num_forced_tokens} forced)")
+        if session is not None:
+            session.update(outputs)
+            print(f"[session cache] reused {session.last_reused} cached tokens, "
+                  f"prefilled {session.last_prefilled} new tokens")
+        elif prefix_cache is not None:
+            print(f"[prefix cache] saved {prefix_cache.num_tokens} prefill tokens, "
+                  f"prefilled {input_ids.shape[1] - prefix_cache.num_tokens} new tokens")
         
+        # Only complete, valid pipelines are worth replaying
+        if grammar.step(grammar.start, generated_response) in grammar.accepting:
+            if response_cache is not None:
+                response_cache.put(history_text, user_input, generated_response)
+                if response_cache_path is not None:
+                    response_cache.save()
+            if semantic_cache is not None:
+                semantic_cache.add(user_input, generated_response, history_text)
+
         # Append the new turn as a full block to conversation history
         new_turn = "User: " + user_input + "\n" + "Assistant: " + generated_response
         conversation_history.append(new_turn)
 
 # ---------------------------
-# 6. Run the chat loop if executed directly
+# 3. Run the chat loop if executed directly
 # ---------------------------
 if __name__ == "__main__":
     chat_loop()
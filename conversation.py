@@ -0,0 +1,129 @@
+# Prompt templates and conversation history shared by the chat scripts, the server and the evaluation.
+# Importing this module does not load a model.
+
+# ---------------------------
+# 1. Define prompt style with context
+# ---------------------------
+train_prompt_style_context = """Below is a conversation that provides instructions for operating a massage robot. The conversation history provides context to help generate an executable Python pipeline using only the provided functions.
+Before answering, carefully consider the conversation history to infer any missing actions.
+
+### Instruction:
+You are provided with high-level instructions for operating a massage robot. Create an executable pipeline in Python that structures task execution through a sub-task pipeline. This pipeline should be composed exclusively of the functions listed below in the Capabilities section, arranged in a logical and correct order so that it can be directly executed. Your response should only consist of the pipeline without additional information.
+
+Capabilities:
+    start() → Initializes the robot.
+    stop() → Stops the robot.
+    home() → Moves the robot to the home position.
+    [x, y, z] = detect_body_part(part_name) → Detects the specified body part and returns the coordinates.
+    move_to([x, y, z]) → Moves the robot to the specified coordinates.
+    change_force(mode, value) → Adjusts the massage force based on the specified mode:
+        - If mode is 'absolute', then value is any real number, setting the force directly.
+        - If mode is 'relative', then value is between -1 and 1, modifying the current force F as:
+          F_new = (1 + value) * F
+    automatic_massage(part_name) → Automatically massages the specified body part.
+
+
+### Conversation History:
+{}
+### Latest User Input:
+{}
+
+### Response:
+{}"""
+
+# Everything before the first placeholder (instructions + Capabilities) never changes between turns.
+context_preamble, context_suffix_template = train_prompt_style_context.split("{}", 1)
+context_suffix_template = "{}" + context_suffix_template
+
+# The single-turn template of the v1 model (real_time_chat.py, datasets/massage_robot_dataset_v2.json)
+train_prompt_style = """Below is an instruction that describes a task for a massage robot, paired with an input that provides further context.
+Write a response that generates an executable pipeline in Python using only the provided functions.
+Before answering, analyze the task carefully and generate a clear sequence of commands.
+
+### Instruction:
+You are provided with high-level instructions for operating a massage robot. Create an executable pipeline in Python that structures task execution through a sub-task pipeline. This pipeline should be composed exclusively of the functions listed below in the Capabilities section, arranged in a logical and correct order so that it can be directly executed. Your response should only consist of the pipeline without additional information.
+
+Capabilities:
+    start() → Initializes the robot.
+    stop() → Stops the robot.
+    home() → Moves the robot to the home position.
+    [x, y, z] = detect_body_part(part_name) → Detects the specified body part and returns the coordinates.
+    move_to([x, y, z]) → Moves the robot to the specified coordinates.
+    change_force(mode, value) → Adjusts the massage force based on the specified mode:
+        - If mode is 'absolute', then value is any real number, setting the force directly.
+        - If mode is 'relative', then value is between -1 and 1, modifying the current force F as:
+          F_new = (1 + value) * F
+    automatic_massage(part_name) → Automatically massages the specified body part.
+
+### Question:
+{}
+
+### Response:
+{}"""
+
+v1_preamble, v1_suffix_template = train_prompt_style.split("{}", 1)
+v1_suffix_template = "{}" + v1_suffix_template
+
+# Template name -> (preamble, suffix template, response layout of pipeline_grammar.PipelineGrammar).
+# The context suffix is formatted with (history, latest input, response), the single-turn v1 one with (input, response).
+PROMPT_TEMPLATES = {
+    "context": (context_preamble, context_suffix_template, "lines"),
+    "v1": (v1_preamble, v1_suffix_template, "python_list"),
+}
+
+# ---------------------------
+# 2. Conversation history with cached token counts and token-budget trimming
+# ---------------------------
+class ConversationHistory:
+    """
+    Complete "User: ...\nAssistant: ..." turns, each tokenized exactly once when appended.
+    The cached counts make trimming pure integer arithmetic over the turns.
+    """
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.turns = []
+        self.token_counts = []
+        self.total_tokens = 0
+        # Turns are joined with "\n" (as in create_context_dataset.py)
+        self.separator_tokens = self.count_tokens("\n")
+
+    def count_tokens(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def append(self, turn):
+        count = self.count_tokens(turn)
+        self.turns.append(turn)
+        self.token_counts.append(count)
+        self.total_tokens += count
+
+    def pop_oldest(self):
+        self.turns.pop(0)
+        self.total_tokens -= self.token_counts.pop(0)
+
+    def num_tokens(self):
+        """Token count of the joined history, including the separators between turns."""
+        return self.total_tokens + self.separator_tokens * max(len(self.turns) - 1, 0)
+
+    def text(self):
+        return "\n".join(self.turns)
+
+# ---------------------------
+# 3. Function to trim conversation history by removing full turns from the beginning
+# ---------------------------
+def trim_history(history, token_budget):
+    """
+    Given a ConversationHistory of complete "User: ...\nAssistant: ..." turns,
+    remove the earliest turns until the joined history fits within token_budget.
+    Returns the history text to put into the prompt.
+    """
+    while history.turns and history.num_tokens() > token_budget:
+        history.pop_oldest()
+    return history.text()
+
+def history_token_budget(history, user_input, preamble_tokens, max_seq_length, max_new_tokens):
+    """
+    Tokens left for the conversation history once the preamble, the latest-input section and
+    the response (max_new_tokens) are accounted for within max_seq_length.
+    """
+    input_section_tokens = history.count_tokens(context_suffix_template.format("", user_input, ""))
+    return max_seq_length - max_new_tokens - preamble_tokens - input_section_tokens
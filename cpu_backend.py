@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from conversation import PROMPT_TEMPLATES, ConversationHistory, trim_history, history_token_budget
+from response_cache import ResponseCache
+from rule_parser import RuleBasedParser
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# CPU inference for the fine-tuned LoRA models without unsloth, bitsandbytes or CUDA:
+# merge the adapter into its base model once, convert the result to a quantized GGUF file
+# with llama.cpp, then serve that file (memory-mapped) with llama-cpp-python.
+
+# ---------------------------
+# 1. One-time export: LoRA -> merged model -> quantized GGUF
+# ---------------------------
+QUANTIZATIONS = {"q8_0": "Q8_0", "q4_k_m": "Q4_K_M", "q4_0": "Q4_0"}
+
+def full_precision_base(base_model_name):
+    """unsloth publishes 4-bit bases as "<name>-bnb-4bit"; merging on CPU needs the full-precision weights."""
+    return base_model_name[:-len("-bnb-4bit")] if base_model_name.endswith("-bnb-4bit") else base_model_name
+
+def merge_lora(lora_name, merged_dir, base_model_name=None):
+    """Loads the base model in float16 on the CPU, merges the adapter into it and saves it as safetensors."""
+    import torch
+    from peft import PeftConfig, PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    base_model_name = base_model_name or full_precision_base(PeftConfig.from_pretrained(lora_name).base_model_name_or_path)
+    print(f"Merging {lora_name} into {base_model_name}...")
+    base = AutoModelForCausalLM.from_pretrained(base_model_name, torch_dtype=torch.float16, device_map="cpu")
+    model = PeftModel.from_pretrained(base, lora_name).merge_and_unload()
+    model.save_pretrained(merged_dir, safe_serialization=True)
+    AutoTokenizer.from_pretrained(lora_name).save_pretrained(merged_dir)
+
+def export_gguf(lora_name, output_dir="cpu_models", quantization="q4_k_m", base_model_name=None,
+                llama_cpp_dir=None):
+    """
+    Returns the path of the quantized GGUF file for lora_name, creating it on first use.
+    llama_cpp_dir (or $LLAMA_CPP_DIR) is a llama.cpp checkout providing convert_hf_to_gguf.py
+    and, for the k-quants, a built llama-quantize.
+    """
+    name = lora_name.rstrip("/").split("/")[-1]
+    gguf_path = os.path.join(output_dir, f"{name}-{quantization}.gguf")
+    if os.path.exists(gguf_path):
+        return gguf_path
+
+    llama_cpp_dir = llama_cpp_dir or os.environ.get("LLAMA_CPP_DIR", "llama.cpp")
+    merged_dir = os.path.join(output_dir, f"{name}-merged")
+    os.makedirs(output_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(merged_dir, "config.json")):
+        merge_lora(lora_name, merged_dir, base_model_name)
+
+    convert = [sys.executable, os.path.join(llama_cpp_dir, "convert_hf_to_gguf.py"), merged_dir]
+    if quantization == "q8_0":
+        # The converter writes q8_0 directly
+        subprocess.run(convert + ["--outfile", gguf_path, "--outtype", "q8_0"], check=True)
+    else:
+        f16_path = os.path.join(output_dir, f"{name}-f16.gguf")
+        if not os.path.exists(f16_path):
+            subprocess.run(convert + ["--outfile", f16_path, "--outtype", "f16"], check=True)
+        quantize = os.path.join(llama_cpp_dir, "build", "bin", "llama-quantize")
+        subprocess.run([quantize, f16_path, gguf_path, QUANTIZATIONS[quantization]], check=True)
+    return gguf_path
+
+# ---------------------------
+# 2. Loading and thread tuning
+# ---------------------------
+def available_cpus():
+    """Logical CPUs this process may run on (its affinity mask, where the OS has one)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def logical_cores():
+    return len(available_cpus())
+
+def physical_cores():
+    """
+    Physical cores among the available CPUs; SMT siblings share the FPUs, so decoding uses one
+    thread per core. Read from the sysfs topology where it exists, else from psutil (clamped to
+    the affinity mask); without either, every logical CPU counts as a core.
+    """
+    cpus = available_cpus()
+    try:
+        cores = set()
+        for cpu in cpus:
+            topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+            with open(f"{topology}/physical_package_id") as f, open(f"{topology}/core_id") as g:
+                cores.add((f.read().strip(), g.read().strip()))
+        return max(len(cores), 1)
+    except OSError:
+        pass
+    if psutil is not None and psutil.cpu_count(logical=False):
+        return min(psutil.cpu_count(logical=False), len(cpus))
+    return len(cpus)
+
+def load_cpu_model(gguf_path, n_ctx=2048, n_threads=None, n_threads_batch=None):
+    """
+    Memory-maps the GGUF file, so loads after the first are mostly page-cache hits.
+    Decoding is memory-bound and gets one thread per physical core; prefill is compute-bound
+    and uses every logical core the process may run on.
+    """
+    from llama_cpp import Llama
+    return Llama(
+        model_path=gguf_path,
+        n_ctx=n_ctx,
+        n_threads=n_threads or physical_cores(),
+        n_threads_batch=n_threads_batch or logical_cores(),
+        use_mmap=True,
+        verbose=False,
+    )
+
+def tune_threads(gguf_path, prompt, candidates=None, n_ctx=2048, max_new_tokens=32):
+    """Measures decode tokens/s for each thread count and returns the fastest."""
+    candidates = candidates or sorted({1, 2, 4, physical_cores(), logical_cores()})
+    best, best_rate = None, 0.0
+    for n_threads in candidates:
+        llm = load_cpu_model(gguf_path, n_ctx, n_threads=n_threads)
+        result = CpuChatModel(llm).generate(prompt, max_new_tokens)
+        print(f"  n_threads={n_threads:<3} {result['tokens_per_second']:.1f} tokens/s")
+        if result["tokens_per_second"] > best_rate:
+            best, best_rate = n_threads, result["tokens_per_second"]
+        del llm
+    return best
+
+# ---------------------------
+# 3. Generation
+# ---------------------------
+class CpuChatModel:
+    """
+    Greedy streaming generation with the same structural stop as PipelineStoppingCriteria for the
+    "lines" layout (a blank line or a section marker). llama.cpp keeps the KV cache of the previous
+    prompt and only evaluates the tokens after the common prefix, so the long instruction preamble
+    is prefilled once per session.
+    """
+    stop = ["\n\n", "###"]
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def stream(self, prompt, max_new_tokens=150):
+        for chunk in self.llm(prompt, max_tokens=max_new_tokens, temperature=0.0, top_k=1,
+                              stop=self.stop, stream=True):
+            yield chunk["choices"][0]["text"]
+
+    def generate(self, prompt, max_new_tokens=150, on_text=None):
+        """Returns the response text with TTFT and decode throughput."""
+        start = time.perf_counter()
+        first_token_time = None
+        chunks = []
+        for text in self.stream(prompt, max_new_tokens):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            chunks.append(text)
+            if on_text is not None:
+                on_text(text)
+        end = time.perf_counter()
+        text = "".join(chunks)
+        num_tokens = len(self.llm.tokenize(text.encode("utf-8"), add_bos=False)) if text else 0
+        first_token_time = first_token_time or end
+        decode_time = end - first_token_time
+        return {
+            "text": text.strip(),
+            "ttft": first_token_time - start,
+            "num_tokens": num_tokens,
+            "tokens_per_second": (num_tokens - 1) / decode_time if num_tokens > 1 and decode_time > 0 else 0.0,
+        }
+
+# ---------------------------
+# 4. Terminal chat
+# ---------------------------
+class LlamaTokenizerAdapter:
+    """The tokenizer(text, add_special_tokens=False).input_ids interface ConversationHistory expects."""
+    class Encoding:
+        def __init__(self, input_ids):
+            self.input_ids = input_ids
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __call__(self, text, add_special_tokens=True):
+        return self.Encoding(self.llm.tokenize(text.encode("utf-8"), add_bos=add_special_tokens))
+
+def template_for_model(model_name):
+    """Prompt template a LoRA was trained on, from its name: the context LoRAs and the single-turn v1 ones."""
+    return "context" if "context" in model_name.lower() else "v1"
+
+def build_prompt(template, history_text, user_input):
+    """The full prompt; the v1 template is single-turn and ignores history_text."""
+    preamble, suffix_template, _ = PROMPT_TEMPLATES[template]
+    if template == "context":
+        return preamble + suffix_template.format(history_text, user_input, "")
+    return preamble + suffix_template.format(user_input, "")
+
+def chat_loop(model, max_seq_length=2048, max_new_tokens=150, template="context"):
+    from pipeline_grammar import PipelineGrammar
+
+    preamble, _, layout = PROMPT_TEMPLATES[template]
+    grammar = PipelineGrammar(layout=layout)
+    tokenizer = LlamaTokenizerAdapter(model.llm)
+    conversation_history = ConversationHistory(tokenizer)
+    preamble_tokens = len(tokenizer(preamble).input_ids)
+    rule_parser = RuleBasedParser()
+    response_cache = ResponseCache()
+
+    print(f"Massage Assistant Terminal (CPU, {template} template).\nType 'exit' to quit.\n")
+    while True:
+        try:
+            user_input = input("\nUser: ")
+        except (KeyboardInterrupt, EOFError):
+            print("\nExiting conversation.")
+            break
+        if user_input.strip().lower() in ["exit", "quit"]:
+            print("Goodbye!")
+            break
+
+        if template == "context":
+            token_budget = history_token_budget(conversation_history, user_input, preamble_tokens, max_seq_length, max_new_tokens)
+            history_text = trim_history(conversation_history, token_budget)
+        else:
+            history_text = ""  # single-turn template
+
+        response = rule_parser.respond(user_input, layout=layout) or response_cache.get(history_text, user_input)
+        if response is not None:
+            print("\nAssistant: " + response)
+        else:
+            print("\nAssistant: ", end="", flush=True)
+            result = model.generate(build_prompt(template, history_text, user_input), max_new_tokens,
+                                    on_text=lambda text: print(text, end="", flush=True))
+            response = result["text"]
+            print(f"\n\n[cpu] TTFT {result['ttft'] * 1000:.0f} ms, {result['tokens_per_second']:.1f} tokens/s")
+            if grammar.step(grammar.start, response) in grammar.accepting:
+                response_cache.put(history_text, user_input, response)
+        conversation_history.append("User: " + user_input + "\n" + "Assistant: " + response)
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized CPU inference for the fine-tuned LoRA models.")
+    parser.add_argument("--model", default="novak247/massage_assistant_context_lora", help="LoRA adapter name or path")
+    parser.add_argument("--template", default=None, choices=sorted(PROMPT_TEMPLATES),
+                        help="Prompt template --model was trained on (default: context if its name says so, else v1)")
+    parser.add_argument("--base_model", default=None, help="Full-precision base model (default: from the adapter config)")
+    parser.add_argument("--quantization", default="q4_k_m", choices=sorted(QUANTIZATIONS))
+    parser.add_argument("--output_dir", default="cpu_models", help="Where the merged model and GGUF files are kept")
+    parser.add_argument("--llama_cpp_dir", default=None, help="llama.cpp checkout (default: $LLAMA_CPP_DIR or ./llama.cpp)")
+    parser.add_argument("--threads", default=None, type=int, help="Decode threads (default: physical cores)")
+    parser.add_argument("--tune_threads", action="store_true", help="Pick the fastest decode thread count first")
+    parser.add_argument("--export_only", action="store_true", help="Create the GGUF file and exit")
+    parser.add_argument("--max_seq_length", default=2048, type=int)
+    parser.add_argument("--max_new_tokens", default=150, type=int)
+    args = parser.parse_args()
+
+    gguf_path = export_gguf(args.model, args.output_dir, args.quantization, args.base_model, args.llama_cpp_dir)
+    print(f"Model file: {gguf_path}")
+    if args.export_only:
+        return
+    template = args.template or template_for_model(args.model)
+    threads = args.threads
+    if args.tune_threads:
+        print("Tuning decode threads...")
+        threads = tune_threads(gguf_path, build_prompt(template, "", "Start the massage robot"),
+                               n_ctx=args.max_seq_length)
+        print(f"Using {threads} decode threads")
+    llm = load_cpu_model(gguf_path, args.max_seq_length, n_threads=threads)
+    chat_loop(CpuChatModel(llm), args.max_seq_length, args.max_new_tokens, template)
+
+if __name__ == "__main__":
+    main()
@@ -15,17 +15,18 @@ def maybe_add_ending(text):
     else:
         return text
 
+noise_phrases = [
+    " and also check the battery level",
+    " and then report the temperature",
+    " and verify the system status",
+    " and log the current time",
+    " and update diagnostics"
+]
+
 def maybe_append_noise(text):
     """
     With a 30% chance, appends an extra, unsupported command (noise) to the text.
     """
-    noise_phrases = [
-        " and also check the battery level",
-        " and then report the temperature",
-        " and verify the system status",
-        " and log the current time",
-        " and update diagnostics"
-    ]
     if random.random() < 0.3:
         noise = random.choice(noise_phrases)
         text += noise
@@ -34,11 +35,13 @@ def maybe_append_noise(text):
 def random_coordinates():
     return [random.randint(-20, 20), random.randint(-20, 20), random.randint(-20, 20)]
 
+body_parts = [
+    "lower back", "shoulders", "neck", "arms", "legs", "head",
+    "chest", "stomach", "hips", "knees", "elbows", "wrists", "feet", "calves", "forearms"
+]
+
 def random_body_part():
-    return random.choice([
-        "lower back", "shoulders", "neck", "arms", "legs", "head",
-        "chest", "stomach", "hips", "knees", "elbows", "wrists", "feet", "calves", "forearms"
-    ])
+    return random.choice(body_parts)
 
 def randomize_case(text):
     """
@@ -61,18 +64,64 @@ set_synonyms = ["Set", "Adjust", "Configure", "Establish"]
 force_nouns = ["massage intensity", "massage pressure", "force level"]
 auto_massage_synonyms = ["Start automatic massage", "Begin auto massage", "Initiate automatic massage", "Activate auto massage"]
 
+# ------------------------------
+# Templates
+# ------------------------------
+robot_templates = [
+    "{syn} the massage robot",
+    "Could you {syn_lower} the massage robot",
+    "Please {syn_lower} the massage robot",
+    "I would like you to {syn_lower} the massage robot"
+]
+home_templates = [
+    "{syn}",
+    "Please {syn_lower}",
+    "Could you {syn_lower}"
+]
+detect_templates = [
+    "{syn} my {bp}",
+    "Can you {syn_lower} my {bp}?",
+    "Please {syn_lower} my {bp}",
+    "I need you to {syn_lower} my {bp}"
+]
+move_body_part_templates = [
+    "{syn} to my {bp}",
+    "Could you {syn_lower} to my {bp}?",
+    "Please {syn_lower} to my {bp}",
+    "I need you to {syn_lower} to my {bp}"
+]
+move_coords_templates = [
+    "{syn} {coords}",
+    "Could you {syn_lower} {coords}?",
+    "Please {syn_lower} {coords}",
+    "I need you to {syn_lower} {coords}"
+]
+force_relative_templates = [
+    "{verb} {noun} by {perc}%",
+    "Could you {verb_lower} {noun} by {perc}%",
+    "Please {verb_lower} {noun} by {perc}%",
+    "I would like you to {verb_lower} {noun} by {perc}%"
+]
+force_absolute_templates = [
+    "{verb} {noun} to {perc}%",
+    "Could you {verb_lower} {noun} to {perc}%",
+    "Please {verb_lower} {noun} to {perc}%",
+    "I want you to {verb_lower} {noun} to {perc}%"
+]
+auto_massage_templates = [
+    "{syn} for my {bp}",
+    "Could you {syn_lower} for my {bp}?",
+    "Please {syn_lower} for my {bp}",
+    "I would like you to {syn_lower} for my {bp}"
+]
+
 # ------------------------------
 # Command Generator Functions
 # Each returns a tuple: (instruction_text, pipeline_steps_list)
 # ------------------------------
 def cmd_start():
     syn = random.choice(start_synonyms)
-    templates = [
-        "{syn} the massage robot",
-        "Could you {syn_lower} the massage robot",
-        "Please {syn_lower} the massage robot",
-        "I would like you to {syn_lower} the massage robot"
-    ]
+    templates = robot_templates
     text = random.choice(templates).format(syn=syn, syn_lower=syn.lower())
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -81,12 +130,7 @@ def cmd_start():
 
 def cmd_stop():
     syn = random.choice(stop_synonyms)
-    templates = [
-        "{syn} the massage robot",
-        "Could you {syn_lower} the massage robot",
-        "Please {syn_lower} the massage robot",
-        "I would like you to {syn_lower} the massage robot"
-    ]
+    templates = robot_templates
     text = random.choice(templates).format(syn=syn, syn_lower=syn.lower())
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -95,11 +139,7 @@ def cmd_stop():
 
 def cmd_home():
     syn = random.choice(home_synonyms)
-    templates = [
-        "{syn}",
-        "Please {syn_lower}",
-        "Could you {syn_lower}"
-    ]
+    templates = home_templates
     text = random.choice(templates).format(syn=syn, syn_lower=syn.lower())
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -110,12 +150,7 @@ def cmd_detect():
     bp = random_body_part()
     bp_variant = randomize_case(bp)
     syn = random.choice(detect_synonyms)
-    templates = [
-        "{syn} my {bp}",
-        "Can you {syn_lower} my {bp}?",
-        "Please {syn_lower} my {bp}",
-        "I need you to {syn_lower} my {bp}"
-    ]
+    templates = detect_templates
     text = random.choice(templates).format(syn=syn, syn_lower=syn.lower(), bp=bp_variant)
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -128,12 +163,7 @@ def cmd_move():
         bp = random_body_part()
         bp_variant = randomize_case(bp)
         syn = random.choice(move_synonyms)
-        templates = [
-            "{syn} to my {bp}",
-            "Could you {syn_lower} to my {bp}?",
-            "Please {syn_lower} to my {bp}",
-            "I need you to {syn_lower} to my {bp}"
-        ]
+        templates = move_body_part_templates
         text = random.choice(templates).format(syn=syn, syn_lower=syn.lower(), bp=bp_variant)
         text = maybe_add_ending(text)
         text = maybe_append_noise(text)
@@ -142,12 +172,7 @@ def cmd_move():
     else:
         coords = random_coordinates()
         syn = random.choice(move_synonyms)
-        templates = [
-            "{syn} {coords}",
-            "Could you {syn_lower} {coords}?",
-            "Please {syn_lower} {coords}",
-            "I need you to {syn_lower} {coords}"
-        ]
+        templates = move_coords_templates
         text = random.choice(templates).format(syn=syn, syn_lower=syn.lower(), coords=coords)
         text = maybe_add_ending(text)
         text = maybe_append_noise(text)
@@ -163,12 +188,7 @@ def cmd_change_force_relative():
         verb = random.choice(increase_synonyms)
         value = percentage / 100.0
     noun = random.choice(force_nouns)
-    templates = [
-        "{verb} {noun} by {perc}%",
-        "Could you {verb_lower} {noun} by {perc}%",
-        "Please {verb_lower} {noun} by {perc}%",
-        "I would like you to {verb_lower} {noun} by {perc}%"
-    ]
+    templates = force_relative_templates
     text = random.choice(templates).format(verb=verb, verb_lower=verb.lower(), noun=noun, perc=percentage)
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -180,12 +200,7 @@ def cmd_change_force_absolute():
     percentage = int(value * 100)
     verb = random.choice(set_synonyms)
     noun = random.choice(force_nouns)
-    templates = [
-        "{verb} {noun} to {perc}%",
-        "Could you {verb_lower} {noun} to {perc}%",
-        "Please {verb_lower} {noun} to {perc}%",
-        "I want you to {verb_lower} {noun} to {perc}%"
-    ]
+    templates = force_absolute_templates
     text = random.choice(templates).format(verb=verb, verb_lower=verb.lower(), noun=noun, perc=percentage)
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -196,12 +211,7 @@ def cmd_automatic_massage():
     bp = random_body_part()
     bp_variant = randomize_case(bp)
     syn = random.choice(auto_massage_synonyms)
-    templates = [
-        "{syn} for my {bp}",
-        "Could you {syn_lower} for my {bp}?",
-        "Please {syn_lower} for my {bp}",
-        "I would like you to {syn_lower} for my {bp}"
-    ]
+    templates = auto_massage_templates
     text = random.choice(templates).format(syn=syn, syn_lower=syn.lower(), bp=bp_variant)
     text = maybe_add_ending(text)
     text = maybe_append_noise(text)
@@ -240,38 +250,42 @@ def generate_command_sequence():
 # ------------------------------
 # Dataset Generation
 # ------------------------------
-num_samples = 5000
-dataset = []
+def main():
+    num_samples = 5000
+    dataset = []
+
+    instruction_prompt = (
+        "You are provided with high-level instructions for operating a massage robot. "
+        "Create an executable plan in Python that structures task execution through a sub-task pipeline. "
+        "This pipeline should be composed exclusively of the functions listed below in the Capabilities section, "
+        "arranged in a logical and correct order so that it can be directly executed. "
+        "Your response should only consist of the pipeline without additional information.\n\n"
+        "Capabilities:\n"
+        "    start() → Initializes the robot.\n"
+        "    stop() → Stops the robot.\n"
+        "    home() → Moves the robot to the home position.\n"
+        "    [x, y, z] = detect_body_part(part_name) → Detects the specified body part and returns the coordinates.\n"
+        "    move_to([x, y, z]) → Moves the robot to the specified coordinates.\n"
+        "    change_force(mode, value) → Adjusts the massage force based on the specified mode:\n"
+        "        - If mode is 'absolute', then value is any real number, setting the force directly.\n"
+        "        - If mode is 'relative', then value is between -1 and 1, modifying the current force F as:\n"
+        "          F_new = (1 + value) * F\n"
+        "    automatic_massage(part_name) → Automatically massages the specified body part.\n"
+    )
 
-instruction_prompt = (
-    "You are provided with high-level instructions for operating a massage robot. "
-    "Create an executable plan in Python that structures task execution through a sub-task pipeline. "
-    "This pipeline should be composed exclusively of the functions listed below in the Capabilities section, "
-    "arranged in a logical and correct order so that it can be directly executed. "
-    "Your response should only consist of the pipeline without additional information.\n\n"
-    "Capabilities:\n"
-    "    start() → Initializes the robot.\n"
-    "    stop() → Stops the robot.\n"
-    "    home() → Moves the robot to the home position.\n"
-    "    [x, y, z] = detect_body_part(part_name) → Detects the specified body part and returns the coordinates.\n"
-    "    move_to([x, y, z]) → Moves the robot to the specified coordinates.\n"
-    "    change_force(mode, value) → Adjusts the massage force based on the specified mode:\n"
-    "        - If mode is 'absolute', then value is any real number, setting the force directly.\n"
-    "        - If mode is 'relative', then value is between -1 and 1, modifying the current force F as:\n"
-    "          F_new = (1 + value) * F\n"
-    "    automatic_massage(part_name) → Automatically massages the specified body part.\n"
-)
+    for _ in range(num_samples):
+        input_text, pipeline_steps = generate_command_sequence()
+        dataset.append({
+            "instruction": instruction_prompt,
+            "input": input_text,
+            "response": pipeline_steps
+        })
 
-for _ in range(num_samples):
-    input_text, pipeline_steps = generate_command_sequence()
-    dataset.append({
-        "instruction": instruction_prompt,
-        "input": input_text,
-        "response": pipeline_steps
-    })
+    output_file = "massage_robot_dataset.json"
+    with open(output_file, "w") as f:
+        json.dump(dataset, f, indent=4)
 
-output_file = "massage_robot_dataset.json"
-with open(output_file, "w") as f:
-    json.dump(dataset, f, indent=4)
+    print(f"Dataset generated and saved to {output_file}")
 
-print(f"Dataset generated and saved to {output_file}")
+if __name__ == "__main__":
+    main()
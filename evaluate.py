@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import time
+from collections import Counter
+
+from conversation import train_prompt_style, train_prompt_style_context
+from pipeline_parser import parse_pipeline
+
+# ------------------------------
+# Samples
+# ------------------------------
+def iter_json_array(path, chunk_size=1 << 16):
+    """The elements of a file holding one JSON array, decoded one at a time while reading it in chunks."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            while True:
+                # Skip whitespace, the opening bracket and the commas between elements
+                while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ("," if started else "[")):
+                    started = True if buffer[position] == "[" else started
+                    position += 1
+                if position >= len(buffer):
+                    break
+                if buffer[position] == "]":
+                    return
+                if not started:
+                    raise ValueError(f"{path}: expected a JSON array")
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise
+                    break  # the element continues in the next chunk
+                yield element
+                position = end
+            if not chunk:
+                return
+
+def iter_samples(paths, limit=None):
+    """
+    Yields samples of datasets/massage_robot_dataset_v2.json ("input", v1 template) and of
+    create_context_dataset.py output ("latest_user_input", context template) with a stable id.
+    The files are decoded one sample at a time, so --limit does not read a whole dataset.
+    """
+    count = 0
+    for path in paths:
+        name = os.path.basename(path)
+        for i, sample in enumerate(iter_json_array(path)):
+            if "latest_user_input" in sample:
+                user_input = sample["latest_user_input"]
+                prompt = train_prompt_style_context.format(sample["conversation_history"], user_input, "")
+                layout = "lines"
+            else:
+                user_input = sample["input"]
+                prompt = train_prompt_style.format(user_input, "")
+                layout = "python_list"
+            reference = sample["response"]
+            if isinstance(reference, list):
+                reference = "\n".join(reference)
+            yield {"id": f"{name}:{i}", "prompt": prompt, "user_input": user_input,
+                   "reference": reference, "layout": layout}
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+def length_buckets(samples, count_tokens, batch_size, window=16):
+    """
+    Reads batch_size * window samples at a time, sorts them by prompt length and cuts them into
+    batches, so each batch is padded to a similar length without loading the whole file.
+    """
+    pending = []
+    for sample in samples:
+        pending.append(sample)
+        if len(pending) == batch_size * window:
+            yield from _cut(pending, count_tokens, batch_size)
+            pending = []
+    if pending:
+        yield from _cut(pending, count_tokens, batch_size)
+
+def _cut(samples, count_tokens, batch_size):
+    samples.sort(key=lambda s: count_tokens(s["prompt"]))
+    for i in range(0, len(samples), batch_size):
+        yield samples[i:i + batch_size]
+
+# ------------------------------
+# Metrics
+# ------------------------------
+def score(prediction, reference):
+    """Command-level comparison, so the line and Python-list layouts compare equal."""
+    predicted, expected = parse_pipeline(prediction), parse_pipeline(reference)
+    matched = Counter(predicted) & Counter(expected)
+    per_type = {}
+    for command, n in Counter(expected).items():
+        kind = type(command).__name__
+        total, hits = per_type.get(kind, (0, 0))
+        per_type[kind] = (total + n, hits + matched[command])
+    return {"exact": predicted == expected, "per_type": per_type}
+
+def summarize(path):
+    """Exact match and per-command-type accuracy over every result in the JSONL file."""
+    total = exact = 0
+    per_type = {}
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        try:
+            result = json.loads(line)
+        except json.JSONDecodeError:
+            if i == len(lines) - 1:
+                break  # partial last line of a killed run; evaluate() redoes that sample
+            raise
+        total += 1
+        exact += result["exact"]
+        for kind, (n, hits) in result["per_type"].items():
+            seen, correct = per_type.get(kind, (0, 0))
+            per_type[kind] = (seen + n, correct + hits)
+    return total, exact, per_type
+
+# ------------------------------
+# Backends
+# ------------------------------
+class TransformersBackend:
+    """Batched greedy generation; one structural stopping criterion per row."""
+    def __init__(self, model, tokenizer):
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+        from pipeline_grammar import PipelineGrammar
+        from pipeline_stopping import PipelineStoppingCriteria
+        self.torch = torch
+        self.model = model
+        self.tokenizer = tokenizer
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.StoppingCriteriaList = StoppingCriteriaList
+        self.grammars = {layout: PipelineGrammar(layout=layout) for layout in ("lines", "python_list")}
+
+        class RowwiseStopping(StoppingCriteria):
+            def __init__(self, rows):
+                self.rows = rows
+
+            def __call__(self, input_ids, scores, **kwargs):
+                return torch.cat([row(input_ids[i:i + 1], scores) for i, row in enumerate(self.rows)])
+
+        self.RowwiseStopping = RowwiseStopping
+        self.PipelineStoppingCriteria = PipelineStoppingCriteria
+
+    def count_tokens(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def generate(self, batch, max_new_tokens):
+        inputs = self.tokenizer([s["prompt"] for s in batch], return_tensors="pt", padding=True).to(self.model.device)
+        prompt_length = inputs.input_ids.shape[1]
+        rows = [self.PipelineStoppingCriteria(self.tokenizer, prompt_length, s["user_input"], self.grammars[s["layout"]])
+                for s in batch]
+        with self.torch.no_grad():
+            outputs = self.model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                          stopping_criteria=self.StoppingCriteriaList([self.RowwiseStopping(rows)]),
+                                          pad_token_id=self.tokenizer.pad_token_id)
+        results = []
+        for row, generated in zip(rows, outputs[:, prompt_length:]):
+            num_tokens = int((generated != self.tokenizer.pad_token_id).sum())
+            text = self.tokenizer.decode(generated, skip_special_tokens=True).strip()
+            results.append((row.clean(text), num_tokens))
+        return results
+
+class GgufBackend:
+    """cpu_backend.py's llama.cpp model; one sample at a time."""
+    def __init__(self, gguf_path, max_seq_length, threads=None):
+        from cpu_backend import load_cpu_model, CpuChatModel
+        self.model = CpuChatModel(load_cpu_model(gguf_path, max_seq_length, n_threads=threads))
+
+    def count_tokens(self, text):
+        return len(self.model.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def generate(self, batch, max_new_tokens):
+        results = []
+        for sample in batch:
+            result = self.model.generate(sample["prompt"], max_new_tokens)
+            results.append((result["text"], result["num_tokens"]))
+        return results
+
+# ------------------------------
+# Evaluation loop
+# ------------------------------
+def evaluate(backend, samples, output_path, batch_size, max_new_tokens):
+    """Appends one JSON line per sample to output_path; samples already in the file are skipped."""
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, "rb") as f:
+            lines = f.readlines()
+        valid = 0  # bytes of complete, parsable lines
+        for i, line in enumerate(lines):
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                if i != len(lines) - 1:
+                    raise ValueError(f"{output_path}: line {i + 1} is not a result")
+                # A run killed mid-write leaves a partial last line; drop it so the sample is redone
+                print(f"Dropping incomplete last line of {output_path}")
+                with open(output_path, "r+b") as f:
+                    f.truncate(valid)
+                break
+            valid += len(line)
+        if lines and not lines[-1].endswith(b"\n") and valid == sum(len(line) for line in lines):
+            with open(output_path, "ab") as f:
+                f.write(b"\n")  # complete record whose newline was not written
+    remaining = (s for s in samples if s["id"] not in done)
+    if done:
+        print(f"Resuming: {len(done)} samples already evaluated")
+
+    num_samples = num_tokens = 0
+    generation_time = 0.0
+    with open(output_path, "a", encoding="utf-8") as out:
+        for batch in length_buckets(remaining, backend.count_tokens, batch_size):
+            start = time.perf_counter()
+            outputs = backend.generate(batch, max_new_tokens)
+            generation_time += time.perf_counter() - start
+            for sample, (prediction, tokens) in zip(batch, outputs):
+                result = {"id": sample["id"], "input": sample["user_input"], "reference": sample["reference"],
+                          "prediction": prediction, "tokens": tokens, **score(prediction, sample["reference"])}
+                out.write(json.dumps(result) + "\n")
+                num_tokens += tokens
+            out.flush()
+            num_samples += len(batch)
+            print(f"  {num_samples} samples, {num_samples / generation_time:.2f} samples/s, "
+                  f"{num_tokens / generation_time:.1f} tokens/s", flush=True)
+    return num_samples, num_tokens, generation_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched greedy evaluation of a model on the dataset JSON files.")
+    parser.add_argument("--model", default="novak247/massage_assistant_v1_lora",
+                        help="Model name or path; it must have been trained on the template of --datasets "
+                             "(v2 files use the v1 template, context files the context template)")
+    parser.add_argument("--loader", default="unsloth", choices=["unsloth", "hf", "gguf"],
+                        help="unsloth (4-bit GPU), hf (plain transformers) or gguf (cpu_backend.py, quantized CPU)")
+    parser.add_argument("--quantization", default="q4_k_m", help="GGUF quantization (gguf loader)")
+    parser.add_argument("--datasets", nargs="+", default=["datasets/massage_robot_dataset_v2.json"],
+                        help="massage_robot_dataset_v2.json and/or create_context_dataset.py output files")
+    parser.add_argument("--output", default="eval_results.jsonl", help="Per-sample results; an existing file is resumed")
+    parser.add_argument("--batch_size", default=16, type=int)
+    parser.add_argument("--max_seq_length", default=2048, type=int)
+    parser.add_argument("--max_new_tokens", default=150, type=int)
+    parser.add_argument("--limit", default=None, type=int, help="Evaluate only the first N samples")
+    args = parser.parse_args()
+
+    if args.loader == "gguf":
+        from cpu_backend import export_gguf
+        backend = GgufBackend(export_gguf(args.model, quantization=args.quantization), args.max_seq_length)
+    else:
+        from inference_server import load_model
+        backend = TransformersBackend(*load_model(args.model, args.loader, args.max_seq_length))
+
+    samples = iter_samples(args.datasets, args.limit)
+    num_samples, num_tokens, generation_time = evaluate(backend, samples, args.output, args.batch_size,
+                                                        args.max_new_tokens)
+
+    total, exact, per_type = summarize(args.output)
+    print(f"\n--- {args.model} ({args.loader}) ---")
+    if generation_time > 0:
+        print(f"This run:     {num_samples} samples, {num_samples / generation_time:.2f} samples/s, "
+              f"{num_tokens / generation_time:.1f} tokens/s")
+    print(f"Exact match:  {exact}/{total} ({exact / max(total, 1):.1%})")
+    for kind, (n, hits) in sorted(per_type.items()):
+        print(f"  {kind:<18} {hits}/{n} ({hits / n:.1%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+import os
+os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "0"
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+
+import torch
+from aiohttp import web, WSMsgType
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from conversation import PROMPT_TEMPLATES, ConversationHistory, trim_history, history_token_budget
+from pipeline_grammar import PipelineGrammar
+from pipeline_stopping import PipelineStoppingCriteria
+from response_cache import ResponseCache
+from rule_parser import RuleBasedParser
+from text_streaming import IncrementalDetokenizer
+
+try:
+    from transformers import DynamicCache
+except ImportError:
+    DynamicCache = None
+
+BASE_ADAPTER = "__base__"  # adapter_host.BASE_ADAPTER, without importing peft
+
+# ---------------------------
+# 1. KV cache helpers
+# ---------------------------
+def to_legacy_cache(past_key_values):
+    """Tuple of (key, value) per layer, each [batch, heads, positions, head_dim]."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    if hasattr(past_key_values, "layers"):  # transformers 5 dropped to_legacy_cache
+        return tuple((layer.keys, layer.values) for layer in past_key_values.layers)
+    return past_key_values
+
+def from_legacy_cache(legacy):
+    if DynamicCache is not None and hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(legacy)
+    if DynamicCache is not None:
+        return DynamicCache(legacy)
+    return legacy
+
+def left_pad(tensor, length, dim):
+    """Pads tensor with zeros on the left of dim up to length."""
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+# ---------------------------
+# 2. Continuous batching engine
+# ---------------------------
+class Sequence:
+    """
+    One generation request inside the engine. Text chunks are pushed to output, then None; if the
+    engine failed, error is set before the None.
+    """
+    def __init__(self, session_id, prompt_ids, max_new_tokens, stopping, detokenizer, adapter=None):
+        self.session_id = session_id
+        self.adapter = adapter  # LoRA adapter name when serving an AdapterHost
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.stopping = stopping
+        self.detokenizer = detokenizer
+        self.output = asyncio.Queue()
+        self.generated = []
+        self.next_token = None  # sampled but not yet fed through the model
+        self.position = len(prompt_ids)  # position id of next_token
+        self.submitted = time.perf_counter()
+        self.ttft = None
+        self.error = None
+        self.finished = asyncio.Event()
+
+    @property
+    def text(self):
+        return self.detokenizer.text
+
+
+class ContinuousBatchEngine:
+    """
+    Greedy decoding of many sequences in one batched forward pass per step.
+
+    New sequences are prefilled on their own and then merged into the running batch (the shorter
+    KV cache is left-padded and masked), finished sequences are dropped from the batch right
+    away, so sequences join and leave at token granularity instead of waiting for the whole
+    batch to finish. Position ids are passed per row, so left padding does not shift RoPE.
+
+    With multi_adapter=True the model is an AdapterHost's PeftModel and every row is run with its
+    own sequence's adapter, so requests for different adapters share the batch. model_lock is held
+    around every model call; take it to register or unregister adapters between steps.
+
+    TTFTs are kept for the ttft_sessions most recently active sessions, the last ttft_window each.
+    A failed prefill fails only its sequence and a failed decode step only the current batch; the
+    engine keeps serving. If run() itself stops (cancelled), every active and waiting sequence is
+    failed and later submits raise.
+    """
+    def __init__(self, model, tokenizer, max_batch_size=8, multi_adapter=False, ttft_sessions=1024, ttft_window=100):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = next(model.parameters()).device
+        self.max_batch_size = max_batch_size
+        self.multi_adapter = multi_adapter
+        self.model_lock = asyncio.Lock()
+        self.eos_token_id = tokenizer.eos_token_id
+        self.waiting = asyncio.Queue()
+        self.active = []
+        self.cache = None  # legacy cache with one row per active sequence
+        self.attention_mask = None  # [len(active), cache positions], 0 marks left padding
+        self.total_tokens = 0
+        self.busy_time = 0.0
+        self.ttfts = OrderedDict()  # session_id -> deque of ms, least recently active first
+        self.ttft_sessions = ttft_sessions
+        self.ttft_window = ttft_window
+        self.error = None  # why run() stopped
+
+    async def submit(self, session_id, prompt_ids, max_new_tokens, stopping, adapter=None):
+        if self.error is not None:
+            raise RuntimeError("generation engine stopped") from self.error
+        seq = Sequence(session_id, prompt_ids, max_new_tokens, stopping, IncrementalDetokenizer(self.tokenizer), adapter)
+        await self.waiting.put(seq)
+        return seq
+
+    # --- model calls (run in a worker thread so the event loop keeps serving sockets) ---
+    def _adapter_kwargs(self, seqs):
+        return {"adapter_names": [seq.adapter for seq in seqs]} if self.multi_adapter else {}
+
+    def _prefill(self, seq):
+        with torch.no_grad():
+            input_ids = torch.tensor([seq.prompt_ids], device=self.device)
+            outputs = self.model(input_ids=input_ids, use_cache=True, **self._adapter_kwargs([seq]))
+        return outputs.logits[:, -1, :], to_legacy_cache(outputs.past_key_values)
+
+    def _decode(self, input_ids, attention_mask, position_ids, cache, seqs):
+        with torch.no_grad():
+            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                                 past_key_values=from_legacy_cache(cache), use_cache=True, **self._adapter_kwargs(seqs))
+        return outputs.logits[:, -1, :], to_legacy_cache(outputs.past_key_values)
+
+    # --- batch bookkeeping ---
+    def _emit(self, seq, token_id):
+        """Records a sampled token; returns True when the sequence is finished."""
+        now = time.perf_counter()
+        if seq.ttft is None:
+            seq.ttft = now - seq.submitted
+            self._record_ttft(seq.session_id, seq.ttft * 1000)
+        if token_id == self.eos_token_id:
+            return True
+        seq.generated.append(token_id)
+        seq.next_token = token_id
+        self.total_tokens += 1
+        chunk = seq.detokenizer.add([token_id])
+        if chunk:
+            seq.output.put_nowait(chunk)
+        return (len(seq.generated) >= seq.max_new_tokens
+                or (seq.stopping is not None and seq.stopping.check(seq.text) is not None))
+
+    def _record_ttft(self, session_id, ms):
+        if session_id not in self.ttfts:
+            self.ttfts[session_id] = deque(maxlen=self.ttft_window)
+            if len(self.ttfts) > self.ttft_sessions:
+                self.ttfts.popitem(last=False)
+        self.ttfts.move_to_end(session_id)
+        self.ttfts[session_id].append(ms)
+
+    def _finish(self, seq):
+        chunk = seq.detokenizer.flush()
+        if chunk:
+            seq.output.put_nowait(chunk)
+        seq.output.put_nowait(None)
+        seq.finished.set()
+
+    def _merge(self, seq, cache):
+        """Adds a prefilled sequence to the running batch."""
+        mask = torch.ones((1, cache[0][0].shape[2]), dtype=torch.long, device=self.device)
+        if self.cache is None:
+            self.cache, self.attention_mask = cache, mask
+        else:
+            length = max(self.attention_mask.shape[1], mask.shape[1])
+            self.cache = tuple(
+                (torch.cat([left_pad(k, length, 2), left_pad(k_new, length, 2)], dim=0),
+                 torch.cat([left_pad(v, length, 2), left_pad(v_new, length, 2)], dim=0))
+                for (k, v), (k_new, v_new) in zip(self.cache, cache)
+            )
+            self.attention_mask = torch.cat([left_pad(self.attention_mask, length, 1), left_pad(mask, length, 1)], dim=0)
+        self.active.append(seq)
+
+    def _drop(self, finished):
+        """Removes finished rows and any leading columns that are padding in every remaining row."""
+        keep = [i for i, seq in enumerate(self.active) if seq not in finished]
+        self.active = [self.active[i] for i in keep]
+        if not keep:
+            self.cache, self.attention_mask = None, None
+            return
+        index = torch.tensor(keep, device=self.device)
+        mask = self.attention_mask.index_select(0, index)
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self.attention_mask = mask[:, start:]
+        self.cache = tuple((k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+                           for k, v in self.cache)
+
+    def _fail(self, seq, error):
+        seq.error = error
+        seq.output.put_nowait(None)
+        seq.finished.set()
+
+    def _check_adapter(self, seq):
+        """An adapter can be unregistered between routing and admission; only that request fails then."""
+        if self.multi_adapter and seq.adapter != BASE_ADAPTER and seq.adapter not in self.model.peft_config:
+            raise KeyError(f"adapter {seq.adapter} is not registered")
+
+    async def _admit(self, seq):
+        begin = time.perf_counter()
+        try:
+            self._check_adapter(seq)
+            logits, cache = await asyncio.to_thread(self._prefill, seq)
+            self.busy_time += time.perf_counter() - begin
+            if self._emit(seq, int(logits.argmax(dim=-1))):
+                self._finish(seq)
+            else:
+                self._merge(seq, cache)
+        except asyncio.CancelledError:
+            # Not in active yet, so run() would not see it when failing the rest
+            self._fail(seq, RuntimeError("generation engine stopped"))
+            raise
+        except Exception as e:
+            # e.g. a prompt longer than the model's context or an adapter that was removed
+            self._fail(seq, e)
+
+    async def _step(self):
+        begin = time.perf_counter()
+        input_ids = torch.tensor([[seq.next_token] for seq in self.active], device=self.device)
+        position_ids = torch.tensor([[seq.position] for seq in self.active], device=self.device)
+        attention_mask = torch.cat([self.attention_mask, self.attention_mask.new_ones((len(self.active), 1))], dim=1)
+        try:
+            logits, self.cache = await asyncio.to_thread(self._decode, input_ids, attention_mask, position_ids,
+                                                         self.cache, list(self.active))
+        except Exception as e:
+            # The batch's cache is in an unknown state: fail its sequences and start over with the waiting ones
+            for seq in self.active:
+                self._fail(seq, e)
+            self.active, self.cache, self.attention_mask = [], None, None
+            return
+        self.attention_mask = attention_mask
+        self.busy_time += time.perf_counter() - begin
+
+        finished = []
+        for seq, token_id in zip(self.active, logits.argmax(dim=-1).tolist()):
+            seq.position += 1
+            if self._emit(seq, token_id):
+                finished.append(seq)
+        for seq in finished:
+            self._finish(seq)
+        if finished:
+            self._drop(finished)
+
+    async def run(self):
+        try:
+            while True:
+                if not self.active:
+                    seq = await self.waiting.get()
+                    async with self.model_lock:
+                        await self._admit(seq)
+                async with self.model_lock:
+                    while len(self.active) < self.max_batch_size and not self.waiting.empty():
+                        await self._admit(self.waiting.get_nowait())
+                    if self.active:
+                        await self._step()
+        except BaseException as e:
+            # Cancelled on shutdown: nobody would ever finish these sequences
+            self.error = e if isinstance(e, Exception) else RuntimeError("generation engine stopped")
+            pending = self.active
+            while not self.waiting.empty():
+                pending.append(self.waiting.get_nowait())
+            for seq in pending:
+                self._fail(seq, self.error)
+            self.active, self.cache, self.attention_mask = [], None, None
+            raise
+
+    def stats(self):
+        all_ttfts = sorted(t for values in self.ttfts.values() for t in values)
+        return {
+            "generated_tokens": self.total_tokens,
+            "tokens_per_second": self.total_tokens / self.busy_time if self.busy_time else 0.0,
+            "active_sequences": len(self.active),
+            "waiting_sequences": self.waiting.qsize(),
+            "median_ttft_ms": all_ttfts[len(all_ttfts) // 2] if all_ttfts else None,
+            "ttft_ms_per_session": {
+                session_id: {"mean": sum(values) / len(values), "max": max(values), "count": len(values)}
+                for session_id, values in self.ttfts.items()
+            },
+        }
+
+# ---------------------------
+# 3. Per-session conversation state
+# ---------------------------
+class ChatService:
+    """
+    Keeps a ConversationHistory per session and turns each message into an engine request.
+    With an adapter_host, every turn runs on the adapter the request names or the session is routed to,
+    prompted with the template that adapter was registered with; otherwise with `template`.
+    A turn counts as in flight for its adapter from the moment it is started, including while it
+    waits for the session's previous turn, so the adapter cannot be unregistered under it.
+    At most max_sessions sessions are kept; the least recently used idle ones are forgotten first.
+    """
+    def __init__(self, engine, tokenizer, max_seq_length=2048, max_new_tokens=150, response_cache=None, rule_parser=None,
+                 adapter_host=None, max_sessions=4096, template="context"):
+        self.engine = engine
+        self.adapter_host = adapter_host
+        self.in_flight = Counter()  # adapter name -> turns currently generating
+        self.rule_parser = rule_parser
+        self.response_cache = response_cache
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.max_new_tokens = max_new_tokens
+        self.template = template
+        # template name -> (preamble token ids, suffix template, grammar of its response layout)
+        self.prompts = {name: (tokenizer(preamble).input_ids, suffix_template, PipelineGrammar(layout=layout))
+                        for name, (preamble, suffix_template, layout) in PROMPT_TEMPLATES.items()}
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()  # session_id -> (ConversationHistory, asyncio.Lock), least recently used first
+        self.last_results = {}  # session_id -> summary of the last finished turn
+
+    def _evict_sessions(self):
+        """Drops the least recently used sessions beyond max_sessions, skipping those with a turn running or queued."""
+        excess = len(self.sessions) - self.max_sessions
+        for session_id in list(self.sessions):
+            if excess <= 0:
+                break
+            if not self.sessions[session_id][1].locked():
+                del self.sessions[session_id]
+                self.last_results.pop(session_id, None)
+                excess -= 1
+
+    def resolve_adapter(self, session_id, adapter=None):
+        """The adapter for this turn (None without an adapter host); raises KeyError for unknown names."""
+        return self.adapter_host.resolve(adapter, session_id) if self.adapter_host is not None else None
+
+    def template_for(self, adapter):
+        if self.adapter_host is None:
+            return self.template
+        return self.adapter_host.templates.get(adapter, self.template)
+
+    async def chat(self, session_id, message, adapter=None):
+        """
+        Async generator of response text chunks; the turn is added to the history at the end.
+        adapter is a name returned by resolve_adapter.
+        """
+        if session_id not in self.sessions:
+            self.sessions[session_id] = (ConversationHistory(self.tokenizer), asyncio.Lock())
+        self.sessions.move_to_end(session_id)
+        history, lock = self.sessions[session_id]
+        self.in_flight[adapter] += 1
+        try:
+            async with lock:  # one turn at a time per session, so the history stays ordered
+                self._evict_sessions()
+                async for chunk in self._turn(session_id, history, message, adapter):
+                    yield chunk
+        finally:
+            self.in_flight[adapter] -= 1
+
+    async def _turn(self, session_id, history, message, adapter):
+        template = self.template_for(adapter)
+        preamble_ids, suffix_template, grammar = self.prompts[template]
+        if template == "context":
+            budget = history_token_budget(history, message, len(preamble_ids), self.max_seq_length, self.max_new_tokens)
+            history_text = trim_history(history, budget)
+            suffix = suffix_template.format(history_text, message, "")
+        else:
+            history_text = ""  # single-turn template
+            suffix = suffix_template.format(message, "")
+        # Adapters answer differently, so their cached responses are kept apart
+        cache_history = history_text if adapter is None else f"[{adapter}]\n" + history_text
+        response = self.rule_parser.respond(message, layout=grammar.layout) if self.rule_parser is not None else None
+        if response is None and self.response_cache is not None:
+            response = self.response_cache.get(cache_history, message)
+        if response is not None:
+            yield response
+            history.append("User: " + message + "\n" + "Assistant: " + response)
+            self.last_results[session_id] = {"response": response, "ttft_ms": 0.0, "tokens": 0, "cached": True,
+                                             "adapter": adapter}
+            return
+        prompt_ids = preamble_ids + self.tokenizer(suffix, add_special_tokens=False).input_ids
+        stopping = PipelineStoppingCriteria(self.tokenizer, len(prompt_ids), message, grammar)
+        seq = await self.engine.submit(session_id, prompt_ids, self.max_new_tokens, stopping, adapter)
+        while True:
+            chunk = await seq.output.get()
+            if chunk is None:
+                break
+            yield chunk
+        if seq.error is not None:
+            raise RuntimeError("generation failed") from seq.error
+        response = stopping.clean(seq.text)
+        if self.response_cache is not None and grammar.step(grammar.start, response) in grammar.accepting:
+            self.response_cache.put(cache_history, message, response)
+        history.append("User: " + message + "\n" + "Assistant: " + response)
+        self.last_results[session_id] = {"response": response, "ttft_ms": seq.ttft * 1000,
+                                         "tokens": len(seq.generated), "cached": False, "adapter": adapter}
+
+# ---------------------------
+# 4. HTTP and WebSocket endpoints
+# ---------------------------
+async def handle_chat(request):
+    """POST /chat {"session_id": optional, "adapter": optional, "message": "..."} -> streamed plain-text response."""
+    service = request.app["service"]
+    body = await request.json()
+    session_id = body.get("session_id") or uuid.uuid4().hex
+    try:
+        adapter = service.resolve_adapter(session_id, body.get("adapter"))
+    except KeyError:
+        raise web.HTTPBadRequest(text=f"unknown adapter {body.get('adapter')}")
+    headers = {"Content-Type": "text/plain; charset=utf-8", "X-Session-Id": session_id}
+    if adapter is not None:
+        headers["X-Adapter"] = adapter
+    response = web.StreamResponse(headers=headers)
+    await response.prepare(request)
+    async for chunk in service.chat(session_id, body["message"], adapter):
+        await response.write(chunk.encode("utf-8"))
+    await response.write_eof()
+    return response
+
+async def handle_ws(request):
+    """
+    GET /ws. Client sends {"session_id": optional, "adapter": optional, "message": "..."}; the server answers with
+    {"type": "text", "text": ...} chunks and a final {"type": "done", ...} message.
+    """
+    service = request.app["service"]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    default_session = uuid.uuid4().hex
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        body = json.loads(msg.data)
+        session_id = body.get("session_id") or default_session
+        try:
+            adapter = service.resolve_adapter(session_id, body.get("adapter"))
+        except KeyError:
+            await ws.send_json({"type": "error", "error": f"unknown adapter {body.get('adapter')}"})
+            continue
+        try:
+            async for chunk in service.chat(session_id, body["message"], adapter):
+                await ws.send_json({"type": "text", "text": chunk})
+        except RuntimeError as e:
+            await ws.send_json({"type": "error", "error": str(e)})
+            continue
+        await ws.send_json({"type": "done", "session_id": session_id, **service.last_results.get(session_id, {})})
+    return ws
+
+async def handle_stats(request):
+    service = request.app["service"]
+    stats = service.engine.stats()
+    if service.response_cache is not None:
+        stats["response_cache"] = service.response_cache.stats()
+    if service.adapter_host is not None:
+        stats["adapters"] = service.adapter_host.stats()
+    return web.json_response(stats)
+
+def adapter_host_or_404(request):
+    host = request.app["service"].adapter_host
+    if host is None:
+        raise web.HTTPNotFound(text="the server was started without --adapter")
+    return host
+
+async def handle_list_adapters(request):
+    return web.json_response(adapter_host_or_404(request).stats())
+
+async def handle_register_adapter(request):
+    """
+    POST /adapters {"name": "...", "path": "hub id or directory", "weight": optional traffic share,
+                    "template": optional prompt template it was trained on ("context" or "v1", default "context")}
+    """
+    host = adapter_host_or_404(request)
+    body = await request.json()
+    engine = request.app["service"].engine
+    async with engine.model_lock:  # no forward pass while the LoRA layers change
+        try:
+            await asyncio.to_thread(host.register, body["name"], body["path"], body.get("weight"),
+                                    body.get("template", "context"))
+        except ValueError as e:
+            raise web.HTTPConflict(text=str(e))
+    return web.json_response(host.stats())
+
+async def handle_unregister_adapter(request):
+    """DELETE /adapters/{name}; refused while turns on that adapter are still generating."""
+    host = adapter_host_or_404(request)
+    service = request.app["service"]
+    name = request.match_info["name"]
+    async with service.engine.model_lock:
+        if service.in_flight[name]:
+            raise web.HTTPConflict(text=f"adapter {name} has {service.in_flight[name]} turns in flight")
+        try:
+            host.unregister(name)
+        except KeyError:
+            raise web.HTTPNotFound(text=f"unknown adapter {name}")
+        except ValueError as e:
+            raise web.HTTPConflict(text=str(e))
+    return web.json_response(host.stats())
+
+async def handle_set_traffic(request):
+    """PUT /adapters/traffic {"name": weight, ...}: split of sessions that do not name an adapter."""
+    host = adapter_host_or_404(request)
+    try:
+        host.set_traffic(await request.json())
+    except KeyError as e:
+        raise web.HTTPBadRequest(text=f"unknown adapter {e}")
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    return web.json_response(host.stats())
+
+async def start_engine(app):
+    app["engine_task"] = asyncio.create_task(app["service"].engine.run())
+
+async def stop_engine(app):
+    app["engine_task"].cancel()
+
+def create_app(service):
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_get("/ws", handle_ws)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/adapters", handle_list_adapters)
+    app.router.add_post("/adapters", handle_register_adapter)
+    app.router.add_put("/adapters/traffic", handle_set_traffic)
+    app.router.add_delete("/adapters/{name}", handle_unregister_adapter)
+    app.on_startup.append(start_engine)
+    app.on_cleanup.append(stop_engine)
+    return app
+
+# ---------------------------
+# 5. Model loading
+# ---------------------------
+def load_model(model_name, loader, max_seq_length=2048):
+    """
+    loader="unsloth" loads the fine-tuned LoRA in 4-bit like context_chat.py;
+    loader="hf" loads any causal LM with plain transformers (e.g. a tiny model for CPU tests).
+    """
+    if loader == "unsloth":
+        from unsloth import FastLanguageModel
+        model, tokenizer = FastLanguageModel.from_pretrained(
+            model_name=model_name, max_seq_length=max_seq_length, dtype=None, load_in_4bit=True,
+        )
+        FastLanguageModel.for_inference(model)
+    else:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
+        model.eval()
+    return model, tokenizer
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the massage assistant to many robot sessions with continuous batching.")
+    parser.add_argument("--model", default="novak247/massage_assistant_context_lora",
+                        help="Model name or path; the base model when --adapter is given")
+    parser.add_argument("--adapter", action="append", default=[], metavar="NAME=PATH[:TEMPLATE]",
+                        help="Register a LoRA adapter on the base model (repeatable); the first one gets all default traffic. "
+                             "TEMPLATE is the prompt template it was trained on: context (default) or v1")
+    parser.add_argument("--template", default="context", choices=sorted(PROMPT_TEMPLATES),
+                        help="Prompt template of --model when it is served without --adapter")
+    parser.add_argument("--loader", default="unsloth", choices=["unsloth", "hf"],
+                        help="unsloth (4-bit, GPU) or hf (plain transformers, works on CPU)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", default=8080, type=int)
+    parser.add_argument("--max_batch_size", default=8, type=int, help="Maximum number of sequences decoded together")
+    parser.add_argument("--max_seq_length", default=2048, type=int)
+    parser.add_argument("--max_new_tokens", default=150, type=int)
+    parser.add_argument("--max_sessions", default=4096, type=int,
+                        help="Conversations kept in memory; the least recently used idle ones are dropped")
+    parser.add_argument("--no_rule_parser", action="store_true", help="Send templated commands to the model too")
+    parser.add_argument("--response_cache_size", default=1024, type=int, help="0 disables the response cache")
+    parser.add_argument("--response_cache_ttl", default=24 * 3600, type=float, help="Seconds a cached response stays valid")
+    parser.add_argument("--response_cache_path", default=None, help="JSON file the response cache is loaded from and saved to")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model, args.loader, args.max_seq_length)
+    adapter_host = None
+    if args.adapter:
+        from adapter_host import AdapterHost
+        adapter_host = AdapterHost(model, tokenizer)
+        for spec in args.adapter:
+            name, path = spec.split("=", 1)
+            path, _, template = path.partition(":")
+            adapter_host.register(name, path, template=template or "context")
+        model = adapter_host.model
+    engine = ContinuousBatchEngine(model, tokenizer, max_batch_size=args.max_batch_size,
+                                   multi_adapter=adapter_host is not None)
+    response_cache = None
+    if args.response_cache_size > 0:
+        response_cache = ResponseCache(args.response_cache_size, args.response_cache_ttl, args.response_cache_path)
+    rule_parser = None if args.no_rule_parser else RuleBasedParser()
+    service = ChatService(engine, tokenizer, args.max_seq_length, args.max_new_tokens, response_cache, rule_parser,
+                          adapter_host, args.max_sessions, args.template)
+    web.run_app(create_app(service), host=args.host, port=args.port)
+    if response_cache is not None and args.response_cache_path is not None:
+        response_cache.save()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Helpers for past_key_values that work with both Cache objects and legacy tuples of (key, value) pairs,
+# and the prompt KV reuse of context_chat.py built on them.
+import copy
+
+import torch
+
+def cache_length(past_key_values):
+    """Number of positions stored in a Cache object or a legacy tuple of (key, value) pairs."""
+    if past_key_values is None:
+        return 0
+    if hasattr(past_key_values, "get_seq_length"):
+        return past_key_values.get_seq_length()
+    return past_key_values[0][0].shape[-2]
+
+def crop_past_key_values(past_key_values, length):
+    """Drops every cached position from `length` onwards."""
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(length)
+        return past_key_values
+    return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past_key_values)
+
+# ---------------------------
+# Prefix KV-cache for the static preamble
+# ---------------------------
+class PrefixCache:
+    """
+    Tokenizes and prefills the static preamble once and keeps its past_key_values.
+    Each turn only the variable suffix (history, user input) is tokenized; generate()
+    then skips the cached positions, so only the suffix tokens are prefilled.
+    """
+    def __init__(self, model, tokenizer, preamble, device):
+        self.tokenizer = tokenizer
+        self.device = device
+        self.input_ids = tokenizer([preamble], return_tensors="pt").input_ids.to(device)
+        with torch.no_grad():
+            outputs = model(input_ids=self.input_ids, use_cache=True)
+        self.past_key_values = outputs.past_key_values
+
+    @property
+    def num_tokens(self):
+        return self.input_ids.shape[1]
+
+    def build_inputs(self, suffix, copy_cache=True):
+        """
+        Returns (input_ids, attention_mask, past_key_values) for preamble + suffix.
+        The cache is copied because generate() extends it in place.
+        """
+        suffix_ids = self.tokenizer([suffix], add_special_tokens=False, return_tensors="pt").input_ids.to(self.device)
+        input_ids = torch.cat([self.input_ids, suffix_ids], dim=1)
+        attention_mask = torch.ones_like(input_ids)
+        past_key_values = copy.deepcopy(self.past_key_values) if copy_cache else None
+        return input_ids, attention_mask, past_key_values
+
+# ---------------------------
+# Multi-turn KV reuse
+# ---------------------------
+class ChatSession:
+    """
+    Keeps the KV cache of the previous turn (prompt + generated response) alive across turns.
+    The new prompt shares a token prefix with what is already cached (the preamble and every
+    history turn that was not trimmed), so the cache is cropped to that common prefix and only
+    the remaining tokens are prefilled. When trimming shifts the history window the common
+    prefix shrinks to the preamble, which is the rebuild case.
+    """
+    def __init__(self, prefix_cache):
+        self.prefix_cache = prefix_cache
+        self.cached_ids = prefix_cache.input_ids
+        self.past_key_values = copy.deepcopy(prefix_cache.past_key_values)
+        self.last_reused = 0
+        self.last_prefilled = 0
+
+    def build_inputs(self, suffix):
+        """
+        Returns (input_ids, attention_mask, past_key_values) for preamble + suffix, with the
+        session cache cropped to the longest prefix it shares with input_ids.
+        """
+        input_ids, attention_mask, _ = self.prefix_cache.build_inputs(suffix, copy_cache=False)
+        cached = self.cached_ids[0]
+        new = input_ids[0]
+        limit = min(cached.shape[0], new.shape[0] - 1)  # generate() needs at least one uncached token
+        mismatch = (cached[:limit] != new[:limit]).nonzero()
+        reuse = mismatch[0].item() if mismatch.numel() else limit
+
+        if reuse < self.prefix_cache.num_tokens:
+            # Should not happen (the preamble is always shared), but never feed a stale cache
+            self.past_key_values = copy.deepcopy(self.prefix_cache.past_key_values)
+            reuse = self.prefix_cache.num_tokens
+        elif reuse < cache_length(self.past_key_values):
+            self.past_key_values = crop_past_key_values(self.past_key_values, reuse)
+
+        self.last_reused = reuse
+        self.last_prefilled = new.shape[0] - reuse
+        return input_ids, attention_mask, self.past_key_values
+
+    def update(self, outputs):
+        """Stores the cache returned by generate(return_dict_in_generate=True) for the next turn."""
+        self.past_key_values = outputs.past_key_values
+        # The last sampled token is never fed back through the model, so it is not in the cache
+        self.cached_ids = outputs.sequences[:, :cache_length(self.past_key_values)]
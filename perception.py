@@ -0,0 +1,47 @@
+import random
+import threading
+import time
+
+from create_dataset import body_parts
+
+# ------------------------------
+# Simulated perception
+# ------------------------------
+class SimulatedPerception:
+    """
+    Stand-in for the vision pipeline so the executor can run without hardware.
+
+    Every body part has fixed coordinates (seeded, within the [-20, 20] range of the dataset).
+    A detection call sleeps for call_latency plus per_part_latency for each requested part, so
+    batching several parts into one call is measurably cheaper. move_client() shifts all parts
+    and notifies the on_movement listeners, like the real pipeline does when the client moves.
+    """
+    def __init__(self, call_latency=0.3, per_part_latency=0.02, seed=0):
+        self.call_latency = call_latency
+        self.per_part_latency = per_part_latency
+        rng = random.Random(seed)
+        self.positions = {part: [rng.randint(-20, 20) for _ in range(3)] for part in body_parts}
+        self.calls = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def on_movement(self, callback):
+        self.listeners.append(callback)
+
+    def detect_body_parts(self, parts):
+        """Coordinates for each part, in one perception call."""
+        time.sleep(self.call_latency + self.per_part_latency * len(parts))
+        with self.lock:
+            self.calls += 1
+            return [list(self.positions[part]) if part in self.positions else [0, 0, 0] for part in parts]
+
+    def detect_body_part(self, part_name):
+        return self.detect_body_parts([part_name])[0]
+
+    def move_client(self, offset):
+        with self.lock:
+            for position in self.positions.values():
+                for axis in range(3):
+                    position[axis] += offset[axis]
+        for callback in self.listeners:
+            callback()
@@ -0,0 +1,233 @@
+import queue
+import threading
+import time
+
+from pipeline_parser import Start, Stop, Home, DetectBodyPart, Move, ChangeForce, AutomaticMassage
+
+# ------------------------------
+# Robot stand-in
+# ------------------------------
+class LoggingRobot:
+    """
+    Prints every capability call with the time since it was created. Used until the chat
+    scripts are wired to the real controller; any object with the same methods can replace it.
+    Detections come from perception (e.g. perception.SimulatedPerception) if one is given.
+    """
+    def __init__(self, perception=None):
+        self.created = time.time()
+        self.perception = perception
+
+    def _log(self, call):
+        print(f"\n[robot +{(time.time() - self.created) * 1000:.0f} ms] {call}", flush=True)
+
+    def start(self):
+        self._log("start()")
+
+    def stop(self):
+        self._log("stop()")
+
+    def home(self):
+        self._log("home()")
+
+    def detect_body_part(self, part_name):
+        return self.detect_body_parts([part_name])[0]
+
+    def detect_body_parts(self, part_names):
+        """Several detections in one perception call."""
+        self._log(f"detect_body_parts({part_names})")
+        if self.perception is None:
+            return [[0, 0, 0] for _ in part_names]
+        return self.perception.detect_body_parts(part_names)
+
+    def move_to(self, coords):
+        self._log(f"move_to({list(coords)})")
+
+    def change_force(self, mode, value):
+        self._log(f"change_force('{mode}', {value})")
+
+    def automatic_massage(self, part_name):
+        self._log(f"automatic_massage('{part_name}')")
+
+# ------------------------------
+# Detection cache
+# ------------------------------
+class DetectionCache:
+    """
+    Coordinates of recently detected body parts, so a pipeline that detects the same part
+    before every move_to and automatic_massage runs perception once.
+
+    detect_many(parts) -> list of coordinates does the actual perception call (e.g.
+    robot.detect_body_parts). Entries expire after ttl seconds and are dropped by invalidate(),
+    which the executor calls on home() and stop(); pass it to the perception's movement signal too.
+    clock() gives the time the TTL is measured in (e.g. a simulator's clock in benchmarks).
+    """
+    def __init__(self, detect_many, ttl=30.0, clock=time.monotonic):
+        self.detect_many = detect_many
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}  # part -> (coordinates, detected at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.perception_calls = 0
+        self.invalidations = 0  # also the generation: detections started before one are not stored
+
+    def _fresh(self, part, now):
+        entry = self.entries.get(part)
+        return entry is not None and now - entry[1] <= self.ttl
+
+    def prefetch(self, parts):
+        """
+        Detects every part that is not cached in a single perception call. Returns part ->
+        coordinates for all of parts, so callers do not depend on the entries surviving a
+        concurrent invalidate(). Results of a detection that overlapped an invalidate() are
+        returned but not cached, since the client may have moved.
+        """
+        now = self.clock()
+        with self.lock:
+            found = {part: self.entries[part][0] for part in parts if self._fresh(part, now)}
+            generation = self.invalidations
+        missing = list(dict.fromkeys(part for part in parts if part not in found))
+        if not missing:
+            return found
+        coordinates = self.detect_many(missing)
+        now = self.clock()
+        with self.lock:
+            self.perception_calls += 1
+            for part, coords in zip(missing, coordinates):
+                if self.invalidations == generation:
+                    self.entries[part] = (coords, now)
+                found[part] = coords
+        return found
+
+    def get(self, part, upcoming=()):
+        """
+        Coordinates of part. On a miss, the parts in upcoming (detections queued after this one)
+        are fetched in the same perception call.
+        """
+        with self.lock:
+            if self._fresh(part, self.clock()):
+                self.hits += 1
+                return self.entries[part][0]
+            self.misses += 1
+        return self.prefetch([part, *upcoming])[part]
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "perception_calls": self.perception_calls,
+            "invalidations": self.invalidations,
+        }
+
+# ------------------------------
+# Executor queue
+# ------------------------------
+def execute_command(robot, command, detected, detection_cache=None, upcoming_parts=()):
+    """
+    Runs one typed command on robot. detected holds the coordinates returned by the last
+    detect_body_part, which move_to([x, y, z]) refers to; the updated value is returned.
+    With a detection_cache, detections go through it and home()/stop() invalidate it.
+    """
+    if isinstance(command, Start):
+        robot.start()
+    elif isinstance(command, Stop):
+        robot.stop()
+        if detection_cache is not None:
+            detection_cache.invalidate()
+    elif isinstance(command, Home):
+        robot.home()
+        if detection_cache is not None:
+            detection_cache.invalidate()
+    elif isinstance(command, DetectBodyPart):
+        if detection_cache is not None:
+            detected = detection_cache.get(command.part, upcoming_parts)
+        else:
+            detected = robot.detect_body_part(command.part)
+    elif isinstance(command, Move):
+        coords = detected if command.coords is None else command.coords
+        if coords is None:
+            raise RuntimeError("move_to([x, y, z]) before any detect_body_part")
+        robot.move_to(coords)
+    elif isinstance(command, ChangeForce):
+        robot.change_force(command.mode, command.value)
+    elif isinstance(command, AutomaticMassage):
+        robot.automatic_massage(command.part)
+    else:
+        raise ValueError(f"Unknown command: {command!r}")
+    return detected
+
+
+class PipelineExecutor:
+    """
+    Runs commands on a worker thread in the order they are submitted, so the first lines of a
+    pipeline execute while the model is still decoding the later ones. If a command fails, the
+    rest of that pipeline is skipped until reset() is called for the next one.
+
+    With a DetectionCache, a detection miss also fetches the other parts already queued (up to
+    the next home() or stop()) in the same perception call.
+    """
+    def __init__(self, robot, detection_cache=None):
+        self.robot = robot
+        self.detection_cache = detection_cache
+        self.commands = queue.Queue()
+        self.detected = None
+        self.error = None
+        self.timings = []  # (command, start offset in seconds from reset(), duration in seconds)
+        self.started = time.time()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        while True:
+            command = self.commands.get()
+            if command is None:
+                self.commands.task_done()
+                return
+            if self.error is None:
+                begin = time.time()
+                try:
+                    self.detected = execute_command(self.robot, command, self.detected, self.detection_cache,
+                                                    self._upcoming_parts() if isinstance(command, DetectBodyPart) else ())
+                except Exception as e:
+                    self.error = e
+                    print(f"\n[executor] {command!r} failed: {e}. Skipping the rest of the pipeline.")
+                self.timings.append((command, begin - self.started, time.time() - begin))
+            self.commands.task_done()
+
+    def _upcoming_parts(self):
+        """Parts of the detections waiting in the queue, up to the next command that invalidates the cache."""
+        parts = []
+        with self.commands.mutex:
+            for command in self.commands.queue:
+                if command is None or isinstance(command, (Home, Stop)):
+                    break
+                if isinstance(command, DetectBodyPart):
+                    parts.append(command.part)
+        return parts
+
+    def submit(self, command):
+        self.commands.put(command)
+
+    def wait(self):
+        """Blocks until every submitted command has run. Returns the error that stopped the pipeline, if any."""
+        self.commands.join()
+        return self.error
+
+    def reset(self):
+        """Prepares for the next pipeline (call after wait())."""
+        self.error = None
+        self.detected = None
+        self.timings = []
+        self.started = time.time()
+
+    def close(self):
+        self.commands.put(None)
+        self.worker.join()
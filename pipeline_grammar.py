@@ -0,0 +1,364 @@
+import torch
+from transformers import LogitsProcessor
+
+from create_dataset import body_parts
+from kv_cache import cache_length
+
+# ------------------------------
+# Character-level automaton for the capability language
+# ------------------------------
+class _NFA:
+    """
+    Minimal Thompson-style NFA builder. Every helper returns a fresh (start, end) fragment,
+    so a fragment must not be used twice.
+    """
+    def __init__(self):
+        self.edges = []  # state -> list of (char or None for epsilon, target)
+
+    def state(self):
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def lit(self, text):
+        start = current = self.state()
+        for char in text:
+            nxt = self.state()
+            self.edges[current].append((char, nxt))
+            current = nxt
+        return start, current
+
+    def charset(self, chars):
+        start, end = self.state(), self.state()
+        for char in chars:
+            self.edges[start].append((char, end))
+        return start, end
+
+    def seq(self, *fragments):
+        for (_, end), (start, _) in zip(fragments, fragments[1:]):
+            self.edges[end].append((None, start))
+        return fragments[0][0], fragments[-1][1]
+
+    def alt(self, *fragments):
+        start, end = self.state(), self.state()
+        for frag_start, frag_end in fragments:
+            self.edges[start].append((None, frag_start))
+            self.edges[frag_end].append((None, end))
+        return start, end
+
+    def star(self, fragment):
+        start, end = self.state(), self.state()
+        self.edges[start] += [(None, fragment[0]), (None, end)]
+        self.edges[fragment[1]] += [(None, fragment[0]), (None, end)]
+        return start, end
+
+    def opt(self, fragment):
+        return self.alt(fragment, self.lit(""))
+
+    def closure(self, states):
+        stack, seen = list(states), set(states)
+        while stack:
+            for char, target in self.edges[stack.pop()]:
+                if char is None and target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return frozenset(seen)
+
+    def to_dfa(self, start, end):
+        """Subset construction. Returns (transitions, accepting) with state 0 as the start state."""
+        first = self.closure([start])
+        index = {first: 0}
+        pending = [first]
+        transitions, accepting = [{}], set()
+        while pending:
+            subset = pending.pop()
+            current = index[subset]
+            if end in subset:
+                accepting.add(current)
+            moves = {}
+            for state in subset:
+                for char, target in self.edges[state]:
+                    if char is not None:
+                        moves.setdefault(char, set()).add(target)
+            for char, targets in moves.items():
+                nxt = self.closure(targets)
+                if nxt not in index:
+                    index[nxt] = len(transitions)
+                    transitions.append({})
+                    pending.append(nxt)
+                transitions[current][char] = index[nxt]
+        return transitions, accepting
+
+
+class PipelineGrammar:
+    """
+    Deterministic automaton over the characters of a valid pipeline response.
+
+    layout="lines"       -> one capability call per line (context model, massage_robot_dataset_with_mixed_commands)
+    layout="python_list" -> a single call, or a Python list repr of calls (v1 model, create_dataset.py output)
+    """
+    def __init__(self, layout="lines", parts=None):
+        self.layout = layout
+        self.parts = list(parts or body_parts)
+        nfa = _NFA()
+        if layout == "lines":
+            fragment = nfa.seq(self._line(nfa), nfa.star(nfa.seq(nfa.lit("\n"), self._line(nfa))))
+        elif layout == "python_list":
+            items = nfa.seq(self._item(nfa), nfa.star(nfa.seq(nfa.lit(", "), self._item(nfa))))
+            fragment = nfa.alt(self._line(nfa), nfa.seq(nfa.lit("["), items, nfa.lit("]")))
+        else:
+            raise ValueError(f"Unknown layout: {layout}")
+        self.transitions, self.accepting = nfa.to_dfa(*fragment)
+        self.start = 0
+
+    def _integer(self, nfa):
+        digits = nfa.seq(nfa.charset("0123456789"), nfa.star(nfa.charset("0123456789")))
+        return nfa.seq(nfa.opt(nfa.lit("-")), digits)
+
+    def _number(self, nfa):
+        fraction = nfa.seq(nfa.lit("."), nfa.charset("0123456789"), nfa.star(nfa.charset("0123456789")))
+        return nfa.seq(self._integer(nfa), nfa.opt(fraction))
+
+    def _part(self, nfa):
+        return nfa.alt(*[nfa.lit(part) for part in self.parts])
+
+    def _line(self, nfa, quoted_args=True):
+        calls = [
+            nfa.lit("start()"),
+            nfa.lit("stop()"),
+            nfa.lit("home()"),
+            nfa.seq(nfa.lit("move_to(["),
+                    nfa.alt(nfa.lit("x, y, z"),
+                            nfa.seq(self._integer(nfa), nfa.lit(", "), self._integer(nfa), nfa.lit(", "), self._integer(nfa))),
+                    nfa.lit("])")),
+        ]
+        if quoted_args:
+            calls += [
+                nfa.seq(nfa.lit("[x, y, z] = detect_body_part('"), self._part(nfa), nfa.lit("')")),
+                nfa.seq(nfa.lit("change_force('"), nfa.alt(nfa.lit("absolute"), nfa.lit("relative")),
+                        nfa.lit("', "), self._number(nfa), nfa.lit(")")),
+                nfa.seq(nfa.lit("automatic_massage('"), self._part(nfa), nfa.lit("')")),
+            ]
+        return nfa.alt(*calls)
+
+    def _item(self, nfa):
+        # repr() uses double quotes for strings that contain single quotes
+        return nfa.alt(nfa.seq(nfa.lit('"'), self._line(nfa), nfa.lit('"')),
+                       nfa.seq(nfa.lit("'"), self._line(nfa, quoted_args=False), nfa.lit("'")))
+
+    def step(self, state, text):
+        """Follows text from state; returns the new state or None if text is not allowed."""
+        for char in text:
+            state = self.transitions[state].get(char)
+            if state is None:
+                return None
+        return state
+
+    def forced_text(self, state):
+        """The characters that must follow state because there is no alternative."""
+        chars = []
+        while state not in self.accepting and len(self.transitions[state]) == 1:
+            char, state = next(iter(self.transitions[state].items()))
+            chars.append(char)
+        return "".join(chars)
+
+# ------------------------------
+# Token-level index
+# ------------------------------
+def token_strings(tokenizer):
+    """
+    The text each token adds when it follows other text. Decoding after a newline keeps the
+    leading space of SentencePiece tokens that a standalone decode would strip.
+    """
+    anchor = tokenizer.encode("\n", add_special_tokens=False)
+    anchor_text = tokenizer.decode(anchor)
+    special = set(tokenizer.all_special_ids)
+    strings = []
+    for token_id in range(len(tokenizer)):
+        if token_id in special:
+            strings.append("")
+            continue
+        text = tokenizer.decode(anchor + [token_id])
+        strings.append(text[len(anchor_text):] if text.startswith(anchor_text) else "")
+    return strings
+
+
+class GrammarTokenIndex:
+    """
+    Joins the grammar automaton with a character trie of the vocabulary. For every grammar state
+    the allowed tokens (and the state each one leads to) are computed once and cached, so each
+    decoding step is a dictionary lookup instead of a scan over the vocabulary.
+    """
+    def __init__(self, tokenizer, grammar):
+        self.grammar = grammar
+        self.strings = token_strings(tokenizer)
+        self.trie = ({}, [])  # (children by char, token ids ending here)
+        for token_id, text in enumerate(self.strings):
+            if not text or "�" in text:  # special tokens and partial UTF-8 bytes never match
+                continue
+            node = self.trie
+            for char in text:
+                node = node[0].setdefault(char, ({}, []))
+            node[1].append(token_id)
+        self._allowed = {}
+        self._forced = {}
+        self._masks = {}
+
+    def allowed(self, state):
+        """Returns {token_id: next_state} for every token the grammar accepts in state."""
+        if state not in self._allowed:
+            result = {}
+            stack = [(state, self.trie)]
+            while stack:
+                grammar_state, node = stack.pop()
+                for char, child in node[0].items():
+                    nxt = self.grammar.transitions[grammar_state].get(char)
+                    if nxt is None:
+                        continue
+                    for token_id in child[1]:
+                        result[token_id] = nxt
+                    stack.append((nxt, child))
+            self._allowed[state] = result
+        return self._allowed[state]
+
+    def forced_tokens(self, state):
+        """
+        Token ids that spell out the forced text after state, longest token first.
+        Stops before the first token that would have to cross into a real choice.
+        """
+        if state not in self._forced:
+            tokens = []
+            current = state
+            remaining = len(self.grammar.forced_text(state))
+            while remaining > 0:
+                candidates = [(len(self.strings[t]), t, nxt) for t, nxt in self.allowed(current).items()
+                              if len(self.strings[t]) <= remaining]
+                if not candidates:
+                    break
+                length, token_id, current = max(candidates)
+                tokens.append(token_id)
+                remaining -= length
+            self._forced[state] = tokens
+        return self._forced[state]
+
+    def mask(self, state, eos_token_ids, vocab_size, device):
+        """Additive mask (0 for allowed tokens, -inf elsewhere) for state, cached per device."""
+        key = (state, device)
+        if key not in self._masks:
+            mask = torch.full((vocab_size,), float("-inf"), device=device)
+            ids = [t for t in self.allowed(state) if t < vocab_size]
+            if state in self.grammar.accepting:
+                ids += eos_token_ids
+            if ids:
+                mask[torch.tensor(ids, device=device)] = 0.0
+            self._masks[key] = mask
+        return self._masks[key]
+
+# ------------------------------
+# Logits processor
+# ------------------------------
+class PipelineGrammarLogitsProcessor(LogitsProcessor):
+    """
+    Restricts every decoding step to tokens that keep the response inside the pipeline grammar.
+    Works with model.generate(logits_processor=...) for any batch size; it tracks one grammar
+    state per row from the tokens generated after the prompt.
+    """
+    def __init__(self, index, eos_token_id):
+        self.index = index
+        self.eos_token_ids = list(eos_token_id) if isinstance(eos_token_id, (list, tuple)) else [eos_token_id]
+        self.reset()
+
+    def reset(self):
+        """Call before every new generation."""
+        self.states = None
+        self.consumed = None
+
+    def _advance(self, row, token_id):
+        state = self.states[row]
+        if state is None:
+            return
+        if token_id in self.eos_token_ids:
+            self.states[row] = None  # finished rows are left alone
+            return
+        # A token outside the grammar can only appear if it was forced by the caller; stop constraining
+        self.states[row] = self.index.allowed(state).get(token_id)
+
+    def next_state(self, row, token_id):
+        """The grammar state row would be in after token_id, without committing it."""
+        state = self.states[row]
+        return None if state is None else self.index.allowed(state).get(token_id)
+
+    def __call__(self, input_ids, scores):
+        if self.states is None:
+            self.states = [self.index.grammar.start] * input_ids.shape[0]
+            self.consumed = input_ids.shape[1]
+        for row in range(input_ids.shape[0]):
+            for token_id in input_ids[row, self.consumed:].tolist():
+                self._advance(row, token_id)
+        self.consumed = input_ids.shape[1]
+
+        for row, state in enumerate(self.states):
+            if state is not None:
+                scores[row] = scores[row] + self.index.mask(state, self.eos_token_ids, scores.shape[-1], scores.device)
+        return scores
+
+# ------------------------------
+# Greedy decoding loop with fast-forward over forced tokens
+# ------------------------------
+class ConstrainedOutput:
+    """Mirrors the fields of generate(return_dict_in_generate=True) that the chat scripts use."""
+    def __init__(self, sequences, past_key_values, num_forward_passes, num_forced_tokens):
+        self.sequences = sequences
+        self.past_key_values = past_key_values
+        self.num_forward_passes = num_forward_passes
+        self.num_forced_tokens = num_forced_tokens
+
+
+def constrained_generate(model, input_ids, attention_mask, processor, past_key_values=None,
+                         streamer=None, max_new_tokens=150, stopping_criteria=None):
+    """
+    Greedy generation (batch size 1) under the pipeline grammar. Whenever the grammar leaves only
+    one possible continuation, e.g. "= detect_body_part('" or "y, z])", those tokens are appended
+    without sampling and fed to the model together in the next forward pass, so a forced span of
+    k tokens costs one forward pass instead of k.
+    past_key_values may hold a prefix of input_ids (see PrefixCache/ChatSession in kv_cache.py).
+    stopping_criteria is called like in generate() after every step (see pipeline_stopping.py).
+    """
+    processor.reset()
+    if streamer is not None:
+        streamer.put(input_ids.cpu())
+
+    sequences = input_ids
+    feed = input_ids[:, cache_length(past_key_values):]
+    prompt_length = input_ids.shape[1]
+    forward_passes = forced_tokens = 0
+
+    with torch.no_grad():
+        while sequences.shape[1] - prompt_length < max_new_tokens:
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((1, sequences.shape[1] - attention_mask.shape[1]))], dim=1)
+            outputs = model(input_ids=feed, attention_mask=attention_mask,
+                            past_key_values=past_key_values, use_cache=True)
+            forward_passes += 1
+            past_key_values = outputs.past_key_values
+            scores = processor(sequences, outputs.logits[:, -1, :].float())
+            token_id = scores.argmax(dim=-1).item()
+            new_tokens = [token_id]
+            if token_id not in processor.eos_token_ids:
+                state = processor.next_state(0, token_id)
+                if state is not None:
+                    budget = max_new_tokens - (sequences.shape[1] - prompt_length) - 1
+                    forced = processor.index.forced_tokens(state)[:budget]
+                    new_tokens += forced
+                    forced_tokens += len(forced)
+
+            feed = torch.tensor([new_tokens], dtype=sequences.dtype, device=sequences.device)
+            sequences = torch.cat([sequences, feed], dim=1)
+            if streamer is not None:
+                streamer.put(feed.cpu())
+            if token_id in processor.eos_token_ids:
+                break
+            if stopping_criteria is not None and bool(stopping_criteria(sequences, scores).all()):
+                break
+
+    if streamer is not None:
+        streamer.end()
+    return ConstrainedOutput(sequences, past_key_values, forward_passes, forced_tokens)
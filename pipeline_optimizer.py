@@ -0,0 +1,183 @@
+import re
+from collections import Counter, namedtuple
+
+from create_dataset import body_parts
+from pipeline_parser import Start, Stop, Home, DetectBodyPart, Move, ChangeForce, CALL, parse_pipeline, format_command
+from rule_parser import format_response
+
+# ------------------------------
+# Checking against the capability signatures
+# ------------------------------
+def unparsed_text(text):
+    """Whatever is left of a response once every capability call is removed (list/quote punctuation aside)."""
+    rest = CALL.sub("", text)
+    return re.sub(r"[\s\[\],'\"]", "", rest)
+
+def validate(commands, parts=None):
+    """
+    Returns a list of problems: unknown body parts, relative force factors outside [-1, 1], and
+    move_to([x, y, z]) before any detect_body_part in the plan.
+    """
+    parts = set(parts or body_parts)
+    errors = []
+    detected = False
+    for i, command in enumerate(commands):
+        if isinstance(command, DetectBodyPart):
+            detected = True
+        if getattr(command, "part", None) is not None and command.part not in parts:
+            errors.append(f"{i}: unknown body part '{command.part}'")
+        if isinstance(command, Move) and command.coords is None and not detected:
+            errors.append(f"{i}: move_to([x, y, z]) before any detect_body_part")
+        if isinstance(command, ChangeForce) and command.mode == "relative" and not -1 <= command.value <= 1:
+            errors.append(f"{i}: relative force change {command.value} outside [-1, 1]")
+    return errors
+
+# ------------------------------
+# Rewrites
+# ------------------------------
+def fold_force(first, second):
+    """
+    One change_force with the effect of first followed by second, or None if there is none:
+    relative factors multiply, an absolute value scaled by a relative one stays absolute, and a
+    later absolute value overrides everything before it.
+    """
+    if second.mode == "absolute":
+        return second
+    if first.mode == "absolute":
+        return ChangeForce("absolute", round(first.value * (1 + second.value), 6))
+    value = round((1 + first.value) * (1 + second.value) - 1, 6)
+    return ChangeForce("relative", value) if -1 <= value <= 1 else None
+
+def invalidates_detection(command):
+    """
+    Whether a detection made before command is stale after it: home() and stop() drop the
+    executor's DetectionCache and start() begins a new session. Moving to or massaging a part
+    does not move the client, so its detected coordinates stay valid, as they do in the cache.
+    """
+    return isinstance(command, (Start, Stop, Home))
+
+def _optimize_once(commands, removed):
+    result = []
+    detected = None  # part whose coordinates [x, y, z] currently holds
+    for command in commands:
+        previous = result[-1] if result else None
+        if invalidates_detection(command):
+            detected = None
+        if isinstance(command, DetectBodyPart):
+            if command.part == detected:
+                removed["repeated detect_body_part"] += 1
+                continue
+            detected = command.part
+        elif isinstance(command, ChangeForce):
+            if command.mode == "relative" and command.value == 0:
+                removed["no-op change_force"] += 1
+                continue
+            if isinstance(previous, ChangeForce):
+                folded = fold_force(previous, command)
+                if folded is not None:
+                    result[-1] = folded
+                    removed["folded change_force"] += 1
+                    continue
+        elif isinstance(command, Move) and isinstance(previous, Move):
+            # Only the last of back-to-back moves matters; [x, y, z] is unchanged by moving
+            result[-1] = command
+            removed["overridden move_to"] += 1
+            continue
+        result.append(command)
+    return result
+
+def optimize(commands):
+    """Applies the rewrites until nothing changes; returns (commands, Counter of removals per rewrite)."""
+    removed = Counter()
+    while True:
+        optimized = _optimize_once(commands, removed)
+        if optimized == commands:
+            return optimized, removed
+        commands = optimized
+
+# ------------------------------
+# Compiler entry point
+# ------------------------------
+Plan = namedtuple("Plan", ["commands", "original", "removed", "errors"])
+
+def compile_pipeline(text):
+    """Parses a model response into commands, checks it and optimizes it."""
+    original = parse_pipeline(text)
+    errors = validate(original)
+    if unparsed_text(text):
+        errors.append(f"text outside capability calls: {unparsed_text(text)[:40]!r}")
+    commands, removed = optimize(original)
+    return Plan(commands, original, removed, errors)
+
+def emit(commands, layout="lines"):
+    """Renders commands as a response in the given layout."""
+    return format_response([format_command(command) for command in commands], layout)
+
+def report(plan):
+    removed = sum(plan.removed.values())
+    details = ", ".join(f"{n} {rule}" for rule, n in plan.removed.items())
+    return f"removed {removed} of {len(plan.original)} operations" + (f" ({details})" if details else "")
+
+# ------------------------------
+# Streaming use
+# ------------------------------
+class StreamingOptimizer:
+    """
+    Applies the same rewrites to commands as they are parsed from the streamed response, for
+    IncrementalPipelineParser -> PipelineExecutor. A move_to or change_force is held back until
+    the next command shows whether it can be dropped or folded; call flush() at the end.
+    """
+    def __init__(self, on_command):
+        self.on_command = on_command
+        self.reset()
+
+    def reset(self):
+        self.pending = None
+        self.detected = None
+        self.original = []
+        self.removed = Counter()
+
+    def _emit(self, command):
+        if isinstance(command, ChangeForce) and command.mode == "relative" and command.value == 0:
+            self.removed["no-op change_force"] += 1
+        elif command is not None:
+            self.on_command(command)
+
+    def feed(self, command):
+        self.original.append(command)
+        pending = self.pending
+        if invalidates_detection(command):
+            self.detected = None
+        if isinstance(command, DetectBodyPart):
+            if command.part == self.detected:
+                self.removed["repeated detect_body_part"] += 1
+                return
+            self.detected = command.part
+        elif isinstance(command, ChangeForce):
+            if command.mode == "relative" and command.value == 0:
+                self.removed["no-op change_force"] += 1
+                return
+            if isinstance(pending, ChangeForce):
+                folded = fold_force(pending, command)
+                if folded is not None:
+                    self.pending = folded
+                    self.removed["folded change_force"] += 1
+                    return
+        elif isinstance(command, Move) and isinstance(pending, Move):
+            self.pending = command
+            self.removed["overridden move_to"] += 1
+            return
+        self._emit(pending)
+        self.pending = None
+        if isinstance(command, (Move, ChangeForce)):
+            self.pending = command
+        else:
+            self._emit(command)
+
+    def flush(self):
+        self._emit(self.pending)
+        self.pending = None
+
+    @property
+    def plan(self):
+        return Plan(None, self.original, self.removed, validate(self.original))
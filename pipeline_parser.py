@@ -0,0 +1,80 @@
+import re
+from collections import namedtuple
+
+# ------------------------------
+# Typed pipeline commands
+# ------------------------------
+Start = namedtuple("Start", [])
+Stop = namedtuple("Stop", [])
+Home = namedtuple("Home", [])
+DetectBodyPart = namedtuple("DetectBodyPart", ["part"])
+Move = namedtuple("Move", ["coords"])  # coords is None for move_to([x, y, z]) after a detection
+ChangeForce = namedtuple("ChangeForce", ["mode", "value"])
+AutomaticMassage = namedtuple("AutomaticMassage", ["part"])
+
+# One complete capability call. A call only matches once its closing parenthesis has been generated,
+# so matching the growing response never yields a half-generated command.
+CALL = re.compile(
+    r"(?:\[x, y, z\] = )?detect_body_part\('(?P<detect>[^']+)'\)"
+    r"|move_to\(\[(?P<move>[^\]]*)\]\)"
+    r"|change_force\('(?P<mode>absolute|relative)', (?P<value>-?\d+(?:\.\d+)?)\)"
+    r"|automatic_massage\('(?P<massage>[^']+)'\)"
+    r"|(?P<simple>start|stop|home)\(\)"
+)
+
+def command_from_match(match):
+    if match.group("detect") is not None:
+        return DetectBodyPart(match.group("detect"))
+    if match.group("move") is not None:
+        args = [arg.strip() for arg in match.group("move").split(",")]
+        if args == ["x", "y", "z"]:
+            return Move(None)
+        return Move(tuple(int(float(arg)) for arg in args))
+    if match.group("mode") is not None:
+        return ChangeForce(match.group("mode"), float(match.group("value")))
+    if match.group("massage") is not None:
+        return AutomaticMassage(match.group("massage"))
+    return {"start": Start, "stop": Stop, "home": Home}[match.group("simple")]()
+
+def format_command(command):
+    """The pipeline line for a command (inverse of command_from_match)."""
+    if isinstance(command, DetectBodyPart):
+        return f"[x, y, z] = detect_body_part('{command.part}')"
+    if isinstance(command, Move):
+        return "move_to([x, y, z])" if command.coords is None else f"move_to({list(command.coords)})"
+    if isinstance(command, ChangeForce):
+        return f"change_force('{command.mode}', {command.value})"
+    if isinstance(command, AutomaticMassage):
+        return f"automatic_massage('{command.part}')"
+    return f"{type(command).__name__.lower()}()"
+
+def parse_pipeline(text):
+    """Parses a complete response (one call per line, or a Python list of calls) into commands."""
+    return [command_from_match(match) for match in CALL.finditer(text)]
+
+# ------------------------------
+# Incremental parser for streamed output
+# ------------------------------
+class IncrementalPipelineParser:
+    """
+    Consumes the response text as it is streamed and calls on_command(command) as soon as each
+    capability call is complete, while the model is still generating the rest of the pipeline.
+    """
+    def __init__(self, on_command):
+        self.on_command = on_command
+        self.pending = ""  # text after the last complete call
+        self.commands = []
+
+    def feed(self, text):
+        self.pending += text
+        consumed = 0
+        for match in CALL.finditer(self.pending):
+            command = command_from_match(match)
+            self.commands.append(command)
+            consumed = match.end()
+            self.on_command(command)
+        self.pending = self.pending[consumed:]
+
+    def reset(self):
+        self.pending = ""
+        self.commands = []
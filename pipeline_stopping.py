@@ -0,0 +1,87 @@
+import re
+
+import torch
+from transformers import StoppingCriteria
+
+from pipeline_grammar import PipelineGrammar
+
+# ------------------------------
+# Helpers
+# ------------------------------
+SECTION_MARKER = "###"
+CAPABILITY_CALL = re.compile(r"\b(?:start|stop|home|detect_body_part|move_to|change_force|automatic_massage)\(")
+# Commands are joined with "; " (create_context_dataset.py) or "; then " (create_dataset.py)
+CONNECTOR = re.compile(r";\s*(?:then\b)?|\bthen\b", re.IGNORECASE)
+# The longest expansion of a single command: detect_body_part, move_to, automatic_massage
+MAX_CALLS_PER_COMMAND = 3
+
+def max_commands_for_input(user_input):
+    """
+    Upper bound on the number of capability calls a user utterance can justify:
+    every clause separated by a connector is one command of at most MAX_CALLS_PER_COMMAND calls.
+    """
+    clauses = [part for part in CONNECTOR.split(user_input) if part.strip()]
+    return MAX_CALLS_PER_COMMAND * max(len(clauses), 1)
+
+# ------------------------------
+# Stopping criteria
+# ------------------------------
+class PipelineStoppingCriteria(StoppingCriteria):
+    """
+    Ends generation as soon as the response is structurally complete instead of running to
+    max_new_tokens:
+      - a template section marker ("###") appears,
+      - a blank line follows a valid pipeline (a newline for the single-line python_list layout),
+      - the response starts more capability calls than the user input can justify.
+    Create one per generation; prompt_length is the number of prompt tokens in input_ids.
+    """
+    def __init__(self, tokenizer, prompt_length, user_input, grammar=None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_commands = max_commands_for_input(user_input)
+        self.grammar = grammar or PipelineGrammar(layout="lines")
+        # A python_list response is a single line, so any newline after it ends the pipeline
+        self.end_of_pipeline = "\n\n" if self.grammar.layout == "lines" else "\n"
+        self.reason = None
+
+    def is_valid(self, text):
+        state = self.grammar.step(self.grammar.start, text)
+        return state is not None and state in self.grammar.accepting
+
+    def check(self, text):
+        """Returns the reason to stop for the generated text so far, or None to continue."""
+        if SECTION_MARKER in text:
+            return "section marker"
+        end = text.find(self.end_of_pipeline)
+        if end != -1 and self.is_valid(text[:end].strip()):
+            return "blank line after pipeline"
+        if len(CAPABILITY_CALL.findall(text)) > self.max_commands:
+            return "command count"
+        return None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = []
+        for row in range(input_ids.shape[0]):
+            text = self.tokenizer.decode(input_ids[row, self.prompt_length:], skip_special_tokens=True)
+            reason = self.check(text)
+            if reason is not None:
+                self.reason = reason
+            done.append(reason is not None)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def clean(self, text):
+        """Cuts whatever was generated after the pipeline was complete."""
+        text = text.split(SECTION_MARKER)[0]
+        end = text.find(self.end_of_pipeline)
+        if end != -1 and self.is_valid(text[:end].strip()):
+            text = text[:end]
+        calls = list(CAPABILITY_CALL.finditer(text))
+        if len(calls) > self.max_commands:
+            cut = calls[self.max_commands].start()
+            if self.grammar.layout == "lines":
+                # Drop the line holding the first call over the bound
+                text = text[:text.rfind("\n", 0, cut) + 1]
+            else:
+                # Drop the list item holding it and close the list
+                text = re.sub(r",\s*['\"]?(\[x, y, z\] = )?$", "", text[:cut]) + "]"
+        return text.strip()
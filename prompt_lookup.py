@@ -0,0 +1,121 @@
+import torch
+
+from kv_cache import cache_length, crop_past_key_values
+
+# ------------------------------
+# N-gram drafting
+# ------------------------------
+def find_draft(token_ids, sources=(), max_ngram_size=3, num_draft_tokens=10):
+    """
+    Looks for the most recent earlier occurrence of the last n tokens (longest n first) in
+    token_ids, then in each of sources (e.g. token ids of earlier responses), and returns the
+    tokens that followed it. Returns [] if nothing matches.
+    """
+    for n in range(min(max_ngram_size, len(token_ids) - 1), 0, -1):
+        tail = token_ids[-n:]
+        # In token_ids itself the match must end before the tail does
+        for source, end in [(token_ids, len(token_ids) - 1)] + [(s, len(s)) for s in sources]:
+            for start in range(end - n, -1, -1):
+                if source[start:start + n] == tail:
+                    draft = source[start + n:start + n + num_draft_tokens]
+                    if draft:
+                        return draft
+    return []
+
+# ------------------------------
+# Draft-and-verify decoding loop
+# ------------------------------
+class SpeculativeOutput:
+    """Mirrors the fields of generate(return_dict_in_generate=True) that the chat scripts use, plus statistics."""
+    def __init__(self, sequences, past_key_values, num_forward_passes, num_forced_tokens, num_drafted, num_accepted):
+        self.sequences = sequences
+        self.past_key_values = past_key_values
+        self.num_forward_passes = num_forward_passes
+        self.num_forced_tokens = num_forced_tokens
+        self.num_drafted = num_drafted
+        self.num_accepted = num_accepted
+
+    @property
+    def acceptance_rate(self):
+        return self.num_accepted / self.num_drafted if self.num_drafted else 0.0
+
+
+def speculative_generate(model, input_ids, attention_mask, past_key_values=None, streamer=None,
+                         max_new_tokens=150, stopping_criteria=None, eos_token_id=None,
+                         grammar_index=None, sources=(), num_draft_tokens=10, max_ngram_size=3):
+    """
+    Greedy prompt-lookup decoding (batch size 1). Each step drafts up to num_draft_tokens tokens by
+    n-gram matching against the prompt (which holds the conversation history), the response so far
+    and sources, then scores all of them in one forward pass. Drafted tokens are kept while they
+    equal the model's own greedy choice, plus one corrected token, so the output is identical to
+    plain greedy decoding. Rejected positions are cropped from the KV cache.
+
+    With grammar_index (pipeline_grammar.GrammarTokenIndex) every position is verified against
+    the grammar mask and forced spans are appended without a forward pass, as in constrained_generate.
+    """
+    eos_token_ids = list(eos_token_id) if isinstance(eos_token_id, (list, tuple)) else [eos_token_id]
+    if streamer is not None:
+        streamer.put(input_ids.cpu())
+
+    tokens = input_ids[0].tolist()
+    prompt_length = len(tokens)
+    cached = cache_length(past_key_values)
+    state = grammar_index.grammar.start if grammar_index is not None else None
+    forward_passes = forced_tokens = drafted = accepted = 0
+    finished = False
+
+    with torch.no_grad():
+        while not finished and len(tokens) - prompt_length < max_new_tokens:
+            budget = max_new_tokens - (len(tokens) - prompt_length)
+            draft = find_draft(tokens, sources, max_ngram_size, min(num_draft_tokens, budget - 1))
+            pending = tokens[cached:]
+            feed = torch.tensor([pending + draft], dtype=input_ids.dtype, device=input_ids.device)
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((1, cached + feed.shape[1] - attention_mask.shape[1]))], dim=1)
+            outputs = model(input_ids=feed, attention_mask=attention_mask, past_key_values=past_key_values, use_cache=True)
+            forward_passes += 1
+            past_key_values = outputs.past_key_values
+            logits = outputs.logits[0, len(pending) - 1:, :].float()
+
+            new_tokens = []
+            for i in range(len(draft) + 1):
+                scores = logits[i]
+                if state is not None:
+                    scores = scores + grammar_index.mask(state, eos_token_ids, scores.shape[-1], scores.device)
+                token_id = int(scores.argmax())
+                new_tokens.append(token_id)
+                if token_id in eos_token_ids:
+                    finished = True
+                    break
+                if state is not None:
+                    state = grammar_index.allowed(state).get(token_id)
+                if i == len(draft) or token_id != draft[i]:
+                    break
+            drafted += len(draft)
+            num_accepted = len(new_tokens) - 1
+            accepted += num_accepted
+
+            # Everything up to the last accepted draft token is now in the cache; drop the rejected rest
+            cached = len(tokens) + num_accepted
+            if cache_length(past_key_values) > cached:
+                past_key_values = crop_past_key_values(past_key_values, cached)
+            attention_mask = attention_mask[:, :cached]
+
+            if not finished and state is not None:
+                forced = grammar_index.forced_tokens(state)[:max(budget - len(new_tokens), 0)]
+                for token_id in forced:
+                    state = grammar_index.allowed(state).get(token_id)
+                new_tokens += forced
+                forced_tokens += len(forced)
+
+            new_tokens = new_tokens[:budget]
+            tokens += new_tokens
+            if streamer is not None:
+                streamer.put(torch.tensor(new_tokens))
+            sequences = torch.tensor([tokens], dtype=input_ids.dtype, device=input_ids.device)
+            if stopping_criteria is not None and bool(stopping_criteria(sequences, None).all()):
+                break
+
+    if streamer is not None:
+        streamer.end()
+    sequences = torch.tensor([tokens], dtype=input_ids.dtype, device=input_ids.device)
+    return SpeculativeOutput(sequences, past_key_values, forward_passes, forced_tokens, drafted, accepted)
@@ -1,9 +1,18 @@
 import os
+import time
 os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "0"
 os.environ["HF_HUB_DISABLE_PROGRESS_BAR"] = "0"
 
 from unsloth import FastLanguageModel
-from transformers import TextStreamer
+from transformers import StoppingCriteriaList
+
+from pipeline_grammar import PipelineGrammar, GrammarTokenIndex, PipelineGrammarLogitsProcessor, constrained_generate
+from pipeline_stopping import PipelineStoppingCriteria
+from text_streaming import CapturingTextStreamer
+from prompt_lookup import speculative_generate
+from conversation import train_prompt_style
+from rule_parser import RuleBasedParser
+from semantic_cache import SentenceEncoder, SemanticCache
 
 # ---------------------------
 # 1. Load your model/tokenizer
@@ -11,6 +20,13 @@ from transformers import TextStreamer
 max_seq_length = 2048
 dtype = None
 load_in_4bit = True
+use_grammar_constraints = True  # Only decode valid pipelines and fast-forward over forced tokens
+use_structural_stop = True  # Stop as soon as the pipeline is complete instead of at max_new_tokens
+use_prompt_lookup = True  # Draft tokens from n-gram matches in the prompt/earlier responses and verify them in one pass
+use_rule_parser = True  # Answer templated commands with the deterministic parser instead of the model
+use_semantic_cache = True  # Answer paraphrases of earlier inputs from a nearest-neighbour index
+semantic_cache_threshold = 0.9  # Minimum cosine similarity for a semantic hit
+semantic_cache_seed = "datasets/massage_robot_dataset_v2.json"  # None starts with an empty index
 
 model, tokenizer = FastLanguageModel.from_pretrained(
     model_name="novak247/massage_assistant_v1_lora",  # or whatever model you trained
@@ -21,42 +37,31 @@ model, tokenizer = FastLanguageModel.from_pretrained(
 FastLanguageModel.for_inference(model)  # Enable faster inference
 
 # ---------------------------
-# 2. Define any prompt style or instructions you want to prepend
-#    (Optional: if you want the model to follow some format)
-# ---------------------------
-train_prompt_style = """Below is an instruction that describes a task for a massage robot, paired with an input that provides further context.
-Write a response that generates an executable pipeline in Python using only the provided functions.
-Before answering, analyze the task carefully and generate a clear sequence of commands.
-
-### Instruction:
-You are provided with high-level instructions for operating a massage robot. Create an executable pipeline in Python that structures task execution through a sub-task pipeline. This pipeline should be composed exclusively of the functions listed below in the Capabilities section, arranged in a logical and correct order so that it can be directly executed. Your response should only consist of the pipeline without additional information.
-
-Capabilities:
-    start() → Initializes the robot.
-    stop() → Stops the robot.
-    home() → Moves the robot to the home position.
-    [x, y, z] = detect_body_part(part_name) → Detects the specified body part and returns the coordinates.
-    move_to([x, y, z]) → Moves the robot to the specified coordinates.
-    change_force(mode, value) → Adjusts the massage force based on the specified mode:
-        - If mode is 'absolute', then value is any real number, setting the force directly.
-        - If mode is 'relative', then value is between -1 and 1, modifying the current force F as:
-          F_new = (1 + value) * F
-    automatic_massage(part_name) → Automatically massages the specified body part.
-
-### Question:
-{}
-
-### Response:
-{}"""
-
-# ---------------------------
-# 3. Create a function to interact in real time
+# 2. Create a function to interact in real time
 # ---------------------------
 def chat_loop():
     """
     Runs an infinite loop in the terminal to chat with the model in real-time.
     Type 'exit' or 'quit' to stop, or press Ctrl+D to exit.
     """
+    # The v1 model was trained on single calls and Python lists of calls (create_dataset.py)
+    grammar = PipelineGrammar(layout="python_list")
+    grammar_index = None
+    grammar_processor = None
+    if use_grammar_constraints:
+        print("Indexing the vocabulary for grammar-constrained decoding...")
+        grammar_index = GrammarTokenIndex(tokenizer, grammar)
+        grammar_processor = PipelineGrammarLogitsProcessor(grammar_index, tokenizer.eos_token_id)
+    # This model sees no history, so earlier responses are kept as extra n-gram sources
+    previous_responses = []
+    rule_parser = RuleBasedParser() if use_rule_parser else None
+    semantic_cache = None
+    if use_semantic_cache:
+        print("Building the semantic cache index...")
+        semantic_cache = SemanticCache(SentenceEncoder(), threshold=semantic_cache_threshold)
+        if semantic_cache_seed is not None:
+            semantic_cache.seed_from_dataset(semantic_cache_seed, layout=grammar.layout)
+
     while True:
         try:
             user_input = input("\nUser: ")
@@ -68,33 +73,99 @@ def chat_loop():
             print("Exiting chat...")
             break
 
+        if rule_parser is not None:
+            response = rule_parser.respond(user_input, layout=grammar.layout)
+            if response is not None:
+                print("Assistant:" + response)
+                print("[rule parser] answered without the model")
+                continue
+        if semantic_cache is not None:
+            response, similarity = semantic_cache.lookup(user_input)
+            stats = semantic_cache.stats()
+            if response is not None:
+                print("Assistant:" + response)
+                print(f"[semantic cache] similarity {similarity:.3f}; hit rate {stats['hit_rate']:.0%}, "
+                      f"mean lookup {stats['mean_lookup_ms']:.1f} ms, {stats['index_mb']:.1f} MB")
+                continue
+
         # Format your prompt as needed. For example:
         prompt = train_prompt_style.format(user_input, "")
 
         # Tokenize
-        inputs = tokenizer([prompt], return_tensors="pt").to("cuda")
+        inputs = tokenizer([prompt], return_tensors="pt").to(model.device)
 
         # Create a streamer for real-time output
-        text_streamer = TextStreamer(
+        text_streamer = CapturingTextStreamer(
             tokenizer, 
             skip_prompt=True,
             skip_special_tokens=True
         )
 
+        stopping_criteria = None
+        if use_structural_stop:
+            stopping_criteria = PipelineStoppingCriteria(tokenizer, inputs.input_ids.shape[1], user_input, grammar)
+
         print("Assistant:", end="", flush=True)
 
         # Generate and stream output
-        _ = model.generate(
-            input_ids=inputs.input_ids,
-            attention_mask=inputs.attention_mask,
-            streamer=text_streamer,
-            max_new_tokens=100,
-            pad_token_id=tokenizer.eos_token_id
-        )
+        generation_start = time.perf_counter()
+        if use_prompt_lookup:
+            outputs = speculative_generate(
+                model, inputs.input_ids, inputs.attention_mask,
+                streamer=text_streamer,
+                max_new_tokens=100,
+                stopping_criteria=stopping_criteria,
+                eos_token_id=tokenizer.eos_token_id,
+                grammar_index=grammar_index,
+                sources=previous_responses
+            )
+            sequences = outputs.sequences
+        elif grammar_processor is not None:
+            outputs = constrained_generate(
+                model, inputs.input_ids, inputs.attention_mask, grammar_processor,
+                streamer=text_streamer,
+                max_new_tokens=100,
+                stopping_criteria=stopping_criteria
+            )
+            sequences = outputs.sequences
+        else:
+            sequences = model.generate(
+                input_ids=inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                streamer=text_streamer,
+                max_new_tokens=100,
+                stopping_criteria=StoppingCriteriaList([stopping_criteria]) if stopping_criteria is not None else None,
+                pad_token_id=tokenizer.eos_token_id
+            )
+        generation_time = time.perf_counter() - generation_start
+        print()
+
+        # Wall clock including prefill; compare runs with use_prompt_lookup on and off, since
+        # tokens per forward pass ignores that verifying a draft costs more than one decode step
+        num_new_tokens = sequences.shape[1] - inputs.input_ids.shape[1]
+        print(f"[timing] {num_new_tokens} tokens in {generation_time * 1000:.0f} ms "
+              f"({num_new_tokens / max(generation_time, 1e-9):.1f} tokens/s)")
+        if use_prompt_lookup:
+            print(f"[lookup] drafted {outputs.num_drafted}, accepted {outputs.num_accepted} "
+                  f"({outputs.acceptance_rate:.0%}); {num_new_tokens} tokens in {outputs.num_forward_passes} "
+                  f"forward passes ({num_new_tokens / max(outputs.num_forward_passes, 1):.2f} tokens/forward pass), "
+                  f"{outputs.num_forced_tokens} forced")
+            previous_responses = [sequences[0, inputs.input_ids.shape[1]:].tolist()] + previous_responses[:9]
+        elif grammar_processor is not None:
+            print(f"[grammar] {num_new_tokens} tokens in {outputs.num_forward_passes} forward passes "
+                  f"({outputs.num_forced_tokens} forced)")
+        if stopping_criteria is not None and stopping_criteria.reason is not None:
+            print(f"[stop] ended early on {stopping_criteria.reason}")
+        if semantic_cache is not None:
+            response = text_streamer.generated_text.strip()
+            if stopping_criteria is not None:
+                response = stopping_criteria.clean(response)
+            if grammar.step(grammar.start, response) in grammar.accepting:
+                semantic_cache.add(user_input, response)
 
 
 # ---------------------------
-# 4. Run the chat loop if the script is executed directly
+# 3. Run the chat loop if the script is executed directly
 # ---------------------------
 if __name__ == "__main__":
     chat_loop()
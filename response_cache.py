@@ -0,0 +1,114 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+# ---------------------------
+# 1. Normalization
+# ---------------------------
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?]+$")
+
+def normalize_text(text):
+    """
+    Undoes the variation create_context_dataset.py adds to otherwise identical commands:
+    case (randomize_case), trailing '.', '!', '...' (maybe_add_ending) and whitespace.
+    Applied per line, so every turn of a history is normalized the same way.
+    """
+    lines = []
+    for line in text.strip().splitlines():
+        line = _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", line.strip().lower()))
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+def cache_key(history_text, user_input):
+    return normalize_text(history_text) + "\n### " + normalize_text(user_input)
+
+# ---------------------------
+# 2. LRU cache with TTL
+# ---------------------------
+class ResponseCache:
+    """
+    Exact-match cache of generated pipelines keyed on the normalized (trimmed history, user input).
+
+    Entries are kept in least-recently-used order; the oldest one is evicted once max_size is
+    exceeded, and entries older than ttl seconds (None = never) are dropped when looked up.
+    With a path, the cache is loaded from that JSON file on creation and written back by save(),
+    so it survives restarts. Timestamps are wall-clock (time.time()) for the same reason.
+    """
+    def __init__(self, max_size=1024, ttl=24 * 3600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (response, created_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, history_text, user_input):
+        """Returns the cached response or None."""
+        key = cache_key(history_text, user_input)
+        entry = self.entries.get(key)
+        if entry is not None and self._expired(entry[1], time.time()):
+            del self.entries[key]
+            self.evictions += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, history_text, user_input, response):
+        key = cache_key(history_text, user_input)
+        self.entries[key] = (response, time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    # ---------------------------
+    # 3. Persistence
+    # ---------------------------
+    def save(self, path=None):
+        """Writes the live entries (oldest first) to path atomically."""
+        path = path or self.path
+        now = time.time()
+        entries = [[key, response, created_at] for key, (response, created_at) in self.entries.items()
+                   if not self._expired(created_at, now)]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        now = time.time()
+        for key, response, created_at in entries:
+            if not self._expired(created_at, now):
+                self.entries[key] = (response, created_at)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,216 @@
+import asyncio
+import math
+import random
+import threading
+from collections import namedtuple
+
+from perception import SimulatedPerception
+from pipeline_parser import Start, Stop, Home, DetectBodyPart, Move, ChangeForce, AutomaticMassage, parse_pipeline
+
+# ------------------------------
+# Timing model
+# ------------------------------
+class Latency:
+    """
+    Duration distribution of one capability in seconds: "constant", "uniform" (mean +- jitter)
+    or "lognormal" (median mean, sigma jitter), never below minimum.
+    """
+    def __init__(self, mean, jitter=0.0, distribution="lognormal", minimum=0.0):
+        self.mean = mean
+        self.jitter = jitter
+        self.distribution = distribution
+        self.minimum = minimum
+
+    def sample(self, rng):
+        if self.distribution == "constant" or self.jitter == 0:
+            value = self.mean
+        elif self.distribution == "uniform":
+            value = rng.uniform(self.mean - self.jitter, self.mean + self.jitter)
+        else:
+            value = self.mean * math.exp(rng.gauss(0.0, self.jitter))
+        return max(value, self.minimum)
+
+# Rough figures for the massage robot; move_to adds distance / move_speed on top of its latency
+DEFAULT_LATENCIES = {
+    "start": Latency(0.8, 0.1),
+    "stop": Latency(0.3, 0.1),
+    "home": Latency(1.5, 0.15),
+    "detect_body_part": Latency(0.35, 0.25),
+    "move_to": Latency(0.2, 0.1),
+    "change_force": Latency(0.05, 0.2),
+    "automatic_massage": Latency(5.0, 0.05),
+}
+
+TraceEvent = namedtuple("TraceEvent", ["call", "start", "duration", "error"])
+
+# ------------------------------
+# Simulated robot
+# ------------------------------
+class SimulatedRobot:
+    """
+    The capabilities of the prompt as asyncio coroutines. Each call sleeps for a duration drawn
+    from its Latency (times time_scale, so benchmarks can run faster than real time) and is
+    recorded in trace with its start and duration on a simulated clock, so traces are
+    reproducible for a given seed whatever time_scale is. The robot keeps a position, a force and a
+    started flag and rejects calls the real controller would reject (moving before start()).
+    Body-part coordinates come from a SimulatedPerception, so they match the executor stub.
+    """
+    home_position = (0, 0, 30)
+
+    def __init__(self, latencies=None, move_speed=40.0, time_scale=1.0, seed=0, perception=None):
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.move_speed = move_speed  # coordinate units per second
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self.perception = perception or SimulatedPerception(seed=seed)
+        self.reset()
+
+    def reset(self):
+        self.started = False
+        self.position = self.home_position
+        self.force = 1.0
+        self.trace = []
+        self.clock = 0.0  # simulated seconds since reset()
+
+    async def _call(self, call, capability, extra=0.0, check=None):
+        duration = self.latencies[capability].sample(self.rng) + extra
+        start = self.clock
+        error = check() if check is not None else None
+        if error is None:
+            await asyncio.sleep(duration * self.time_scale)
+        else:
+            duration = 0.0
+        self.clock += duration
+        self.trace.append(TraceEvent(call, start, duration, error))
+        if error is not None:
+            raise RuntimeError(f"{call}: {error}")
+
+    def _requires_start(self):
+        return None if self.started else "robot is not started"
+
+    async def start(self):
+        await self._call("start()", "start")
+        self.started = True
+
+    async def stop(self):
+        await self._call("stop()", "stop")
+        self.started = False
+
+    async def home(self):
+        distance = math.dist(self.position, self.home_position)
+        await self._call("home()", "home", distance / self.move_speed, self._requires_start)
+        self.position = self.home_position
+
+    async def detect_body_part(self, part_name):
+        await self._call(f"detect_body_part('{part_name}')", "detect_body_part")
+        return list(self.perception.positions.get(part_name, [0, 0, 0]))
+
+    async def detect_body_parts(self, part_names):
+        """Several parts in one perception call: one latency plus a small per-part cost."""
+        await self._call(f"detect_body_parts({part_names})", "detect_body_part", 0.02 * (len(part_names) - 1))
+        return [list(self.perception.positions.get(part, [0, 0, 0])) for part in part_names]
+
+    async def move_to(self, coords):
+        distance = math.dist(self.position, coords)
+        await self._call(f"move_to({list(coords)})", "move_to", distance / self.move_speed, self._requires_start)
+        self.position = tuple(coords)
+
+    async def change_force(self, mode, value):
+        def check():
+            if mode == "relative" and not -1 <= value <= 1:
+                return "relative value outside [-1, 1]"
+            return self._requires_start()
+        await self._call(f"change_force('{mode}', {value})", "change_force", check=check)
+        self.force = value if mode == "absolute" else (1 + value) * self.force
+
+    async def automatic_massage(self, part_name):
+        await self._call(f"automatic_massage('{part_name}')", "automatic_massage", check=self._requires_start)
+
+    def simulated_time(self):
+        """Sum of the simulated call durations (independent of time_scale)."""
+        return sum(event.duration for event in self.trace)
+
+# ------------------------------
+# Running pipelines without exec
+# ------------------------------
+async def run_commands(robot, commands, detected=None):
+    """
+    Executes typed commands (pipeline_parser) in order. The generated text is never executed
+    as Python; only the seven capabilities can be reached. Returns the last detection.
+    """
+    for command in commands:
+        if isinstance(command, Start):
+            await robot.start()
+        elif isinstance(command, Stop):
+            await robot.stop()
+        elif isinstance(command, Home):
+            await robot.home()
+        elif isinstance(command, DetectBodyPart):
+            detected = await robot.detect_body_part(command.part)
+        elif isinstance(command, Move):
+            coords = detected if command.coords is None else command.coords
+            if coords is None:
+                raise RuntimeError("move_to([x, y, z]) before any detect_body_part")
+            await robot.move_to(coords)
+        elif isinstance(command, ChangeForce):
+            await robot.change_force(command.mode, command.value)
+        elif isinstance(command, AutomaticMassage):
+            await robot.automatic_massage(command.part)
+    return detected
+
+async def run_pipeline(robot, text):
+    """Parses a model response and runs it; returns the trace of this pipeline."""
+    first = len(robot.trace)
+    await run_commands(robot, parse_pipeline(text))
+    return robot.trace[first:]
+
+def format_trace(trace):
+    lines = []
+    for event in trace:
+        status = "" if event.error is None else f"  ERROR: {event.error}"
+        lines.append(f"{event.start * 1000:9.1f} ms  {event.duration * 1000:8.1f} ms  {event.call}{status}")
+    return "\n".join(lines)
+
+# ------------------------------
+# Blocking facade for the thread-based PipelineExecutor
+# ------------------------------
+class BlockingSimulatedRobot:
+    """
+    Exposes a SimulatedRobot through the synchronous robot interface of pipeline_executor
+    (including detect_body_parts for DetectionCache) by running its coroutines on an event loop
+    in a background thread.
+    """
+    def __init__(self, robot):
+        self.robot = robot
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def start(self):
+        self._run(self.robot.start())
+
+    def stop(self):
+        self._run(self.robot.stop())
+
+    def home(self):
+        self._run(self.robot.home())
+
+    def detect_body_part(self, part_name):
+        return self._run(self.robot.detect_body_part(part_name))
+
+    def detect_body_parts(self, part_names):
+        return self._run(self.robot.detect_body_parts(part_names))
+
+    def move_to(self, coords):
+        self._run(self.robot.move_to(coords))
+
+    def change_force(self, mode, value):
+        self._run(self.robot.change_force(mode, value))
+
+    def automatic_massage(self, part_name):
+        self._run(self.robot.automatic_massage(part_name))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
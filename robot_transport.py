@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import struct
+import time
+
+from create_dataset import body_parts
+from pipeline_parser import Start, Stop, Home, DetectBodyPart, Move, ChangeForce, AutomaticMassage, parse_pipeline
+from robot_simulator import SimulatedRobot
+
+# ------------------------------
+# Binary framing
+# ------------------------------
+# Every frame is a uint16 body length followed by the body.
+# Command body: uint32 sequence number, uint8 opcode, opcode-specific arguments:
+#   DETECT, MASSAGE         uint8 index into body_parts
+#   DETECT_NAME, ...        uint8 length + UTF-8 name (parts outside body_parts)
+#   MOVE                    3 x int16 coordinates
+#   MOVE_DETECTED           none: the controller uses its own last detection, so detect + move
+#                           can be pipelined without waiting for the coordinates
+#   FORCE                   uint8 mode (0 absolute, 1 relative) + float32 value
+#   RESET                   none: starts a new plan and clears the "skip after failure" state
+# Ack body: uint8 ACK_BATCH, uint16 count, then per command uint32 sequence number, uint8 status
+# and, for detections, 3 x int16 coordinates.
+FRAME = struct.Struct("!H")
+COMMAND = struct.Struct("!IB")
+ACK_BATCH_HEADER = struct.Struct("!BH")
+ACK = struct.Struct("!IB")
+COORDS = struct.Struct("!3h")
+FORCE = struct.Struct("!Bf")
+
+(OP_START, OP_STOP, OP_HOME, OP_DETECT, OP_DETECT_NAME, OP_MOVE, OP_MOVE_DETECTED, OP_FORCE,
+ OP_MASSAGE, OP_MASSAGE_NAME, OP_RESET) = range(11)
+ACK_BATCH = 0x80
+STATUS_OK, STATUS_FAILED, STATUS_SKIPPED = range(3)
+PART_INDEX = {part: i for i, part in enumerate(body_parts)}
+COMMAND_TYPES = {OP_START: "start", OP_STOP: "stop", OP_HOME: "home", OP_DETECT: "detect_body_part",
+                 OP_DETECT_NAME: "detect_body_part", OP_MOVE: "move_to", OP_MOVE_DETECTED: "move_to",
+                 OP_FORCE: "change_force", OP_MASSAGE: "automatic_massage", OP_MASSAGE_NAME: "automatic_massage",
+                 OP_RESET: "reset"}
+
+def _part_args(part, indexed_op, named_op):
+    if part in PART_INDEX:
+        return indexed_op, bytes([PART_INDEX[part]])
+    name = part.encode("utf-8")[:255]
+    return named_op, bytes([len(name)]) + name
+
+def encode_command(seq, command):
+    """One frame for a typed command (pipeline_parser) or None for RESET."""
+    if command is None:
+        op, args = OP_RESET, b""
+    elif isinstance(command, Start):
+        op, args = OP_START, b""
+    elif isinstance(command, Stop):
+        op, args = OP_STOP, b""
+    elif isinstance(command, Home):
+        op, args = OP_HOME, b""
+    elif isinstance(command, DetectBodyPart):
+        op, args = _part_args(command.part, OP_DETECT, OP_DETECT_NAME)
+    elif isinstance(command, Move):
+        op, args = (OP_MOVE_DETECTED, b"") if command.coords is None else (OP_MOVE, COORDS.pack(*command.coords))
+    elif isinstance(command, ChangeForce):
+        op, args = OP_FORCE, FORCE.pack(0 if command.mode == "absolute" else 1, command.value)
+    elif isinstance(command, AutomaticMassage):
+        op, args = _part_args(command.part, OP_MASSAGE, OP_MASSAGE_NAME)
+    else:
+        raise ValueError(f"Unknown command: {command!r}")
+    body = COMMAND.pack(seq, op) + args
+    return FRAME.pack(len(body)) + body
+
+def decode_command(body):
+    """(seq, opcode, command) for a command frame body; command is None for RESET."""
+    seq, op = COMMAND.unpack_from(body)
+    args = body[COMMAND.size:]
+    if op in (OP_DETECT, OP_MASSAGE):
+        part = body_parts[args[0]]
+    elif op in (OP_DETECT_NAME, OP_MASSAGE_NAME):
+        part = args[1:1 + args[0]].decode("utf-8")
+    if op == OP_START:
+        command = Start()
+    elif op == OP_STOP:
+        command = Stop()
+    elif op == OP_HOME:
+        command = Home()
+    elif op in (OP_DETECT, OP_DETECT_NAME):
+        command = DetectBodyPart(part)
+    elif op == OP_MOVE:
+        command = Move(COORDS.unpack(args))
+    elif op == OP_MOVE_DETECTED:
+        command = Move(None)
+    elif op == OP_FORCE:
+        mode, value = FORCE.unpack(args)
+        command = ChangeForce("absolute" if mode == 0 else "relative", round(value, 6))
+    elif op in (OP_MASSAGE, OP_MASSAGE_NAME):
+        command = AutomaticMassage(part)
+    elif op == OP_RESET:
+        command = None
+    else:
+        raise ValueError(f"Unknown opcode {op}")
+    return seq, op, command
+
+def encode_acks(acks):
+    """One frame acknowledging (seq, status, coords or None) entries."""
+    body = bytearray(ACK_BATCH_HEADER.pack(ACK_BATCH, len(acks)))
+    for seq, status, coords in acks:
+        body += ACK.pack(seq, status | (0x80 if coords is not None else 0))
+        if coords is not None:
+            body += COORDS.pack(*[int(round(c)) for c in coords])
+    return FRAME.pack(len(body)) + bytes(body)
+
+def decode_acks(body):
+    _, count = ACK_BATCH_HEADER.unpack_from(body)
+    offset = ACK_BATCH_HEADER.size
+    acks = []
+    for _ in range(count):
+        seq, status = ACK.unpack_from(body, offset)
+        offset += ACK.size
+        coords = None
+        if status & 0x80:
+            coords = list(COORDS.unpack_from(body, offset))
+            offset += COORDS.size
+        acks.append((seq, status & 0x7F, coords))
+    return acks
+
+async def read_frame(reader):
+    (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(length)
+
+async def open_connection(address):
+    """address is a Unix socket path or "host:port"."""
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+# ------------------------------
+# Local stand-in for the robot controller
+# ------------------------------
+class StandInController:
+    """
+    Executes incoming commands in order on a SimulatedRobot and acknowledges them in batches:
+    acks are flushed whenever no further command is waiting or max_ack_batch are pending.
+    link_delay (seconds, each direction) emulates the network between the PC and the controller.
+    After a failed command, the rest of the plan is skipped until the next RESET.
+    """
+    def __init__(self, robot=None, max_ack_batch=32, link_delay=0.0):
+        self.robot = robot or SimulatedRobot(time_scale=0.0)
+        self.max_ack_batch = max_ack_batch
+        self.link_delay = link_delay
+        self.server = None
+        self.connections = set()
+
+    async def serve(self, address):
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            self.server = await asyncio.start_server(self._handle, host, int(port))
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = await asyncio.start_unix_server(self._handle, address)
+        return self.server
+
+    async def close(self):
+        """Stops accepting connections and waits for the open ones to drain."""
+        self.server.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def _deliver(self, queue, body):
+        await asyncio.sleep(self.link_delay)
+        await queue.put(body)
+
+    async def _send(self, writer, acks):
+        frame = encode_acks(acks)
+        await asyncio.sleep(self.link_delay)
+        writer.write(frame)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections.add(asyncio.current_task())
+        incoming = asyncio.Queue()
+        deliveries = []
+
+        async def receive():
+            try:
+                while True:
+                    body = await read_frame(reader)
+                    deliveries.append(asyncio.create_task(self._deliver(incoming, body)))
+            except (asyncio.IncompleteReadError, ConnectionResetError):
+                await asyncio.gather(*deliveries)
+                await incoming.put(None)
+
+        receiver = asyncio.create_task(receive())
+        pending_acks, sends = [], []
+        detected, failed = None, False
+        while True:
+            body = await incoming.get()
+            if body is None:
+                break
+            seq, op, command = decode_command(body)
+            coords, status = None, STATUS_OK
+            if command is None:
+                failed = False
+            elif failed:
+                status = STATUS_SKIPPED
+            else:
+                try:
+                    if isinstance(command, DetectBodyPart):
+                        detected = coords = await self.robot.detect_body_part(command.part)
+                    elif isinstance(command, Move):
+                        target = detected if command.coords is None else command.coords
+                        if target is None:
+                            raise RuntimeError("move_to([x, y, z]) before any detect_body_part")
+                        await self.robot.move_to(target)
+                    elif isinstance(command, ChangeForce):
+                        await self.robot.change_force(command.mode, command.value)
+                    elif isinstance(command, AutomaticMassage):
+                        await self.robot.automatic_massage(command.part)
+                    else:
+                        await getattr(self.robot, type(command).__name__.lower())()
+                except RuntimeError:
+                    status, failed = STATUS_FAILED, True
+            pending_acks.append((seq, status, coords))
+            if incoming.empty() or len(pending_acks) >= self.max_ack_batch:
+                sends.append(asyncio.create_task(self._send(writer, pending_acks)))
+                pending_acks = []
+        receiver.cancel()
+        await asyncio.gather(*sends, return_exceptions=True)
+        writer.close()
+        self.connections.discard(asyncio.current_task())
+
+# ------------------------------
+# Client
+# ------------------------------
+class RobotTransportClient:
+    """
+    Persistent connection to the controller. execute() writes a whole plan in one go (commands
+    are pipelined, not sent one at a time after each ack) and resolves one future per command
+    from the batched acks. Latencies from send to ack are kept per command type. When the
+    connection drops, every outstanding command fails with ConnectionError.
+    """
+    def __init__(self, address):
+        self.address = address
+        self.reader = self.writer = None
+        self.reader_task = None
+        self.seq = 0
+        self.waiting = {}  # seq -> (future, command type, send time)
+        self.latencies = {}  # command type -> [seconds]
+        self.completed = 0
+        self.busy_time = 0.0
+
+    async def connect(self):
+        self.reader, self.writer = await open_connection(self.address)
+        self.reader_task = asyncio.create_task(self._read_acks())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.reader_task.cancel()
+
+    async def _read_acks(self):
+        try:
+            while True:
+                body = await read_frame(self.reader)
+                now = time.perf_counter()
+                for seq, status, coords in decode_acks(body):
+                    future, kind, sent = self.waiting.pop(seq)
+                    if kind != "reset":
+                        self.latencies.setdefault(kind, []).append(now - sent)
+                        self.completed += 1
+                    future.set_result((status, coords))
+        finally:
+            # No acks will arrive any more: closed, cancelled or a malformed frame
+            for future, _, _ in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection to the robot controller closed"))
+            self.waiting.clear()
+
+    def _frame(self, command):
+        if self.reader_task is None or self.reader_task.done():
+            raise ConnectionError("not connected to the robot controller")
+        self.seq = (self.seq + 1) % 2**32
+        future = asyncio.get_running_loop().create_future()
+        kind = "reset" if command is None else type(command).__name__
+        self.waiting[self.seq] = (future, kind, time.perf_counter())
+        return encode_command(self.seq, command), future
+
+    async def execute(self, commands, pipelined=True):
+        """
+        Runs a plan; returns [(status, coordinates or None)] per command. With pipelined=False,
+        every command waits for its ack before the next is sent (the stop-and-wait baseline).
+        """
+        begin = time.perf_counter()
+        frames = [self._frame(command) for command in [None, *commands]]
+        if pipelined:
+            self.writer.write(b"".join(frame for frame, _ in frames))
+            await self.writer.drain()
+            results = await asyncio.gather(*[future for _, future in frames])
+        else:
+            results = []
+            for frame, future in frames:
+                self.writer.write(frame)
+                await self.writer.drain()
+                results.append(await future)
+        self.busy_time += time.perf_counter() - begin
+        return results[1:]
+
+    def stats(self):
+        return {
+            "commands_per_second": self.completed / self.busy_time if self.busy_time else 0.0,
+            "latency_ms": {
+                kind: {"p50": statistics.median(values) * 1000,
+                       "p95": sorted(values)[int(0.95 * (len(values) - 1))] * 1000,
+                       "max": max(values) * 1000, "count": len(values)}
+                for kind, values in sorted(self.latencies.items())
+            },
+        }
+
+# ------------------------------
+# Benchmark against the stand-in
+# ------------------------------
+async def benchmark(address, plans, link_delay, time_scale):
+    for pipelined in (False, True):
+        controller = StandInController(SimulatedRobot(time_scale=time_scale), link_delay=link_delay)
+        await controller.serve(address)
+        client = RobotTransportClient(address)
+        await client.connect()
+        for plan in plans:
+            await client.execute([Start(), *plan], pipelined=pipelined)
+        await client.close()
+        await controller.close()
+        stats = client.stats()
+        print(f"\n--- {'pipelined' if pipelined else 'stop-and-wait'} ---")
+        print(f"Commands/s: {stats['commands_per_second']:.1f}")
+        for kind, latency in stats["latency_ms"].items():
+            print(f"  {kind:<16} p50 {latency['p50']:7.2f} ms  p95 {latency['p95']:7.2f} ms  "
+                  f"max {latency['max']:7.2f} ms  ({latency['count']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the command transport against the local stand-in controller.")
+    parser.add_argument("--address", default="/tmp/massage_robot.sock", help="Unix socket path or host:port")
+    parser.add_argument("--dataset", default="datasets/massage_robot_dataset_v2.json")
+    parser.add_argument("--plans", default=200, type=int)
+    parser.add_argument("--link_delay", default=0.002, type=float, help="One-way network delay in seconds")
+    parser.add_argument("--time_scale", default=0.0, type=float, help="Fraction of simulated robot time actually slept")
+    args = parser.parse_args()
+
+    with open(args.dataset, "r", encoding="utf-8") as f:
+        samples = json.load(f)[:args.plans]
+    plans = [parse_pipeline("\n".join(s["response"]) if isinstance(s["response"], list) else s["response"])
+             for s in samples]
+    asyncio.run(benchmark(args.address, plans, args.link_delay, args.time_scale))
+
+if __name__ == "__main__":
+    main()
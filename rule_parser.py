@@ -0,0 +1,133 @@
+import re
+from collections import namedtuple
+
+import create_dataset as tables
+from response_cache import normalize_text
+
+# ------------------------------
+# Pattern building from the dataset generator's tables
+# ------------------------------
+# Commands are joined with "; " (create_context_dataset.py) or "; then " (create_dataset.py)
+CLAUSE_SEPARATOR = re.compile(r";\s*(?:then\b)?")
+
+def _alternation(options, name=None):
+    """Regex matching any of options (normalized), longest first so "power on" wins over a shorter prefix."""
+    body = "|".join(re.escape(normalize_text(option)) for option in sorted(options, key=len, reverse=True))
+    return f"(?P<{name}>{body})" if name else f"(?:{body})"
+
+def _compile(template, fields):
+    """Turns a template such as "Please {syn_lower} my {bp}" into a full-match regex over normalized text."""
+    parts = re.split(r"(\{\w+\})", normalize_text(template))
+    return re.compile("".join(fields[part[1:-1]] if part.startswith("{") else re.escape(part) for part in parts) + "$")
+
+BODY_PART = _alternation(tables.body_parts, "bp")
+COORDS = r"\[\s*(?P<x>-?\d+)\s*,\s*(?P<y>-?\d+)\s*,\s*(?P<z>-?\d+)\s*\]"
+PERCENT = r"(?P<perc>\d+(?:\.\d+)?)"
+FORCE_NOUN = _alternation(tables.force_nouns)
+
+def _fields(synonyms, verb=False):
+    syn = _alternation(synonyms, "verb" if verb else None)
+    key = "verb" if verb else "syn"
+    return {key: syn, key + "_lower": syn, "bp": BODY_PART, "coords": COORDS, "perc": PERCENT, "noun": FORCE_NOUN}
+
+DECREASE_VERBS = {normalize_text(verb) for verb in tables.decrease_synonyms}
+
+def _relative_force(match, layout):
+    value = float(match.group("perc")) / 100.0
+    if match.group("verb") in DECREASE_VERBS:
+        value = -value
+    return [f"change_force('relative', {value})"]
+
+def _automatic_massage(match, layout):
+    # The context model detects and moves first; the v1 model (python_list, massage_robot_dataset_v2.json) does not
+    if layout == "lines":
+        return [f"[x, y, z] = detect_body_part('{match.group('bp')}')", "move_to([x, y, z])",
+                f"automatic_massage('{match.group('bp')}')"]
+    return [f"automatic_massage('{match.group('bp')}')"]
+
+# The generator writes int(value * 100) into the text but f"{value:.2f}" into the response, so the
+# percentage does not determine what the models were trained to answer; those clauses go to the model.
+UNDETERMINED = "absolute force: the trained response rounds a value the text only gives truncated"
+
+# (templates, placeholder regexes, builder(match, layout) -> pipeline lines or UNDETERMINED) for every
+# explicit command in create_dataset.py
+RULES = [
+    (tables.robot_templates, _fields(tables.start_synonyms), lambda m, layout: ["start()"]),
+    (tables.robot_templates, _fields(tables.stop_synonyms), lambda m, layout: ["stop()"]),
+    (tables.home_templates, _fields(tables.home_synonyms), lambda m, layout: ["home()"]),
+    (tables.detect_templates, _fields(tables.detect_synonyms),
+     lambda m, layout: [f"[x, y, z] = detect_body_part('{m.group('bp')}')"]),
+    (tables.move_body_part_templates, _fields(tables.move_synonyms),
+     lambda m, layout: [f"[x, y, z] = detect_body_part('{m.group('bp')}')", "move_to([x, y, z])"]),
+    (tables.move_coords_templates, _fields(tables.move_synonyms),
+     lambda m, layout: [f"move_to([{int(m.group('x'))}, {int(m.group('y'))}, {int(m.group('z'))}])"]),
+    (tables.force_relative_templates, _fields(tables.increase_synonyms + tables.decrease_synonyms, verb=True),
+     _relative_force),
+    (tables.force_absolute_templates, _fields(tables.set_synonyms, verb=True), lambda m, layout: UNDETERMINED),
+    (tables.auto_massage_templates, _fields(tables.auto_massage_synonyms), _automatic_massage),
+]
+PATTERNS = [(_compile(template, fields), build) for templates, fields, build in RULES for template in templates]
+NOISE_PHRASES = [normalize_text(phrase) for phrase in tables.noise_phrases]
+
+# ------------------------------
+# Parser
+# ------------------------------
+FastPathResult = namedtuple("FastPathResult", ["lines", "confidence", "reason"])
+
+def format_response(lines, layout="lines"):
+    """Renders pipeline lines the way the model would: one per line, or a Python list (v1 model)."""
+    if layout == "lines":
+        return "\n".join(lines)
+    return lines[0] if len(lines) == 1 else str(lines)
+
+class RuleBasedParser:
+    """
+    Deterministic parser for the templated phrasing the models were trained on.
+
+    Every clause of the utterance must fully match one of the templates of create_dataset.py
+    (after the normalization of response_cache.normalize_text); the known noise phrases are
+    dropped first. The confidence is 1.0 for a clean match, lower when noise had to be removed,
+    and 0.0 when any clause is unmatched or matches commands that disagree. Context-dependent
+    input ("then neck", "increase") never matches a template, so it always goes to the LLM.
+    The pipelines follow the training data of the model that produces `layout`: "lines" for the
+    context model, "python_list" for the v1 model (datasets/massage_robot_dataset_v2.json).
+    """
+    def __init__(self, threshold=0.9, noise_penalty=0.05):
+        self.threshold = threshold
+        self.noise_penalty = noise_penalty
+
+    def parse(self, utterance, layout="lines"):
+        text = normalize_text(" ".join(utterance.split()))
+        confidence = 1.0
+        for phrase in NOISE_PHRASES:
+            if phrase in text:
+                text = text.replace(phrase, "")
+                confidence -= self.noise_penalty
+
+        lines = []
+        for clause in CLAUSE_SEPARATOR.split(text):
+            clause = normalize_text(clause)
+            if not clause:
+                continue
+            candidates = []
+            for pattern, build in PATTERNS:
+                match = pattern.match(clause)
+                if match is not None and build(match, layout) not in candidates:
+                    candidates.append(build(match, layout))
+            if UNDETERMINED in candidates:
+                return FastPathResult(None, 0.0, UNDETERMINED)
+            if not candidates:
+                return FastPathResult(None, 0.0, f"no template matches '{clause}'")
+            if len(candidates) > 1:
+                return FastPathResult(None, 0.0, f"'{clause}' matches {len(candidates)} different commands")
+            lines += candidates[0]
+        if not lines:
+            return FastPathResult(None, 0.0, "empty input")
+        return FastPathResult(lines, max(confidence, 0.0), None)
+
+    def respond(self, utterance, layout="lines"):
+        """The response text if the utterance parses with at least threshold confidence, else None."""
+        result = self.parse(utterance, layout)
+        if result.lines is None or result.confidence < self.threshold:
+            return None
+        return format_response(result.lines, layout)
@@ -0,0 +1,182 @@
+import json
+import re
+import time
+
+import numpy as np
+
+import create_dataset
+from create_dataset import body_parts
+from response_cache import normalize_text
+from rule_parser import format_response
+
+# ---------------------------
+# 1. Sentence encoder
+# ---------------------------
+class SentenceEncoder:
+    """Small local sentence-transformers model; embeddings are L2-normalized float32 rows."""
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", device="cpu"):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=64):
+        embeddings = self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                                       convert_to_numpy=True, show_progress_bar=False)
+        return embeddings.astype(np.float32)
+
+# ---------------------------
+# 2. Signatures that must match exactly
+# ---------------------------
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+BODY_PART = re.compile(r"\b(?:" + "|".join(sorted(body_parts, key=len, reverse=True)) + r")\b")
+
+# Verb class of every synonym in the create_dataset.py tables, plus a few everyday words of the same
+# polarity. "start"/"stop" or "increase"/"reduce" embed close together but mean opposite commands.
+VERB_CLASSES = {
+    **{syn.lower(): "auto_massage" for syn in create_dataset.auto_massage_synonyms},
+    **{syn.lower(): "start" for syn in create_dataset.start_synonyms + ["turn on", "switch on", "begin", "resume"]},
+    **{syn.lower(): "stop" for syn in create_dataset.stop_synonyms + ["switch off", "halt", "pause", "end"]},
+    **{syn.lower(): "home" for syn in create_dataset.home_synonyms + ["home"]},
+    **{syn.lower(): "detect" for syn in create_dataset.detect_synonyms},
+    **{syn.lower(): "move" for syn in create_dataset.move_synonyms + ["move"]},
+    **{syn.lower(): "increase" for syn in create_dataset.increase_synonyms + ["more", "harder", "stronger", "higher"]},
+    **{syn.lower(): "decrease" for syn in create_dataset.decrease_synonyms + ["less", "softer", "gentler", "weaker"]},
+    **{syn.lower(): "set" for syn in create_dataset.set_synonyms},
+}
+# Longest phrases first, so "return to the home position" is one home and "start automatic massage" is
+# not also a start
+VERB = re.compile(r"\b(?:" + "|".join(re.escape(phrase) for phrase in sorted(VERB_CLASSES, key=len, reverse=True)) + r")\b")
+
+def verb_signature(text):
+    """Verb classes of a normalized utterance in order; body parts are removed first ("lower back")."""
+    return tuple(VERB_CLASSES[match] for match in VERB.findall(BODY_PART.sub(" ", text)))
+
+def argument_signature(utterance):
+    """
+    Verb classes, numbers and body parts in order of appearance. Paraphrases embed close together,
+    but so do "reduce pressure by 20%" and "reduce pressure by 30%", or "start" and "stop the
+    massage", so these have to agree exactly.
+    """
+    text = normalize_text(utterance)
+    return verb_signature(text) + tuple(NUMBER.findall(text) + BODY_PART.findall(text))
+
+def history_signature(history_text):
+    """
+    The normalized last turn: what context-dependent input ("then neck", "increase") refers to.
+    Empty for no history, which is also what the dataset seeds use.
+    """
+    return normalize_text(history_text[history_text.rfind("User: "):]) if history_text.strip() else ""
+
+# ---------------------------
+# 3. Nearest-neighbour cache
+# ---------------------------
+class SemanticCache:
+    """
+    Maps (utterance, history signature) to a stored pipeline by embedding similarity.
+
+    Embeddings live in a preallocated [max_size, dim] NumPy matrix. Entries are grouped into
+    buckets by (history signature, argument signature), so a lookup is one matrix-vector product
+    over the rows of a single bucket, which stays small enough that an ANN index is unnecessary.
+    A hit needs cosine similarity >= threshold. When the matrix is full, the least recently used
+    row is overwritten.
+    """
+    def __init__(self, encoder, max_size=20000, threshold=0.9):
+        self.encoder = encoder
+        self.max_size = max_size
+        self.threshold = threshold
+        self.embeddings = np.zeros((max_size, encoder.dim), dtype=np.float32)
+        self.last_used = np.zeros(max_size, dtype=np.float64)
+        self.rows = [None] * max_size  # row -> (bucket, utterance, response)
+        self.buckets = {}  # (history signature, argument signature) -> list of rows
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_time = 0.0
+
+    def _free_row(self):
+        if self.size < self.max_size:
+            self.size += 1
+            return self.size - 1
+        row = int(self.last_used.argmin())
+        bucket = self.rows[row][0]
+        self.buckets[bucket].remove(row)
+        if not self.buckets[bucket]:
+            del self.buckets[bucket]
+        self.evictions += 1
+        return row
+
+    def add_many(self, utterances, responses, history_text=""):
+        embeddings = self.encoder.encode([normalize_text(u) for u in utterances])
+        history = history_signature(history_text)
+        now = time.monotonic()
+        for utterance, response, embedding in zip(utterances, responses, embeddings):
+            bucket = (history, argument_signature(utterance))
+            row = self._free_row()
+            self.embeddings[row] = embedding
+            self.last_used[row] = now
+            self.rows[row] = (bucket, utterance, response)
+            self.buckets.setdefault(bucket, []).append(row)
+
+    def add(self, utterance, response, history_text=""):
+        self.add_many([utterance], [response], history_text)
+
+    def lookup(self, utterance, history_text=""):
+        """Returns (response, similarity) of the best match above threshold, or (None, similarity)."""
+        start = time.perf_counter()
+        rows = self.buckets.get((history_signature(history_text), argument_signature(utterance)))
+        response, similarity = None, 0.0
+        if rows:
+            query = self.encoder.encode([normalize_text(utterance)])[0]
+            scores = self.embeddings[rows] @ query
+            best = int(scores.argmax())
+            similarity = float(scores[best])
+            if similarity >= self.threshold:
+                response = self.rows[rows[best]][2]
+                self.last_used[rows[best]] = time.monotonic()
+        self.lookup_time += time.perf_counter() - start
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response, similarity
+
+    def seed_from_dataset(self, path, layout="lines", batch_size=256):
+        """
+        Adds every single-turn (input, response) pair of a dataset. Both dataset formats are read:
+        create_context_dataset.py output (latest_user_input, responses in the lines layout; samples
+        with a conversation history are skipped) and the v1/v2 datasets such as
+        datasets/massage_robot_dataset_v2.json (input, responses in the python_list layout).
+        Responses are stored as written, so a dataset whose layout differs from layout is refused
+        instead of being served in a format the chat does not emit.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            samples = json.load(f)
+        context = bool(samples) and "latest_user_input" in samples[0]
+        dataset_layout = "lines" if context else "python_list"
+        if dataset_layout != layout:
+            raise ValueError(f"{path} has {dataset_layout} responses, not {layout}")
+        if context:
+            pairs = [(s["latest_user_input"], s["response"]) for s in samples if not s["conversation_history"].strip()]
+        else:
+            pairs = [(s["input"], format_response(s["response"] if isinstance(s["response"], list) else [s["response"]], layout))
+                     for s in samples]
+        for i in range(0, len(pairs), batch_size):
+            utterances, responses = zip(*pairs[i:i + batch_size])
+            self.add_many(list(utterances), list(responses))
+
+    def memory_bytes(self):
+        """The embedding matrix plus LRU timestamps; the Python-side metadata is not counted."""
+        return self.embeddings.nbytes + self.last_used.nbytes
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mean_lookup_ms": self.lookup_time / lookups * 1000 if lookups else 0.0,
+            "index_mb": self.memory_bytes() / 2**20,
+        }
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import re
+import statistics
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from vocabulary import DEFAULT_PATH, load_vocabulary
+
+# text, the tier that produced it ("fast" or "slow"), why the fast tier's transcript was escalated
+# (None if it was accepted) and the seconds spent in each model
+CascadeResult = namedtuple("CascadeResult", ["text", "tier", "reason", "seconds"])
+
+TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+def command_vocabulary(extra_words=(), path=DEFAULT_PATH, language=None):
+    """
+    Lower-cased words the robot commands are made of in `language` (every language of the
+    vocabulary artifact, see vocabulary.py, if None or not in it), plus extra_words, e.g.
+    hand-maintained hotwords.
+    """
+    grammar = load_vocabulary(path)["vosk_grammar"]
+    languages = [language] if language in grammar else list(grammar)
+    phrases = [word for name in languages for word in grammar[name] if word != "[unk]"]
+    return {token.lower() for phrase in phrases + list(extra_words) for token in TOKEN.findall(phrase)}
+
+class CascadeTranscriber:
+    """
+    Transcribes with a small Whisper model first and only re-runs the large one when the result
+    looks unreliable: a segment with avg_logprob below min_avg_logprob or no_speech_prob above
+    max_no_speech_prob, or fewer than min_vocabulary_ratio of the words (longer than two letters) in
+    the command vocabulary.
+    Words are matched on their first `stem_length` letters, so Czech inflections of a known word
+    count. Both models stay loaded; per-tier latencies and the escalation rate are kept.
+    """
+    def __init__(self, fast_model, slow_model, vocabulary, language="cs", hotwords=None, initial_prompt=None,
+                 min_avg_logprob=-0.7, max_no_speech_prob=0.5, min_vocabulary_ratio=0.6, stem_length=5):
+        self.models = {"fast": fast_model, "slow": slow_model}
+        self.language = language
+        self.hotwords = hotwords
+        self.initial_prompt = initial_prompt
+        self.vocabulary = set(vocabulary)
+        self.stems = {word[:stem_length] for word in self.vocabulary if len(word) >= stem_length}
+        self.stem_length = stem_length
+        self.min_avg_logprob = min_avg_logprob
+        self.max_no_speech_prob = max_no_speech_prob
+        self.min_vocabulary_ratio = min_vocabulary_ratio
+        self.latencies = {"fast": [], "slow": [], "total": []}
+        self.escalations = 0
+
+    def _run(self, tier, audio):
+        begin = time.perf_counter()
+        segments, _ = self.models[tier].transcribe(audio, language=self.language, hotwords=self.hotwords,
+                                                   initial_prompt=self.initial_prompt)
+        segments = list(segments)
+        seconds = time.perf_counter() - begin
+        self.latencies[tier].append(seconds)
+        return segments, seconds
+
+    def _known(self, word):
+        return word in self.vocabulary or word.isdigit() or word[:self.stem_length] in self.stems
+
+    def check(self, segments):
+        """Why a fast-tier transcript should be escalated, or None if it is acceptable."""
+        if not segments:
+            return "empty transcript"
+        for segment in segments:
+            if segment.avg_logprob < self.min_avg_logprob:
+                return f"avg_logprob {segment.avg_logprob:.2f}"
+            if segment.no_speech_prob > self.max_no_speech_prob:
+                return f"no_speech_prob {segment.no_speech_prob:.2f}"
+        # Short function words ("to", "na", "do") say nothing about whether the command was understood
+        words = [word for word in TOKEN.findall(" ".join(segment.text for segment in segments).lower()) if len(word) > 2]
+        if not words:
+            return "empty transcript"
+        ratio = sum(self._known(word) for word in words) / len(words)
+        if ratio < self.min_vocabulary_ratio:
+            return f"vocabulary match {ratio:.0%}"
+        return None
+
+    def transcribe(self, audio):
+        """audio: int16 samples or normalized float32. Returns a CascadeResult."""
+        if audio.dtype == np.int16:
+            audio = audio.astype(np.float32) / 32768.0
+        segments, fast_seconds = self._run("fast", audio)
+        reason = self.check(segments)
+        seconds = {"fast": fast_seconds}
+        tier = "fast"
+        if reason is not None:
+            self.escalations += 1
+            segments, seconds["slow"] = self._run("slow", audio)
+            tier = "slow"
+        self.latencies["total"].append(sum(seconds.values()))
+        text = " ".join(segment.text for segment in segments).strip()
+        return CascadeResult(text, tier, reason, seconds)
+
+    def stats(self):
+        utterances = len(self.latencies["fast"])
+        return {
+            "utterances": utterances,
+            "escalation_rate": self.escalations / utterances if utterances else 0.0,
+            **{f"{tier}_ms": {"count": len(values),
+                              "median": statistics.median(values) * 1000 if values else None,
+                              "mean": statistics.mean(values) * 1000 if values else None}
+               for tier, values in self.latencies.items()},
+        }
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+import queue
+import threading
+import time
+import wave
+
+import numpy as np
+
+from endpointer import VadEndpointer
+
+SAMPLE_RATE = 16000
+
+# ------------------------------
+# Ring buffer
+# ------------------------------
+class RingBuffer:
+    """
+    Single-producer / single-consumer ring of int16 samples. The capture thread only moves
+    `written` and the consumer only moves `read_position`, so neither side takes a lock. When the
+    consumer falls more than `capacity` samples behind, new samples are dropped (and counted in
+    `overruns`) rather than overwriting audio the consumer has not read yet.
+    """
+    def __init__(self, seconds=30.0, sample_rate=SAMPLE_RATE):
+        self.capacity = int(seconds * sample_rate)
+        self.buffer = np.zeros(self.capacity, dtype=np.int16)
+        self.written = 0
+        self.read_position = 0
+        self.overruns = 0
+
+    def available(self):
+        return self.written - self.read_position
+
+    def write(self, samples):
+        free = self.capacity - self.available()
+        if len(samples) > free:
+            self.overruns += len(samples) - free
+            samples = samples[:free]
+        start = self.written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.written += len(samples)
+
+    def read(self, count):
+        """The next `count` samples (a copy), or None until that many are available."""
+        if self.available() < count:
+            return None
+        start = self.read_position % self.capacity
+        first = min(count, self.capacity - start)
+        samples = np.concatenate((self.buffer[start:start + first], self.buffer[:count - first]))
+        self.read_position += count
+        return samples
+
+# ------------------------------
+# Capture thread
+# ------------------------------
+class MicrophoneCapture:
+    """
+    Reads 16 kHz mono int16 chunks from PyAudio in a daemon thread and writes them into a
+    RingBuffer, without ever pausing for the consumer. `start_time` and the sample count give the
+    wall-clock time of any sample (sample_time), which is how speech-end times are measured.
+    """
+    def __init__(self, ring, device_index=None, chunk_size=480, sample_rate=SAMPLE_RATE):
+        self.ring = ring
+        self.device_index = device_index
+        self.chunk_size = chunk_size
+        self.sample_rate = sample_rate
+        self.running = False
+        self.start_time = None
+
+    def start(self):
+        import pyaudio
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=self.sample_rate, input=True,
+                                      input_device_index=self.device_index, frames_per_buffer=self.chunk_size)
+        self.running = True
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            data = self.stream.read(self.chunk_size, exception_on_overflow=False)
+            self.ring.write(np.frombuffer(data, dtype=np.int16))
+
+    def sample_time(self, sample_index):
+        return self.start_time + sample_index / self.sample_rate
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
+
+class FileReplay:
+    """
+    Stand-in for MicrophoneCapture that plays a 16 kHz mono 16-bit WAV file into the ring buffer
+    at `speed` times real time, followed by `tail` seconds of silence so the last utterance ends.
+    Used to measure latencies on a fixed recording.
+    """
+    def __init__(self, ring, path, speed=1.0, tail=1.0, chunk_size=480, sample_rate=SAMPLE_RATE):
+        with wave.open(path, "rb") as f:
+            if f.getframerate() != sample_rate or f.getnchannels() != 1 or f.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected {sample_rate} Hz mono 16-bit PCM")
+            samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        self.samples = np.concatenate((samples, np.zeros(int(tail * sample_rate), dtype=np.int16)))
+        self.ring = ring
+        self.speed = speed
+        self.chunk_size = chunk_size
+        self.sample_rate = sample_rate
+        self.running = False
+        self.finished = False
+        self.start_time = None
+
+    def start(self):
+        self.running = True
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for offset in range(0, len(self.samples), self.chunk_size):
+            if not self.running:
+                break
+            # Sleep until the chunk would have been recorded
+            delay = self.sample_time(offset + self.chunk_size) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.ring.write(self.samples[offset:offset + self.chunk_size])
+        self.finished = True
+
+    def sample_time(self, sample_index):
+        return self.start_time + sample_index / self.sample_rate / self.speed
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+# ------------------------------
+# Bounded hand-off to the ASR worker
+# ------------------------------
+class UtteranceQueue:
+    """
+    queue.Queue with backpressure metrics. put() blocks while the queue is full; meanwhile the
+    capture thread keeps filling the ring buffer, so a slow ASR worker delays utterances instead
+    of losing them (until the ring buffer itself overruns).
+    """
+    def __init__(self, maxsize=4):
+        self.queue = queue.Queue(maxsize)
+        self.max_depth = 0
+        self.blocked_puts = 0
+        self.blocked_time = 0.0
+        self.puts = 0
+
+    def put(self, item):
+        if self.queue.full():
+            self.blocked_puts += 1
+            begin = time.perf_counter()
+            self.queue.put(item)
+            self.blocked_time += time.perf_counter() - begin
+        else:
+            self.queue.put(item)
+        self.puts += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def stats(self):
+        return {"depth": self.queue.qsize(), "max_depth": self.max_depth, "utterances": self.puts,
+                "blocked_puts": self.blocked_puts, "blocked_seconds": round(self.blocked_time, 3)}
+
+# ------------------------------
+# Capture -> segmentation -> queue
+# ------------------------------
+class StreamingListener:
+    """
+    Continuous replacement for `with mic: recognizer.listen(mic)` loops: the microphone never stops
+    capturing, a segmenter thread runs the ring buffer through a VadEndpointer, and the caller
+    consumes utterances from utterances() as (int16 samples, wall-clock time of speech end) while
+    the next one is already being recorded. on_speech_start(time) is called as soon as speech starts,
+    and on_speech_audio(samples) with the pre-roll and then every frame until the utterance ends, for
+    consumers that work on speech as it arrives. With replay_path, a WAV file replaces the microphone.
+    """
+    def __init__(self, device_index=None, endpointer=None, queue_size=4, ring_seconds=30.0, on_speech_start=None,
+                 on_speech_audio=None, replay_path=None, replay_speed=1.0):
+        self.ring = RingBuffer(ring_seconds)
+        if replay_path is not None:
+            self.capture = FileReplay(self.ring, replay_path, replay_speed)
+        else:
+            self.capture = MicrophoneCapture(self.ring, device_index)
+        self.endpointer = endpointer or VadEndpointer()
+        self.queue = UtteranceQueue(queue_size)
+        self.on_speech_start = on_speech_start
+        self.on_speech_audio = on_speech_audio
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.capture.start()
+        self.thread = threading.Thread(target=self._segment, daemon=True)
+        self.thread.start()
+
+    def _segment(self):
+        frame_size = self.endpointer.frame_size
+        while self.running:
+            frame = self.ring.read(frame_size)
+            if frame is None:
+                time.sleep(frame_size / SAMPLE_RATE / 2)
+                continue
+            events = self.endpointer.feed(frame)
+            for event in events:
+                samples = np.frombuffer(event.audio, dtype=np.int16)
+                if event.kind == "start":
+                    if self.on_speech_start is not None:
+                        self.on_speech_start(self.capture.sample_time(event.sample))
+                    if self.on_speech_audio is not None:
+                        self.on_speech_audio(samples)
+                else:
+                    self.queue.put((samples, self.capture.sample_time(event.sample)))
+            if not events and self.endpointer.triggered and self.on_speech_audio is not None:
+                self.on_speech_audio(frame)
+
+    def utterances(self):
+        while self.running:
+            try:
+                yield self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.replay_finished():
+                    return
+
+    def replay_finished(self):
+        """True once a replayed file has been fully segmented (never for a microphone)."""
+        return (getattr(self.capture, "finished", False) and self.ring.available() < self.endpointer.frame_size
+                and not self.endpointer.triggered and self.queue.queue.empty())
+
+    def stats(self):
+        return {**self.queue.stats(), "ring_backlog_seconds": round(self.ring.available() / SAMPLE_RATE, 2),
+                "ring_overrun_seconds": round(self.ring.overruns / SAMPLE_RATE, 2)}
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.capture.stop()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+from collections import deque, namedtuple
+
+import webrtcvad  # pip install webrtcvad
+
+# kind is "start" or "end"; sample is the stream position (in samples) where speech started / ended;
+# audio (16-bit mono PCM bytes) is the pre-roll up to the triggering frame on "start" events and the
+# whole utterance, pre-roll included, on "end" events
+EndpointEvent = namedtuple("EndpointEvent", ["kind", "sample", "audio"])
+
+class VadEndpointer:
+    """
+    Streaming speech endpointer around one long-lived webrtcvad.Vad.
+
+    feed() accepts audio chunks of any length (bytes, bytearray or a contiguous int16 array) and
+    slices them into VAD frames through memoryviews, so frames are never copied; only a frame split
+    across two chunks goes through a small reusable buffer. Speech starts once trigger_ratio of the
+    last trigger_ms is voiced, with pre_roll_ms of audio before it kept. It ends once release_ratio
+    of the last hangover_ms is unvoiced, or at max_duration. Both events are returned as soon as
+    the frame that causes them is fed; the utterance bytes are joined once, at the end.
+    """
+    def __init__(self, aggressiveness=2, sample_rate=16000, frame_ms=30, pre_roll_ms=300, trigger_ms=150,
+                 trigger_ratio=0.8, hangover_ms=500, release_ratio=0.9, max_duration=30.0):
+        self.vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_size * 2
+        self.trigger_ratio = trigger_ratio
+        self.release_ratio = release_ratio
+        self.max_frames = int(max_duration * 1000 / frame_ms)
+        self.pre_roll = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self.trigger_window = deque(maxlen=max(1, trigger_ms // frame_ms))
+        self.hangover_window = deque(maxlen=max(1, hangover_ms // frame_ms))
+        self.partial = bytearray(self.frame_bytes)
+        self.partial_length = 0
+        self.reset()
+
+    def reset(self):
+        """Forgets the current utterance and stream position; the Vad itself is kept."""
+        self.pre_roll.clear()
+        self.trigger_window.clear()
+        self.hangover_window.clear()
+        self.frames = []
+        self.triggered = False
+        self.partial_length = 0
+        self.position = 0  # samples fed so far (whole frames)
+
+    def feed(self, chunk):
+        """Processes a chunk; returns the list of EndpointEvents it caused (usually empty)."""
+        view = memoryview(chunk).cast("B")
+        events = []
+        offset = 0
+        if self.partial_length:
+            offset = min(self.frame_bytes - self.partial_length, len(view))
+            self.partial[self.partial_length:self.partial_length + offset] = view[:offset]
+            self.partial_length += offset
+            if self.partial_length < self.frame_bytes:
+                return events
+            # The frame may be kept in the pre-roll/utterance, so it cannot stay in the reused buffer
+            self._process_frame(bytes(self.partial), events)
+            self.partial_length = 0
+        while offset + self.frame_bytes <= len(view):
+            self._process_frame(view[offset:offset + self.frame_bytes], events)
+            offset += self.frame_bytes
+        rest = len(view) - offset
+        self.partial[:rest] = view[offset:]
+        self.partial_length = rest
+        return events
+
+    def _process_frame(self, frame, events):
+        voiced = self.vad.is_speech(frame, self.sample_rate)
+        self.position += self.frame_size
+        if not self.triggered:
+            self.pre_roll.append(frame)
+            self.trigger_window.append(voiced)
+            if sum(self.trigger_window) >= self.trigger_ratio * self.trigger_window.maxlen:
+                self.triggered = True
+                self.frames = list(self.pre_roll)
+                self.pre_roll.clear()
+                self.trigger_window.clear()
+                # Speech began roughly where the trigger window did
+                start = self.position - self.trigger_window.maxlen * self.frame_size
+                events.append(EndpointEvent("start", start, b"".join(self.frames)))
+            return
+        self.frames.append(frame)
+        self.hangover_window.append(voiced)
+        unvoiced = len(self.hangover_window) - sum(self.hangover_window)
+        released = (len(self.hangover_window) == self.hangover_window.maxlen
+                    and unvoiced >= self.release_ratio * self.hangover_window.maxlen)
+        if released or len(self.frames) >= self.max_frames:
+            trailing = 0
+            for flag in reversed(self.hangover_window):
+                if flag:
+                    break
+                trailing += 1
+            end = self.position - trailing * self.frame_size
+            events.append(EndpointEvent("end", end, b"".join(self.frames)))
+            self.frames = []
+            self.hangover_window.clear()
+            self.triggered = False
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+import argparse
+import queue
+import statistics
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from audio_stream import SAMPLE_RATE, StreamingListener
+from endpointer import VadEndpointer
+from vocabulary import DEFAULT_PATH, load_vocabulary
+
+# kind is "partial" or "final"; committed is the stable text (everything, for "final"); tentative is the
+# rest of the latest hypothesis; latency is seconds since speech start ("partial") or end ("final")
+TranscriptEvent = namedtuple("TranscriptEvent", ["kind", "committed", "tentative", "latency"])
+
+# ------------------------------
+# Local agreement
+# ------------------------------
+class LocalAgreement:
+    """
+    Commits the words on which two consecutive hypotheses of a growing window agree (LocalAgreement-2).
+    Committed words are never revised; the rest of the latest hypothesis stays tentative.
+    """
+    def __init__(self):
+        self.committed = []
+        self.previous = []
+
+    def insert(self, words):
+        """Adds a hypothesis for the whole window; returns the newly committed words."""
+        agreed = 0
+        for a, b in zip(self.previous, words):
+            if a.lower().strip(".,!?") != b.lower().strip(".,!?"):
+                break
+            agreed += 1
+        new = words[len(self.committed):agreed] if agreed > len(self.committed) else []
+        self.committed.extend(new)
+        self.previous = words
+        return new
+
+    @property
+    def tentative(self):
+        return self.previous[len(self.committed):]
+
+# ------------------------------
+# Streaming transcription
+# ------------------------------
+class _Utterance:
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.chunks = []
+        self.samples = 0
+        self.transcribed = 0  # samples covered by the last hypothesis
+        self.agreement = LocalAgreement()
+        self.partials = 0
+        self.active = True
+
+class StreamingTranscriber:
+    """
+    Re-transcribes the growing utterance with faster-whisper every `step` seconds of new audio while
+    the speaker is still talking and publishes partial transcripts (committed + tentative text);
+    finish() transcribes the complete utterance once and publishes the final transcript.
+
+    Wire begin() to StreamingListener's on_speech_start, feed() to its on_speech_audio and call
+    finish() with each utterance it yields. Events go to on_event if given, else to self.events.
+    Partial passes run greedy (beam_size=1) in a worker thread; one lock serializes model calls.
+    With a cascade (asr_cascade.CascadeTranscriber over the same model), final transcripts go
+    through it, so the fast tier handles the utterances it is sure about.
+    """
+    def __init__(self, model, language="cs", hotwords=None, step=0.3, on_event=None, initial_prompt=None,
+                 cascade=None):
+        self.model = model
+        self.cascade = cascade
+        self.language = language
+        self.hotwords = hotwords
+        self.initial_prompt = initial_prompt
+        self.step_samples = int(step * SAMPLE_RATE)
+        self.events = queue.Queue()
+        self.on_event = on_event or self.events.put
+        self.open = deque()  # utterances begun but not finished, oldest first
+        self.model_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.latencies = {"first_partial": [], "final": []}
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _transcribe(self, audio, **kwargs):
+        with self.model_lock:
+            segments, _ = self.model.transcribe(audio.astype(np.float32) / 32768.0, language=self.language,
+                                                hotwords=self.hotwords, initial_prompt=self.initial_prompt,
+                                                condition_on_previous_text=False, **kwargs)
+            return " ".join(seg.text for seg in segments).strip()
+
+    def begin(self, start_time):
+        self.open.append(_Utterance(start_time))
+
+    def feed(self, samples):
+        utterance = self.open[-1]
+        utterance.chunks.append(samples)
+        utterance.samples += len(samples)
+        if utterance.samples - utterance.transcribed >= self.step_samples:
+            self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(timeout=0.1)
+            self.wakeup.clear()
+            utterance = self.open[-1] if self.open else None
+            if utterance is None or not utterance.active or utterance.samples - utterance.transcribed < self.step_samples:
+                continue
+            chunks = list(utterance.chunks)
+            utterance.transcribed = sum(len(chunk) for chunk in chunks)
+            text = self._transcribe(np.concatenate(chunks), beam_size=1, without_timestamps=True)
+            if not utterance.active:
+                continue  # finished while we were transcribing; the final transcript supersedes this
+            agreement = utterance.agreement
+            agreement.insert(text.split())
+            latency = time.time() - utterance.start_time
+            if utterance.partials == 0:
+                self.latencies["first_partial"].append(latency)
+            utterance.partials += 1
+            self.on_event(TranscriptEvent("partial", " ".join(agreement.committed),
+                                          " ".join(agreement.tentative), latency))
+
+    def finish(self, audio, speech_end_time):
+        """Final transcript of the oldest open utterance (the complete audio from the endpointer)."""
+        if self.open:
+            self.open.popleft().active = False
+        if self.cascade is not None:
+            with self.model_lock:
+                text = self.cascade.transcribe(audio).text
+        else:
+            text = self._transcribe(audio)
+        latency = time.time() - speech_end_time
+        self.latencies["final"].append(latency)
+        self.on_event(TranscriptEvent("final", text, "", latency))
+        return text
+
+    def stats(self):
+        return {name: {"count": len(values),
+                       "median_ms": statistics.median(values) * 1000 if values else None,
+                       "mean_ms": statistics.mean(values) * 1000 if values else None}
+                for name, values in self.latencies.items()}
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+# ------------------------------
+# Replay benchmark
+# ------------------------------
+def print_event(event):
+    if event.kind == "partial":
+        print(f"  [partial +{event.latency * 1000:6.0f} ms] {event.committed} | {event.tentative}")
+    else:
+        print(f"  [final   +{event.latency * 1000:6.0f} ms after speech end] {event.committed}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a recording through the streaming transcriber and report partial/final latencies."
+    )
+    parser.add_argument("wav", help="16 kHz mono 16-bit WAV file")
+    parser.add_argument("--model", default="medium",
+                        choices=["tiny", "base", "small", "medium", "large-v1", "large-v2", "large-v3"],
+                        help="Which Whisper model to use")
+    parser.add_argument("--language", default="cs",
+                        help="Language code for transcription (e.g., 'cs' for Czech, 'en' for English)")
+    parser.add_argument("--device", default="cuda", help="cuda or cpu")
+    parser.add_argument("--step_ms", default=300, type=int,
+                        help="New audio (in ms) after which the growing window is re-transcribed")
+    parser.add_argument("--speed", default=1.0, type=float, help="Replay speed relative to real time")
+    parser.add_argument("--vad_aggressiveness", default=2, type=int, choices=[0, 1, 2, 3])
+    parser.add_argument("--hangover_ms", default=500, type=int)
+    parser.add_argument("--vocabulary", default=DEFAULT_PATH, help="Vocabulary artifact from vocabulary.py")
+    args = parser.parse_args()
+    vocabulary = load_vocabulary(args.vocabulary)
+    hotwords = vocabulary["hotwords"].get(args.language)
+
+    from faster_whisper import WhisperModel
+    print(f"Loading faster-whisper model '{args.model}' ...")
+    model = WhisperModel(args.model, download_root=f"/tmp/{args.model}", device=args.device)
+    print("Model loaded.\n")
+
+    transcriber = StreamingTranscriber(model, args.language, ",".join(hotwords) if hotwords else None,
+                                       step=args.step_ms / 1000, on_event=print_event,
+                                       initial_prompt=vocabulary["initial_prompt"].get(args.language))
+    listener = StreamingListener(endpointer=VadEndpointer(args.vad_aggressiveness, hangover_ms=args.hangover_ms),
+                                 on_speech_start=transcriber.begin, on_speech_audio=transcriber.feed,
+                                 replay_path=args.wav, replay_speed=args.speed)
+    listener.start()
+    for audio, speech_end_time in listener.utterances():
+        transcriber.finish(audio, speech_end_time)
+    listener.stop()
+    transcriber.close()
+
+    print("\n--- Latency ---")
+    for name, stats in transcriber.stats().items():
+        if stats["count"]:
+            print(f"{name:<14} median {stats['median_ms']:7.0f} ms  mean {stats['mean_ms']:7.0f} ms  ({stats['count']} utterances)")
+        else:
+            print(f"{name:<14} -")
+
+if __name__ == "__main__":
+    main()
@@ -3,30 +3,25 @@ import argparse
 import numpy as np
 import speech_recognition as sr
 import time
-import webrtcvad  # pip install webrtcvad
 from faster_whisper import WhisperModel
 
-def is_speech_present(raw_audio, sample_rate=16000, frame_duration_ms=30, speech_ratio_threshold=0.5):
-    """
-    Returns True if the fraction of frames detected as speech is above the threshold.
-    - raw_audio: bytes of 16-bit mono PCM data.
-    - sample_rate: audio sample rate in Hz.
-    - frame_duration_ms: duration of each frame in ms (typically 20-30 ms).
-    - speech_ratio_threshold: minimum fraction of frames that must be speech.
-    """
-    vad = webrtcvad.Vad(2)  # mode 2: moderately aggressive
-    frame_length = int(sample_rate * (frame_duration_ms / 1000.0) * 2)  # 2 bytes per sample (16-bit)
-    frames = [
-        raw_audio[i:i+frame_length]
-        for i in range(0, len(raw_audio), frame_length)
-        if len(raw_audio[i:i+frame_length]) == frame_length
-    ]
-    if not frames:
-        return False
+from asr_cascade import CascadeTranscriber, command_vocabulary
+from audio_stream import StreamingListener
+from endpointer import VadEndpointer
+from streaming_asr import StreamingTranscriber, print_event
+from vocabulary import DEFAULT_PATH, load_vocabulary
 
-    speech_frames = sum(1 for frame in frames if vad.is_speech(frame, sample_rate))
-    ratio = speech_frames / len(frames)
-    return ratio >= speech_ratio_threshold
+def load_model(model, language, device):
+    # Choose model name based on language and model selection
+    if language.lower() == "en" and not model.startswith("large"):
+        model_name = f"{model}.en"
+    else:
+        model_name = model
+    print(f"Loading faster-whisper model '{model_name}' ...")
+    compute_type = "int8" if device == "cpu" else "default"
+    model = WhisperModel(model_name, download_root=f"/tmp/{model_name}", device=device, compute_type=compute_type)
+    print("Model loaded.\n")
+    return model
 
 def main():
     parser = argparse.ArgumentParser(
@@ -37,15 +32,29 @@ def main():
                         help="Which Whisper model to use")
     parser.add_argument("--language", default="cs",
                         help="Language code for transcription (e.g., 'cs' for Czech, 'en' for English)")
-    parser.add_argument("--energy_threshold", default=500, type=int,
-                        help="Energy threshold for microphone input")
-    parser.add_argument("--mic_duration_calib", default=2, type=float,
-                        help="Duration (in seconds) for ambient noise calibration")
+    parser.add_argument("--vad_aggressiveness", default=2, type=int, choices=[0, 1, 2, 3],
+                        help="webrtcvad mode used to detect speech (3 filters non-speech most aggressively)")
+    parser.add_argument("--hangover_ms", default=500, type=int,
+                        help="Mostly unvoiced audio (in ms) after which an utterance ends")
+    parser.add_argument("--vocabulary", default=DEFAULT_PATH,
+                        help="Vocabulary artifact from vocabulary.py (hotwords and initial prompt per language)")
     parser.add_argument("--hotwords_file", default=None,
                         help="Path to a file containing hotwords (one per line) to bias the transcription")
     # Default microphone prefix
     parser.add_argument("--default_microphone", default="Jabra Speak 710: USB Audio",
                         help="(Optional) Microphone name prefix to use on Linux. Leave empty to use system default.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Publish partial transcripts while speaking (re-transcribing the growing utterance)")
+    parser.add_argument("--step_ms", default=300, type=int,
+                        help="With --streaming, new audio (in ms) after which the utterance is re-transcribed")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Transcribe with --fast_model first and re-run --model only when the result looks unreliable "
+                             "(with --streaming, for the final transcripts)")
+    parser.add_argument("--fast_model", default="base", choices=["tiny", "base", "small"],
+                        help="First tier of --cascade")
+    parser.add_argument("--device", default="cuda", help="Device for the Whisper models (cuda or cpu)")
+    parser.add_argument("--queue_size", default=4, type=int,
+                        help="Completed utterances that may wait for transcription before capture backs up")
     args = parser.parse_args()
 
     # Load hotwords if provided
@@ -60,10 +69,12 @@ def main():
             print(f"Error reading hotwords file: {e}")
             hotwords_str = None
 
-    recognizer = sr.Recognizer()
-    recognizer.energy_threshold = args.energy_threshold
-    recognizer.dynamic_energy_threshold = False
-    recognizer.pause_threshold = 0.5  # seconds after speech ends before recording stops
+    # Domain vocabulary generated from the command tables (vocabulary.py); a hotwords file overrides its hotwords
+    vocabulary = load_vocabulary(args.vocabulary)
+    language = args.language.lower()
+    if hotwords_str is None and language in vocabulary["hotwords"]:
+        hotwords_str = ",".join(vocabulary["hotwords"][language])
+    initial_prompt = vocabulary["initial_prompt"].get(language)
 
     # Microphone selection based on name prefix
     mic = None
@@ -85,56 +96,65 @@ def main():
         default_name = mic_names[0] if mic_names else "Unknown"
         print(f"Using system default microphone: {default_name}")
 
-    # Calibrate for ambient noise
-    print(f"Calibrating microphone for ambient noise for {args.mic_duration_calib} seconds. Please remain silent...")
-    with mic as source:
-        recognizer.adjust_for_ambient_noise(source, duration=args.mic_duration_calib)
-    print(f"Calibration complete. New energy threshold is: {recognizer.energy_threshold}\n")
-
-    # Choose model name based on language and model selection
-    if args.language.lower() == "en" and args.model != "large":
-        model_name = f"{args.model}.en"
-    else:
-        model_name = args.model
-    print(f"Loading faster-whisper model '{model_name}' ...")
-    model = WhisperModel(model_name, download_root=f"/tmp/{model_name}", device="cuda")
-    print("Model loaded.\n")
+    model = load_model(args.model, args.language, args.device)
+    cascade = None
+    if args.cascade:
+        command_words = command_vocabulary(hotwords_str.split(",") if hotwords_str else (), args.vocabulary, language)
+        cascade = CascadeTranscriber(load_model(args.fast_model, args.language, args.device), model, command_words,
+                                     language=args.language, hotwords=hotwords_str, initial_prompt=initial_prompt)
     
-    print("Enter utterances continuously. After each utterance, the system will measure timing and transcribe the entire utterance.")
+    print("Enter utterances continuously. Capture keeps running while earlier utterances are transcribed.")
     print("Press Ctrl+C to exit.\n")
-    
-    try:
-        while True:
-            print("Listening for an utterance...")
-            with mic:
-                audio_data = recognizer.listen(mic)
-            capture_end = time.time()  # Time when recording stopped
 
-            raw_audio = audio_data.get_raw_data()
-            # Use VAD to filter out non-speech (random noise) segments
-            if not is_speech_present(raw_audio):
-                print("Detected noise without sufficient speech. Skipping transcription.\n")
+    endpointer = VadEndpointer(aggressiveness=args.vad_aggressiveness, hangover_ms=args.hangover_ms)
+    if args.streaming:
+        # Partial transcripts while speaking; the final one is published when the utterance ends
+        transcriber = StreamingTranscriber(model, args.language, hotwords_str, step=args.step_ms / 1000,
+                                           on_event=print_event, initial_prompt=initial_prompt, cascade=cascade)
+        listener = StreamingListener(device_index=mic.device_index, endpointer=endpointer, queue_size=args.queue_size,
+                                     on_speech_start=transcriber.begin, on_speech_audio=transcriber.feed)
+    else:
+        listener = StreamingListener(device_index=mic.device_index, endpointer=endpointer, queue_size=args.queue_size,
+                                     on_speech_start=lambda _: print("Speech started..."))
+    listener.start()
+    print("Listening for utterances...")
+    try:
+        for audio, speech_end_time in listener.utterances():
+            if args.streaming:
+                transcriber.finish(audio, speech_end_time)
                 continue
 
             # Convert raw audio to normalized float32 array
-            np_audio = np.frombuffer(raw_audio, dtype=np.int16).astype(np.float32) / 32768.0
-            
+            np_audio = audio.astype(np.float32) / 32768.0
+
             print("Transcribing utterance...")
-            segments, _ = model.transcribe(np_audio, language=args.language, hotwords=hotwords_str)
+            if cascade is not None:
+                result = cascade.transcribe(np_audio)
+                transcription = result.text
+                print(f"Tier: {result.tier}" + (f" (escalated: {result.reason})" if result.reason else ""))
+            else:
+                segments, _ = model.transcribe(np_audio, language=args.language, hotwords=hotwords_str,
+                                               initial_prompt=initial_prompt)
+                transcription = " ".join(seg.text for seg in segments).strip()
             transcribe_end = time.time()  # Time when transcription finished
-            
+
             # Calculate transcription time (from speech end)
-            speech_end_time = capture_end - recognizer.pause_threshold
             transcription_time = (transcribe_end - speech_end_time) * 1000  # in ms
-            
-            transcription = " ".join(seg.text for seg in segments).strip()
-            
+
             print("\n--- Utterance Transcription ---")
             print(transcription)
             print("--------------------------------")
-            print(f"Transcription time (from speech end): {transcription_time:.2f} ms\n")
+            print(f"Transcription time (from speech end): {transcription_time:.2f} ms")
+            print(f"Capture queue: {listener.stats()}\n")
     except KeyboardInterrupt:
         print("\nExiting...")
+    finally:
+        listener.stop()
+        if args.streaming:
+            transcriber.close()
+            print(f"Latency: {transcriber.stats()}")
+        if cascade is not None:
+            print(f"Cascade: {cascade.stats()}")
 
 if __name__ == "__main__":
     main()
@@ -3,31 +3,12 @@ import argparse
 import numpy as np
 import speech_recognition as sr
 import time
-import webrtcvad  # pip install webrtcvad
 from faster_whisper import WhisperModel
 from transformers import pipeline
 
-def is_speech_present(raw_audio, sample_rate=16000, frame_duration_ms=30, speech_ratio_threshold=0.5):
-    """
-    Returns True if the fraction of frames detected as speech is above the threshold.
-    - raw_audio: bytes of 16-bit mono PCM data.
-    - sample_rate: audio sample rate in Hz.
-    - frame_duration_ms: duration of each frame in ms (typically 20-30 ms).
-    - speech_ratio_threshold: minimum fraction of frames that must be speech.
-    """
-    vad = webrtcvad.Vad(1)  # mode 2: moderately aggressive
-    frame_length = int(sample_rate * (frame_duration_ms / 1000.0) * 2)  # 2 bytes per sample (16-bit)
-    frames = [
-        raw_audio[i:i+frame_length]
-        for i in range(0, len(raw_audio), frame_length)
-        if len(raw_audio[i:i+frame_length]) == frame_length
-    ]
-    if not frames:
-        return False
-
-    speech_frames = sum(1 for frame in frames if vad.is_speech(frame, sample_rate))
-    ratio = speech_frames / len(frames)
-    return ratio >= speech_ratio_threshold
+from audio_stream import StreamingListener
+from endpointer import VadEndpointer
+from vocabulary import DEFAULT_PATH, load_vocabulary
 
 def main():
     parser = argparse.ArgumentParser(
@@ -38,14 +19,18 @@ def main():
                         help="Which Whisper model to use")
     parser.add_argument("--language", default="cs",
                         help="Language code for transcription (e.g., 'cs' for Czech, 'en' for English)")
-    parser.add_argument("--energy_threshold", default=500, type=int,
-                        help="Energy threshold for microphone input")
-    parser.add_argument("--mic_duration_calib", default=2, type=float,
-                        help="Duration (in seconds) for ambient noise calibration")
+    parser.add_argument("--vad_aggressiveness", default=1, type=int, choices=[0, 1, 2, 3],
+                        help="webrtcvad mode used to detect speech (3 filters non-speech most aggressively)")
+    parser.add_argument("--hangover_ms", default=500, type=int,
+                        help="Mostly unvoiced audio (in ms) after which an utterance ends")
+    parser.add_argument("--vocabulary", default=DEFAULT_PATH,
+                        help="Vocabulary artifact from vocabulary.py (hotwords and initial prompt per language)")
     parser.add_argument("--hotwords_file", default=None,
                         help="Path to a file containing hotwords (one per line) to bias the transcription")
     parser.add_argument("--default_microphone", default="Jabra Speak 710: USB Audio",
                         help="(Optional) Microphone name prefix to use on Linux. Leave empty to use system default.")
+    parser.add_argument("--queue_size", default=4, type=int,
+                        help="Completed utterances that may wait for transcription before capture backs up")
     args = parser.parse_args()
 
     # Load hotwords if provided
@@ -60,10 +45,12 @@ def main():
             print(f"Error reading hotwords file: {e}")
             hotwords_str = None
 
-    recognizer = sr.Recognizer()
-    recognizer.energy_threshold = args.energy_threshold
-    recognizer.dynamic_energy_threshold = False
-    recognizer.pause_threshold = 0.5  # seconds after speech ends before recording stops
+    # Domain vocabulary generated from the command tables (vocabulary.py); a hotwords file overrides its hotwords
+    vocabulary = load_vocabulary(args.vocabulary)
+    language = args.language.lower()
+    if hotwords_str is None and language in vocabulary["hotwords"]:
+        hotwords_str = ",".join(vocabulary["hotwords"][language])
+    initial_prompt = vocabulary["initial_prompt"].get(language)
 
     # Microphone selection
     mic = None
@@ -85,12 +72,6 @@ def main():
         default_name = mic_names[0] if mic_names else "Unknown"
         print(f"Using system default microphone: {default_name}")
 
-    # Calibrate for ambient noise
-    print(f"Calibrating microphone for ambient noise for {args.mic_duration_calib} seconds. Please remain silent...")
-    with mic as source:
-        recognizer.adjust_for_ambient_noise(source, duration=args.mic_duration_calib)
-    print(f"Calibration complete. New energy threshold is: {recognizer.energy_threshold}\n")
-
     # Load Faster Whisper
     model_name = args.model
     print(f"Loading Faster Whisper model '{model_name}' ...")
@@ -102,37 +83,33 @@ def main():
     translator = pipeline("translation", model="Helsinki-NLP/opus-mt-cs-en")
     print("Translation model loaded.\n")
     
-    print("Listening for speech. Press Ctrl+C to exit.\n")
-    
-    try:
-        while True:
-            print("Listening for an utterance...")
-            with mic:
-                audio_data = recognizer.listen(mic)
-            capture_end = time.time()  # Time when recording stopped
-
-            raw_audio = audio_data.get_raw_data()
-            # Use VAD to filter out non-speech (random noise) segments
-            if not is_speech_present(raw_audio):
-                print("Detected noise without sufficient speech. Skipping transcription.\n")
-                continue
+    print("Listening for speech. Capture keeps running while earlier utterances are processed. Press Ctrl+C to exit.\n")
 
+    endpointer = VadEndpointer(aggressiveness=args.vad_aggressiveness, hangover_ms=args.hangover_ms)
+    listener = StreamingListener(device_index=mic.device_index, endpointer=endpointer, queue_size=args.queue_size,
+                                 on_speech_start=lambda _: print("Speech started..."))
+    listener.start()
+    print("Listening for utterances...")
+    try:
+        for audio, speech_end_time in listener.utterances():
             # Convert raw audio to normalized float32 array
-            np_audio = np.frombuffer(raw_audio, dtype=np.int16).astype(np.float32) / 32768.0
-            
+            np_audio = audio.astype(np.float32) / 32768.0
+
             print("Transcribing utterance...")
             start_transcribe = time.time()
-            segments, _ = model.transcribe(np_audio, language=args.language, hotwords=hotwords_str)
-            end_transcribe = time.time()
+            segments, _ = model.transcribe(np_audio, language=args.language, hotwords=hotwords_str,
+                                           initial_prompt=initial_prompt)
 
             # Combine segments into a single Czech string
             czech_text = " ".join(seg.text for seg in segments).strip()
+            end_transcribe = time.time()
             transcribe_time_ms = (end_transcribe - start_transcribe) * 1000
 
             print("\n--- Czech Transcription ---")
             print(czech_text)
             print("--------------------------------")
-            print(f"Transcription time: {transcribe_time_ms:.2f} ms")
+            print(f"Transcription time: {transcribe_time_ms:.2f} ms "
+                  f"({(end_transcribe - speech_end_time) * 1000:.2f} ms from speech end)")
 
             # --- Translate to English ---
             if czech_text:
@@ -146,10 +123,13 @@ def main():
                 print("\n--- English Translation ---")
                 print(english_text)
                 print("--------------------------------")
-                print(f"Translation time: {translate_time_ms:.2f} ms\n")
+                print(f"Translation time: {translate_time_ms:.2f} ms")
+            print(f"Capture queue: {listener.stats()}\n")
 
     except KeyboardInterrupt:
         print("\nExiting...")
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
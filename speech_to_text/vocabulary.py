@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import create_dataset as d  # noqa: E402
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vocabulary.json")
+
+# ------------------------------
+# Czech counterparts of the create_dataset.py tables
+# ------------------------------
+# The English tables are the source of truth; each Czech entry covers the table of the same name
+# (imperatives in the familiar form, nouns in nominative and accusative where they differ).
+CZECH = {
+    "start_synonyms": ["start", "spusť", "zapni", "aktivuj"],
+    "stop_synonyms": ["stop", "zastav", "vypni", "deaktivuj"],
+    "home_synonyms": ["domů", "vrať se domů", "výchozí pozice", "do výchozí pozice"],
+    "detect_synonyms": ["najdi", "detekuj", "lokalizuj", "rozpoznej"],
+    "move_synonyms": ["posuň", "přesuň", "jdi na", "přejdi na"],
+    "increase_synonyms": ["zvyš", "přitlač", "přidej", "silněji"],
+    "decrease_synonyms": ["sniž", "uber", "povol", "jemněji"],
+    "set_synonyms": ["nastav", "uprav"],
+    "force_nouns": ["intenzita masáže", "intenzitu masáže", "tlak", "síla", "sílu"],
+    "auto_massage_synonyms": ["automatická masáž", "automatickou masáž", "spusť masáž", "začni masáž"],
+}
+CZECH_BODY_PARTS = {
+    "lower back": ["kříž", "spodní záda", "záda"], "shoulders": ["ramena"], "neck": ["krk"],
+    "arms": ["paže", "ruce"], "legs": ["nohy"], "head": ["hlava", "hlavu"], "chest": ["hrudník"],
+    "stomach": ["břicho"], "hips": ["boky"], "knees": ["kolena"], "elbows": ["lokty"],
+    "wrists": ["zápěstí"], "feet": ["chodidla"], "calves": ["lýtka"], "forearms": ["předloktí"],
+}
+# Words the commands are glued with (the Czech side of the template text)
+CZECH_FILLERS = ["prosím", "můžeš", "mi", "moje", "můj", "na", "o", "do", "robote", "masážní robot",
+                 "procent", "minus", "doleva", "doprava", "nahoru", "dolů"]
+CZECH_NUMBERS = ["nula", "jedna", "dva", "tři", "čtyři", "pět", "šest", "sedm", "osm", "devět", "deset",
+                 "jedenáct", "dvanáct", "třináct", "čtrnáct", "patnáct", "šestnáct", "sedmnáct", "osmnáct",
+                 "devatenáct", "dvacet", "třicet", "čtyřicet", "padesát", "šedesát", "sedmdesát", "osmdesát",
+                 "devadesát", "sto"]
+ENGLISH_NUMBERS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+                   "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen",
+                   "nineteen", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety",
+                   "hundred", "percent", "minus"]
+
+TEMPLATE_TABLES = ["robot_templates", "home_templates", "detect_templates", "move_body_part_templates",
+                   "move_coords_templates", "force_relative_templates", "force_absolute_templates",
+                   "auto_massage_templates"]
+PLACEHOLDER = re.compile(r"\{[^}]*\}")
+WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+# ------------------------------
+# Generator
+# ------------------------------
+def _unique(items):
+    return list(dict.fromkeys(item for item in items if item))
+
+def _words(phrases):
+    return _unique(word.lower() for phrase in phrases for word in WORD.findall(phrase))
+
+def _commands(language):
+    """(verbs, force nouns, body parts, fillers, numbers) phrase lists for 'en' or 'cs'."""
+    if language == "en":
+        tables = {name: [phrase.lower() for phrase in getattr(d, name)] for name in CZECH}
+        parts = list(d.body_parts)
+        fillers = _words(PLACEHOLDER.sub(" ", template) for name in TEMPLATE_TABLES for template in getattr(d, name))
+        numbers = ENGLISH_NUMBERS
+    else:
+        tables = CZECH
+        parts = [czech for part in d.body_parts for czech in CZECH_BODY_PARTS[part]]
+        fillers, numbers = CZECH_FILLERS, CZECH_NUMBERS
+    verbs = _unique(phrase for name, phrases in tables.items() if name != "force_nouns" for phrase in phrases)
+    return verbs, tables["force_nouns"], parts, fillers, numbers
+
+def initial_prompt(language):
+    """A short sentence in the style of the commands, priming Whisper with the vocabulary and spelling."""
+    verbs, nouns, parts, _, _ = _commands(language)
+    if language == "en":
+        return (f"Massage robot commands: {verbs[0]}, {', '.join(parts[:6])}. "
+                f"Increase {nouns[0]} by 20%, move to my {parts[1]}, stop.")
+    return (f"Povely pro masážního robota: {verbs[0]}, {', '.join(parts[:6])}. "
+            f"Zvyš {nouns[1]} o 20 %, posuň na {parts[1]}, stop.")
+
+def build_vocabulary():
+    """
+    Whisper hotwords and initial prompts plus a closed Vosk grammar, in Czech and English, from the
+    synonym lists, force nouns, body parts and template text of create_dataset.py.
+    """
+    vocabulary = {"hotwords": {}, "initial_prompt": {}, "vosk_grammar": {}}
+    for language in ("cs", "en"):
+        verbs, nouns, parts, fillers, numbers = _commands(language)
+        vocabulary["hotwords"][language] = _unique(verbs + nouns + parts)
+        vocabulary["initial_prompt"][language] = initial_prompt(language)
+        # Vosk decodes any sequence of these words; "[unk]" absorbs everything else
+        vocabulary["vosk_grammar"][language] = _words(verbs + nouns + parts + fillers) + numbers + ["[unk]"]
+    return vocabulary
+
+def load_vocabulary(path=DEFAULT_PATH):
+    """The generated artifact; rebuilt from create_dataset.py when the file does not exist yet."""
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return build_vocabulary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the ASR vocabulary artifact from the command tables.")
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    vocabulary = build_vocabulary()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False, indent=2)
+    for language in ("cs", "en"):
+        print(f"{language}: {len(vocabulary['hotwords'][language])} hotwords, "
+              f"{len(vocabulary['vosk_grammar'][language])} grammar words")
+        print(f"  prompt: {vocabulary['initial_prompt'][language]}")
+    print(f"Saved vocabulary to {args.output}")
+
+if __name__ == "__main__":
+    main()
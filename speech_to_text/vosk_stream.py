@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import json
+import statistics
+import time
+from collections import Counter
+
+from vosk import KaldiRecognizer
+
+from endpointer import VadEndpointer
+
+class StreamingVoskRecognizer:
+    """
+    One long-lived KaldiRecognizer fed with microphone chunks as they arrive. PartialResult gives
+    the live hypothesis after every chunk; Result is read when Vosk detects an endpoint itself.
+    The same chunks also go through a VadEndpointer, and when it reports the end of speech while a
+    hypothesis is pending, FinalResult finalizes it right away and the recognizer is Reset (not
+    reallocated) for the next utterance. Latencies are kept both from the speech end (which includes
+    the endpointer's hangover) and for FinalResult alone.
+    """
+    def __init__(self, model, grammar=None, sample_rate=16000, endpointer=None, on_partial=None, on_final=None):
+        if grammar is not None:
+            self.recognizer = KaldiRecognizer(model, sample_rate, grammar)
+        else:
+            self.recognizer = KaldiRecognizer(model, sample_rate)
+        self.endpointer = endpointer or VadEndpointer(sample_rate=sample_rate)
+        self.on_partial = on_partial or (lambda text: None)
+        self.on_final = on_final or (lambda text: None)
+        self.partial = ""
+        self.latencies = {"after_speech_end": [], "finalize": []}
+        self.finals = Counter()  # by what ended the utterance: "vosk" endpoint or "vad" speech end
+
+    def feed(self, samples, sample_time):
+        """samples: int16 chunk; sample_time(index) maps stream positions to wall-clock time."""
+        if self.recognizer.AcceptWaveform(samples.tobytes()):
+            self._final(self.recognizer.Result(), "vosk")
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+            if partial != self.partial:
+                self.partial = partial
+                if partial:
+                    self.on_partial(partial)
+        for event in self.endpointer.feed(samples):
+            if event.kind == "end" and self.partial:
+                begin = time.perf_counter()
+                result = self.recognizer.FinalResult()
+                self.recognizer.Reset()
+                self.latencies["finalize"].append(time.perf_counter() - begin)
+                self.latencies["after_speech_end"].append(time.time() - sample_time(event.sample))
+                self._final(result, "vad")
+
+    def _final(self, result, source):
+        text = json.loads(result).get("text", "")
+        self.partial = ""
+        if text:
+            self.finals[source] += 1
+            self.on_final(text)
+
+    def stats(self):
+        return {"finals": dict(self.finals),
+                **{f"{name}_ms": {"median": statistics.median(values) * 1000 if values else None,
+                                  "max": max(values) * 1000 if values else None}
+                   for name, values in self.latencies.items()}}
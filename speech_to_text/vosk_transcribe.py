@@ -1,10 +1,53 @@
 #!/usr/bin/env python3
+import argparse
 import os
 import json
+import time
 import speech_recognition as sr
 from vosk import Model, KaldiRecognizer
 
+from audio_stream import RingBuffer, MicrophoneCapture, FileReplay
+from endpointer import VadEndpointer
+from vocabulary import DEFAULT_PATH, load_vocabulary
+from vosk_stream import StreamingVoskRecognizer
+
+def stream(model, grammar, device_index, replay_path=None, hangover_ms=300, chunk_size=1600):
+    """
+    Streaming mode: microphone chunks (100 ms) go straight into one StreamingVoskRecognizer,
+    printing live partial hypotheses and each final transcript as soon as speech ends.
+    """
+    ring = RingBuffer()
+    capture = FileReplay(ring, replay_path) if replay_path else MicrophoneCapture(ring, device_index)
+    recognizer = StreamingVoskRecognizer(model, grammar, endpointer=VadEndpointer(hangover_ms=hangover_ms),
+                                         on_partial=lambda text: print(f"\r... {text}", end="", flush=True),
+                                         on_final=lambda text: print(f"\rTranscription: {text}"))
+    capture.start()
+    print("\nListening (streaming)...")
+    try:
+        while not (getattr(capture, "finished", False) and ring.available() < chunk_size):
+            chunk = ring.read(chunk_size)
+            if chunk is None:
+                time.sleep(chunk_size / 16000 / 4)
+                continue
+            recognizer.feed(chunk, capture.sample_time)
+    except KeyboardInterrupt:
+        pass
+    capture.stop()
+    print(f"\n{recognizer.stats()}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Transcribe utterances with VOSK, constrained to the command vocabulary.")
+    parser.add_argument("--vocabulary", default=DEFAULT_PATH,
+                        help="Vocabulary artifact from vocabulary.py (its Czech grammar restricts decoding)")
+    parser.add_argument("--no_grammar", action="store_true", help="Decode with the full model vocabulary")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Feed the microphone into one long-lived recognizer with live partial results")
+    parser.add_argument("--replay", default=None,
+                        help="With --streaming, a 16 kHz mono WAV file to replay instead of the microphone")
+    parser.add_argument("--hangover_ms", default=300, type=int,
+                        help="With --streaming, mostly unvoiced audio (in ms) after which an utterance is finalized")
+    args = parser.parse_args()
+
     # Path to the Czech VOSK model (vosk-model-small-cs-0.4-rhasspy)
     model_path = "model_cs"
     if not os.path.exists(model_path):
@@ -16,6 +59,13 @@ def main():
     model = Model(model_path)
     print("Model loaded successfully.")
 
+    # Closed grammar built from the command tables: fewer words to search, fewer garbage transcriptions
+    grammar = None if args.no_grammar else json.dumps(load_vocabulary(args.vocabulary)["vosk_grammar"]["cs"],
+                                                      ensure_ascii=False)
+    if args.streaming:
+        stream(model, grammar, device_index=1, replay_path=args.replay, hangover_ms=args.hangover_ms)
+        return
+
     # Set up SpeechRecognition for automatic utterance segmentation.
     # The energy_threshold and pause_threshold values may need tuning depending on your environment.
     recognizer = sr.Recognizer()
@@ -35,7 +85,10 @@ def main():
                 raw_audio = audio_data.get_raw_data()
 
                 # Create a new VOSK recognizer instance for this utterance.
-                vosk_recognizer = KaldiRecognizer(model, 16000)
+                if grammar is not None:
+                    vosk_recognizer = KaldiRecognizer(model, 16000, grammar)
+                else:
+                    vosk_recognizer = KaldiRecognizer(model, 16000)
                 # Process the raw audio in chunks of 4000 bytes
                 chunk_size = 4000
                 for i in range(0, len(raw_audio), chunk_size):
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("peft")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from peft import LoraConfig, get_peft_model
+
+from adapter_host import BASE_ADAPTER, AdapterHost
+from conversation import context_preamble, v1_preamble
+from inference_server import ChatService, ContinuousBatchEngine
+from tiny_model import tiny_model, tiny_tokenizer
+
+TOKENIZER = tiny_tokenizer()
+
+@pytest.fixture(scope="module")
+def adapter_paths(tmp_path_factory):
+    paths = {}
+    for seed, name in enumerate(["context", "v1"], start=1):
+        lora = get_peft_model(tiny_model(TOKENIZER, seed), LoraConfig(r=4, target_modules=["q_proj", "v_proj"],
+                                                                      init_lora_weights=False))
+        paths[name] = str(tmp_path_factory.mktemp(name))
+        lora.save_pretrained(paths[name])
+    return paths
+
+def make_service(adapter_paths):
+    host = AdapterHost(tiny_model(TOKENIZER), TOKENIZER)
+    host.register("context", adapter_paths["context"])
+    host.register("v1", adapter_paths["v1"], template="v1")
+    engine = ContinuousBatchEngine(host.model, TOKENIZER, multi_adapter=True)
+    return ChatService(engine, TOKENIZER, max_new_tokens=4, adapter_host=host)
+
+def serve(service, test):
+    async def run():
+        task = asyncio.create_task(service.engine.run())
+        try:
+            return await test()
+        finally:
+            task.cancel()
+    return asyncio.run(run())
+
+def test_adapters_are_prompted_with_their_template(adapter_paths):
+    service = make_service(adapter_paths)
+    prompts = {}
+    submit = service.engine.submit
+
+    async def recording_submit(session_id, prompt_ids, max_new_tokens, stopping, adapter=None):
+        prompts[adapter] = (TOKENIZER.decode(prompt_ids), stopping.grammar.layout)
+        return await submit(session_id, prompt_ids, max_new_tokens, stopping, adapter)
+
+    service.engine.submit = recording_submit
+
+    async def test():
+        for adapter in ["context", "v1"]:
+            async for _ in service.chat(adapter, "start the robot", adapter):
+                pass
+
+    serve(service, test)
+    assert prompts["context"][0].startswith(context_preamble) and prompts["context"][1] == "lines"
+    assert prompts["v1"][0].startswith(v1_preamble) and prompts["v1"][1] == "python_list"
+    assert service.adapter_host.stats()["adapters"]["v1"]["template"] == "v1"
+
+def test_unknown_template_is_refused(adapter_paths):
+    host = AdapterHost(tiny_model(TOKENIZER), TOKENIZER)
+    with pytest.raises(ValueError):
+        host.register("a", adapter_paths["context"], template="chatml")
+
+def test_queued_turn_counts_as_in_flight(adapter_paths):
+    service = make_service(adapter_paths)
+
+    async def test():
+        async for _ in service.chat("s", "start the robot", "v1"):
+            pass
+        lock = service.sessions["s"][1]
+        await lock.acquire()  # the session's previous turn is still running
+        turn = asyncio.create_task(anext(service.chat("s", "stop the robot", "v1")))
+        await asyncio.sleep(0)
+        queued = service.in_flight["v1"]
+        lock.release()
+        await turn
+        return queued
+
+    assert serve(service, test) == 1
+
+def test_unregistered_adapter_fails_only_its_request(adapter_paths):
+    service = make_service(adapter_paths)
+    engine = service.engine
+
+    async def test():
+        service.adapter_host.unregister("v1")
+        ids = TOKENIZER("start").input_ids
+        seqs = [await engine.submit("a", ids, 3, None, "v1"), await engine.submit("b", ids, 3, None, "context"),
+                await engine.submit("c", ids, 3, None, BASE_ADAPTER)]
+        for seq in seqs:
+            await seq.finished.wait()
+        return seqs
+
+    removed, kept, base = serve(service, test)
+    assert isinstance(removed.error, KeyError)
+    assert kept.error is None and len(kept.generated) > 0
+    assert base.error is None and len(base.generated) > 0
@@ -0,0 +1,25 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "speech_to_text"))
+
+from asr_cascade import CascadeTranscriber, command_vocabulary
+
+Segment = namedtuple("Segment", ["text", "avg_logprob", "no_speech_prob"])
+
+def check(text, language="cs"):
+    cascade = CascadeTranscriber(None, None, command_vocabulary(language=language), language=language)
+    return cascade.check([Segment(text, -0.2, 0.01)])
+
+def test_czech_commands_are_accepted():
+    assert check("Zvyš tlak o dvacet procent") is None
+    assert check("Posuň se na ramena, prosím.") is None
+    assert check("zastav robota") is None
+
+def test_english_commands_are_accepted_in_english():
+    assert check("Increase massage pressure by 20%", "en") is None
+
+def test_off_topic_transcripts_escalate():
+    assert check("včera jsem byl v kině s kamarádem") is not None
+    assert check("") == "empty transcript"
@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from evaluate import evaluate, iter_json_array, iter_samples, summarize
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "massage_robot_dataset_v2.json")
+
+class ReferenceBackend:
+    """Answers every sample with its reference output."""
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def generate(self, batch, max_new_tokens):
+        return [(sample["reference"], 1) for sample in batch]
+
+def test_iter_json_array_matches_json_load(tmp_path):
+    path = tmp_path / "samples.json"
+    samples = [{"input": "start", "output": "start()"}, {"input": "a, [b]", "output": "{}"}, [], 3]
+    path.write_text(json.dumps(samples, indent=2))
+    assert list(iter_json_array(path, chunk_size=7)) == samples
+    path.write_text("[]")
+    assert list(iter_json_array(path)) == []
+
+def test_resume_drops_partial_last_line(tmp_path):
+    output = tmp_path / "results.jsonl"
+    evaluate(ReferenceBackend(), iter_samples([DATASET], limit=3), output, 2, 10)
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "massage_ro')
+    assert summarize(output)[:2] == (3, 3)
+    evaluate(ReferenceBackend(), iter_samples([DATASET], limit=5), output, 2, 10)
+    assert summarize(output)[:2] == (5, 5)
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from inference_server import ChatService, ContinuousBatchEngine
+from tiny_model import greedy, tiny_model, tiny_tokenizer
+
+TOKENIZER = tiny_tokenizer()
+MODEL = tiny_model(TOKENIZER)
+
+async def generate(engine, prompts, max_new_tokens=12):
+    seqs = [await engine.submit(str(i), TOKENIZER(prompt).input_ids, max_new_tokens, None)
+            for i, prompt in enumerate(prompts)]
+    for seq in seqs:
+        await seq.finished.wait()
+    return seqs
+
+def serve(test):
+    """Runs test(engine) with the engine loop running, and cancels the loop afterwards."""
+    async def run():
+        engine = ContinuousBatchEngine(MODEL, TOKENIZER, max_batch_size=2)
+        task = asyncio.create_task(engine.run())
+        try:
+            return await test(engine)
+        finally:
+            task.cancel()
+    return asyncio.run(run())
+
+def expected(prompt, max_new_tokens=12):
+    tokens = greedy(MODEL, TOKENIZER(prompt).input_ids, max_new_tokens)
+    return tokens[:tokens.index(TOKENIZER.eos_token_id)] if TOKENIZER.eos_token_id in tokens else tokens
+
+def test_continuous_batching_matches_greedy_decoding():
+    prompts = ["start the robot", "move to my neck please and then", "x", "reduce force by 20%"]
+    seqs = serve(lambda engine: generate(engine, prompts))
+    assert [seq.generated for seq in seqs] == [expected(prompt) for prompt in prompts]
+
+def test_failed_prefill_fails_only_its_sequence():
+    async def test(engine):
+        prefill = engine._prefill
+
+        def flaky_prefill(seq):
+            if seq.session_id == "1":
+                raise RuntimeError("CUDA out of memory")
+            return prefill(seq)
+
+        engine._prefill = flaky_prefill
+        seqs = await generate(engine, ["start", "too long", "stop"])
+        later = await generate(engine, ["home"])
+        return seqs + later
+
+    first, failed, third, later = serve(test)
+    assert isinstance(failed.error, RuntimeError)
+    assert first.error is None and first.generated == expected("start")
+    assert third.error is None and third.generated == expected("stop")
+    assert later.error is None and later.generated == expected("home")
+
+def test_failed_decode_step_fails_the_batch_and_keeps_serving():
+    async def test(engine):
+        decode = engine._decode
+        calls = []
+
+        def flaky_decode(*args):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("decode failed")
+            return decode(*args)
+
+        engine._decode = flaky_decode
+        batch = await generate(engine, ["start", "stop"])
+        later = await generate(engine, ["home"])
+        return batch, later
+
+    batch, (later,) = serve(test)
+    assert all(isinstance(seq.error, RuntimeError) for seq in batch)
+    assert later.error is None and later.generated == expected("home")
+
+def test_stopped_engine_fails_waiting_sequences_and_refuses_new_ones():
+    async def run():
+        engine = ContinuousBatchEngine(MODEL, TOKENIZER)
+        seq = await engine.submit("a", TOKENIZER("start").input_ids, 5, None)
+        task = asyncio.create_task(engine.run())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.wait_for(seq.finished.wait(), timeout=5)
+        assert seq.error is not None
+        with pytest.raises(RuntimeError):
+            await engine.submit("b", TOKENIZER("stop").input_ids, 5, None)
+    asyncio.run(run())
+
+def test_ttfts_are_bounded():
+    engine = ContinuousBatchEngine(MODEL, TOKENIZER, ttft_sessions=2, ttft_window=3)
+    for session in ["a", "b", "a", "c"]:
+        for ms in range(5):
+            engine._record_ttft(session, ms)
+    assert list(engine.ttfts) == ["a", "c"]
+    assert list(engine.ttfts["a"]) == [2, 3, 4]
+
+def test_chat_evicts_least_recently_used_idle_sessions():
+    async def test(engine):
+        service = ChatService(engine, TOKENIZER, max_new_tokens=4, max_sessions=2)
+        busy = service.sessions.setdefault("busy", (None, asyncio.Lock()))[1]
+        await busy.acquire()  # a turn of this session is running
+        for session_id in ["a", "b", "c"]:
+            async for _ in service.chat(session_id, "start the robot"):
+                pass
+        busy.release()
+        return service
+
+    service = serve(test)
+    assert list(service.sessions) == ["busy", "c"]
+    assert set(service.last_results) == {"c"}
+
+def test_chat_raises_when_generation_fails():
+    async def test(engine):
+        def failing_prefill(seq):
+            raise RuntimeError("CUDA out of memory")
+
+        engine._prefill = failing_prefill
+        service = ChatService(engine, TOKENIZER, max_new_tokens=4)
+        with pytest.raises(RuntimeError):
+            async for _ in service.chat("a", "start the robot"):
+                pass
+        assert service.in_flight[None] == 0
+
+    serve(test)
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from kv_cache import ChatSession, PrefixCache, cache_length, crop_past_key_values
+from tiny_model import greedy, tiny_model, tiny_tokenizer
+
+TOKENIZER = tiny_tokenizer()
+MODEL = tiny_model(TOKENIZER)
+PREAMBLE = "### Instruction:\nAnswer with a pipeline.\n\n"
+
+def generate(input_ids, attention_mask, past_key_values, max_new_tokens=8):
+    with torch.no_grad():
+        return MODEL.generate(input_ids=input_ids, attention_mask=attention_mask, past_key_values=past_key_values,
+                              max_new_tokens=max_new_tokens, do_sample=False, return_dict_in_generate=True)
+
+def test_prefix_cache_matches_full_prefill_and_is_not_extended():
+    prefix = PrefixCache(MODEL, TOKENIZER, PREAMBLE, "cpu")
+    for suffix in ["User: start the massage\n", "User: stop\n"]:
+        input_ids, attention_mask, past_key_values = prefix.build_inputs(suffix)
+        assert input_ids[0].tolist() == TOKENIZER(PREAMBLE + suffix).input_ids
+        outputs = generate(input_ids, attention_mask, past_key_values)
+        assert outputs.sequences[0, input_ids.shape[1]:].tolist() == greedy(MODEL, input_ids[0].tolist(), 8)
+        assert cache_length(prefix.past_key_values) == prefix.num_tokens
+
+def test_session_reuses_previous_turn_and_matches_full_prefill():
+    session = ChatSession(PrefixCache(MODEL, TOKENIZER, PREAMBLE, "cpu"))
+    history = ""
+    for turn, message in enumerate(["User: massage my neck\n", "User: a bit softer\n", "User: stop\n"]):
+        suffix = history + message
+        input_ids, attention_mask, past_key_values = session.build_inputs(suffix)
+        if turn == 0:
+            assert session.last_reused == session.prefix_cache.num_tokens
+        else:
+            # Everything up to the previous prompt is still cached
+            assert session.last_reused >= len(TOKENIZER(PREAMBLE + previous_suffix).input_ids)
+        assert session.last_reused + session.last_prefilled == input_ids.shape[1]
+        outputs = generate(input_ids, attention_mask, past_key_values)
+        assert outputs.sequences[0, input_ids.shape[1]:].tolist() == greedy(MODEL, input_ids[0].tolist(), 8)
+        session.update(outputs)
+        previous_suffix = suffix
+        history = suffix + "Assistant: " + TOKENIZER.decode(outputs.sequences[0, input_ids.shape[1]:]) + "\n"
+
+def test_session_rebuilds_from_preamble_when_history_shifts():
+    session = ChatSession(PrefixCache(MODEL, TOKENIZER, PREAMBLE, "cpu"))
+    input_ids, attention_mask, past_key_values = session.build_inputs("User: first turn\n")
+    session.update(generate(input_ids, attention_mask, past_key_values))
+    input_ids, attention_mask, past_key_values = session.build_inputs("User: other turn\n")
+    assert session.last_reused == len(TOKENIZER(PREAMBLE + "User: ").input_ids)
+    outputs = generate(input_ids, attention_mask, past_key_values)
+    assert outputs.sequences[0, input_ids.shape[1]:].tolist() == greedy(MODEL, input_ids[0].tolist(), 8)
+
+def prefill(token_ids, past_key_values=None):
+    with torch.no_grad():
+        return MODEL(input_ids=torch.tensor([token_ids]), past_key_values=past_key_values, use_cache=True)
+
+def test_crop_then_refeed_matches_full_forward():
+    token_ids = TOKENIZER("massage my lower back, then stop").input_ids
+    full = prefill(token_ids)
+    past_key_values = crop_past_key_values(full.past_key_values, 10)
+    assert cache_length(past_key_values) == 10
+    refed = prefill(token_ids[10:], past_key_values)
+    assert torch.allclose(refed.logits[0], full.logits[0, 10:])
+    assert cache_length(refed.past_key_values) == len(token_ids)
+
+def as_legacy(cache):
+    if hasattr(cache, "to_legacy_cache"):
+        return cache.to_legacy_cache()
+    return tuple((layer.keys, layer.values) for layer in cache.layers)
+
+def test_crop_legacy_tuples_like_cache_objects():
+    token_ids = TOKENIZER("start the massage").input_ids
+    cache = prefill(token_ids).past_key_values
+    legacy = as_legacy(cache)
+    assert cache_length(legacy) == cache_length(cache) == len(token_ids)
+    legacy = crop_past_key_values(legacy, 5)
+    cache = crop_past_key_values(cache, 5)
+    assert cache_length(legacy) == cache_length(cache) == 5
+    for (key, value), (cache_key, cache_value) in zip(legacy, as_legacy(cache)):
+        assert torch.equal(key, cache_key) and torch.equal(value, cache_value)
@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline_executor import DetectionCache, PipelineExecutor
+from pipeline_parser import DetectBodyPart, Move
+
+def test_get_survives_invalidate_during_detection():
+    cache = None
+
+    def detect_many(parts):
+        cache.invalidate()  # e.g. a stop() handled on another thread while perception runs
+        return [[i, i, i] for i, _ in enumerate(parts)]
+
+    cache = DetectionCache(detect_many)
+    assert cache.get("neck", ["shoulders"]) == [0, 0, 0]
+    assert cache.entries == {}  # detected before the invalidate, so not served later
+
+def test_get_after_invalidate_during_detection_misses():
+    calls = []
+    cache = None
+
+    def detect_many(parts):
+        calls.append(parts)
+        if len(calls) == 1:
+            cache.invalidate()
+        return [[len(calls)] * 3 for _ in parts]
+
+    cache = DetectionCache(detect_many)
+    assert cache.get("neck") == [1, 1, 1]
+    assert cache.get("neck") == [2, 2, 2]
+    assert cache.get("neck") == [2, 2, 2]
+    assert (cache.hits, cache.misses, cache.perception_calls) == (1, 2, 2)
+
+def test_get_hits_within_ttl_only():
+    now = [0.0]
+    calls = []
+    cache = DetectionCache(lambda parts: calls.append(parts) or [[1, 2, 3] for _ in parts], ttl=10, clock=lambda: now[0])
+    cache.get("neck", ["legs"])
+    cache.get("legs")
+    now[0] = 11.0
+    cache.get("legs")
+    assert calls == [["neck", "legs"], ["legs"]]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_reset_forgets_the_detected_part():
+    class Robot:
+        def detect_body_part(self, part):
+            return [1, 2, 3]
+
+        def move_to(self, coords):
+            self.target = coords
+
+    executor = PipelineExecutor(Robot())
+    executor.submit(DetectBodyPart("neck"))
+    assert executor.wait() is None
+    executor.reset()
+    executor.submit(Move(None))
+    assert isinstance(executor.wait(), RuntimeError)
+    executor.close()
@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from transformers import LogitsProcessorList
+
+from pipeline_grammar import GrammarTokenIndex, PipelineGrammar, PipelineGrammarLogitsProcessor, constrained_generate
+from rule_parser import format_response
+from tiny_model import tiny_model, tiny_tokenizer
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "massage_robot_dataset_v2.json")
+TOKENIZER = tiny_tokenizer()
+MODEL = tiny_model(TOKENIZER)
+PROMPT = "### Input:\nmassage my neck\n\n### Response:\n"
+
+def accepts(grammar, text):
+    return grammar.step(grammar.start, text) in grammar.accepting
+
+def test_python_list_grammar_accepts_the_v2_dataset():
+    grammar = PipelineGrammar(layout="python_list")
+    with open(DATASET, "r", encoding="utf-8") as f:
+        for sample in json.load(f):
+            response = sample["response"] if isinstance(sample["response"], list) else [sample["response"]]
+            assert accepts(grammar, format_response(response, "python_list")), sample["response"]
+
+def test_lines_grammar():
+    grammar = PipelineGrammar(layout="lines")
+    assert accepts(grammar, "[x, y, z] = detect_body_part('neck')\nmove_to([x, y, z])\nchange_force('relative', -0.2)")
+    assert not accepts(grammar, "[x, y, z] = detect_body_part('tail')")
+    assert not accepts(grammar, "move_to([x, y, z])\n")
+    assert grammar.step(grammar.start, "jump()") is None
+    assert grammar.forced_text(grammar.step(grammar.start, "[")) == "x, y, z] = detect_body_part('"
+
+def test_forced_tokens_spell_the_forced_text():
+    grammar = PipelineGrammar(layout="lines")
+    index = GrammarTokenIndex(TOKENIZER, grammar)
+    for prefix in ["[", "move_to([x", "automatic_massage('neck"]:
+        state = grammar.step(grammar.start, prefix)
+        forced = index.forced_tokens(state)
+        assert TOKENIZER.decode(forced) == grammar.forced_text(state)
+        assert forced
+
+def test_mask_only_allows_grammar_tokens_and_eos_when_complete():
+    grammar = PipelineGrammar(layout="lines")
+    index = GrammarTokenIndex(TOKENIZER, grammar)
+    eos = [TOKENIZER.eos_token_id]
+    state = grammar.step(grammar.start, "sto")
+    mask = index.mask(state, eos, len(TOKENIZER), "cpu")
+    assert (mask == 0).nonzero().flatten().tolist() == TOKENIZER.encode("p", add_special_tokens=False)
+    complete = grammar.step(grammar.start, "stop()")
+    assert index.mask(complete, eos, len(TOKENIZER), "cpu")[eos[0]] == 0
+
+def generate_with_processor(processor, max_new_tokens):
+    input_ids = torch.tensor([TOKENIZER(PROMPT).input_ids])
+    with torch.no_grad():
+        output = MODEL.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+                                do_sample=False, logits_processor=LogitsProcessorList([processor]),
+                                pad_token_id=TOKENIZER.eos_token_id)
+    return output[0, input_ids.shape[1]:].tolist()
+
+@pytest.mark.parametrize("layout", ["lines", "python_list"])
+def test_constrained_generate_matches_generate_with_the_processor(layout):
+    grammar = PipelineGrammar(layout=layout)
+    processor = PipelineGrammarLogitsProcessor(GrammarTokenIndex(TOKENIZER, grammar), TOKENIZER.eos_token_id)
+    expected = generate_with_processor(processor, 40)
+    # A random model still only produces (a prefix of) a valid pipeline
+    assert grammar.step(grammar.start, TOKENIZER.decode(expected, skip_special_tokens=True)) is not None
+
+    input_ids = torch.tensor([TOKENIZER(PROMPT).input_ids])
+    outputs = constrained_generate(MODEL, input_ids, torch.ones_like(input_ids), processor, max_new_tokens=40)
+    assert outputs.sequences[0, input_ids.shape[1]:].tolist() == expected
+    assert outputs.num_forced_tokens > 0
+    assert outputs.num_forward_passes == len(expected) - outputs.num_forced_tokens
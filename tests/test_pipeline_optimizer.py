@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline_optimizer import StreamingOptimizer, optimize
+from pipeline_parser import AutomaticMassage, ChangeForce, DetectBodyPart, Home, Move, Start, Stop
+
+def stream(commands):
+    emitted = []
+    optimizer = StreamingOptimizer(emitted.append)
+    for command in commands:
+        optimizer.feed(command)
+    optimizer.flush()
+    return emitted
+
+def test_detect_after_home_is_kept():
+    plan = [DetectBodyPart("neck"), Move(None), Home(), DetectBodyPart("neck"), Move(None)]
+    assert optimize(plan)[0] == plan
+    assert stream(plan) == plan
+
+def test_detect_after_stop_is_kept():
+    plan = [DetectBodyPart("neck"), Stop(), DetectBodyPart("neck"), Move(None)]
+    assert optimize(plan)[0] == plan
+    assert stream(plan) == plan
+
+def test_repeated_detect_without_movement_is_removed():
+    plan = [DetectBodyPart("neck"), ChangeForce("absolute", 0.5), DetectBodyPart("neck"), Move(None)]
+    expected = [DetectBodyPart("neck"), ChangeForce("absolute", 0.5), Move(None)]
+    commands, removed = optimize(plan)
+    assert commands == expected
+    assert removed["repeated detect_body_part"] == 1
+    assert stream(plan) == expected
+
+def test_detect_after_move_to_is_removed():
+    plan = [DetectBodyPart("neck"), Move(None), DetectBodyPart("neck"), AutomaticMassage("neck")]
+    expected = [DetectBodyPart("neck"), Move(None), AutomaticMassage("neck")]
+    commands, removed = optimize(plan)
+    assert commands == expected
+    assert removed["repeated detect_body_part"] == 1
+    assert stream(plan) == expected
+
+def test_detect_after_start_is_kept():
+    plan = [DetectBodyPart("neck"), Start(), DetectBodyPart("neck"), Move(None)]
+    assert optimize(plan)[0] == plan
+    assert stream(plan) == plan
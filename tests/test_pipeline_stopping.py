@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline_grammar import PipelineGrammar
+from pipeline_stopping import PipelineStoppingCriteria, max_commands_for_input
+from tiny_model import tiny_tokenizer
+
+TOKENIZER = tiny_tokenizer()
+NECK = "[x, y, z] = detect_body_part('neck')\nmove_to([x, y, z])\nautomatic_massage('neck')"
+
+def criteria(user_input, layout="lines", prompt_length=0):
+    return PipelineStoppingCriteria(TOKENIZER, prompt_length, user_input, PipelineGrammar(layout=layout))
+
+def test_command_bound_counts_connected_clauses():
+    assert max_commands_for_input("stop") == 3
+    assert max_commands_for_input("massage my neck; then stop") == 6
+
+def test_blank_line_ends_a_complete_pipeline_only():
+    stopping = criteria("massage my neck")
+    assert stopping.check(NECK) is None
+    assert stopping.check(NECK + "\n\n") == "blank line after pipeline"
+    assert stopping.check("[x, y, z] = detect_body_part('neck')\nmove_to([x\n\n") is None
+    assert stopping.check("stop()\n### Input:") == "section marker"
+
+def test_newline_ends_a_python_list_pipeline():
+    stopping = criteria("massage my neck", layout="python_list")
+    response = str(["[x, y, z] = detect_body_part('neck')", "move_to([x, y, z])"])
+    assert stopping.check(response) is None
+    assert stopping.check(response + "\n") == "blank line after pipeline"
+    assert stopping.clean(response + "\nstart()") == response
+
+def test_runaway_response_is_cut_to_the_command_bound():
+    stopping = criteria("stop the massage")
+    text = "stop()\nhome()\nstart()\nstop()\nhome()"
+    assert stopping.check(text) == "command count"
+    assert stopping.clean(text) == "stop()\nhome()\nstart()"
+
+    stopping = criteria("stop the massage", layout="python_list")
+    assert stopping.clean("['stop()', 'home()', 'start()', 'stop()'") == "['stop()', 'home()', 'start()']"
+
+def test_call_decodes_only_the_generated_tokens():
+    prompt = TOKENIZER("### Response:\n").input_ids
+    stopping = criteria("massage my neck", prompt_length=len(prompt))
+    rows = torch.tensor([prompt + TOKENIZER(NECK).input_ids])
+    assert stopping(rows, None).tolist() == [False]
+    rows = torch.tensor([prompt + TOKENIZER(NECK + "\n\n").input_ids])
+    assert stopping(rows, None).tolist() == [True]
+    assert stopping.reason == "blank line after pipeline"
+    assert stopping.clean(TOKENIZER.decode(rows[0, len(prompt):])) == NECK
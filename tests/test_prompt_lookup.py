@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from kv_cache import PrefixCache
+from pipeline_grammar import GrammarTokenIndex, PipelineGrammar, PipelineGrammarLogitsProcessor, constrained_generate
+from prompt_lookup import find_draft, speculative_generate
+from tiny_model import greedy, tiny_model, tiny_tokenizer
+
+TOKENIZER = tiny_tokenizer()
+MODEL = tiny_model(TOKENIZER)
+# Repetitive, like a conversation history, so the n-gram lookup finds drafts
+PROMPT = ("User: massage my neck\nAssistant: automatic_massage('neck')\n"
+          "User: massage my neck\nAssistant: automatic_massage('neck')\nUser: massage my neck\nAssistant:")
+
+def test_find_draft_prefers_the_longest_recent_match():
+    assert find_draft([1, 2, 3, 9, 2, 3, 7, 8, 2, 3], max_ngram_size=2, num_draft_tokens=2) == [7, 8]
+    assert find_draft([5, 6], sources=[[4, 6, 1, 2]], num_draft_tokens=3) == [1, 2]
+    assert find_draft([1, 2, 3]) == []
+
+def speculate(input_ids, **kwargs):
+    return speculative_generate(MODEL, input_ids, torch.ones_like(input_ids), max_new_tokens=30,
+                                eos_token_id=TOKENIZER.eos_token_id, **kwargs)
+
+def test_output_equals_greedy():
+    prompt_ids = TOKENIZER(PROMPT).input_ids
+    outputs = speculate(torch.tensor([prompt_ids]))
+    assert outputs.sequences[0, len(prompt_ids):].tolist() == greedy(MODEL, prompt_ids, 30)
+    assert outputs.num_drafted > 0
+
+def test_output_equals_greedy_from_a_prefix_cache_with_sources():
+    prefix = PrefixCache(MODEL, TOKENIZER, "User: massage my neck\n", "cpu")
+    input_ids, attention_mask, past_key_values = prefix.build_inputs(PROMPT)
+    sources = [TOKENIZER(" automatic_massage('neck')").input_ids]
+    outputs = speculative_generate(MODEL, input_ids, attention_mask, past_key_values=past_key_values,
+                                   max_new_tokens=30, eos_token_id=TOKENIZER.eos_token_id, sources=sources)
+    assert outputs.sequences[0, input_ids.shape[1]:].tolist() == greedy(MODEL, input_ids[0].tolist(), 30)
+
+def test_output_under_the_grammar_equals_constrained_generate():
+    grammar = PipelineGrammar(layout="lines")
+    index = GrammarTokenIndex(TOKENIZER, grammar)
+    input_ids = torch.tensor([TOKENIZER(PROMPT).input_ids])
+    expected = constrained_generate(MODEL, input_ids, torch.ones_like(input_ids),
+                                    PipelineGrammarLogitsProcessor(index, TOKENIZER.eos_token_id), max_new_tokens=30)
+    outputs = speculate(input_ids, grammar_index=index)
+    assert outputs.sequences.tolist() == expected.sequences.tolist()
+    assert outputs.num_forced_tokens > 0
@@ -0,0 +1,31 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline_parser import parse_pipeline
+from robot_transport import RobotTransportClient
+
+def test_outstanding_commands_fail_when_the_controller_disconnects(tmp_path):
+    async def run():
+        async def hang_up(reader, writer):
+            await reader.read(1)  # take the plan, never ack it
+            writer.close()
+
+        path = str(tmp_path / "robot.sock")
+        server = await asyncio.start_unix_server(hang_up, path)
+        client = RobotTransportClient(path)
+        await client.connect()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(client.execute(parse_pipeline("start()\nhome()")), timeout=5)
+        assert client.waiting == {}
+        with pytest.raises(ConnectionError):
+            await client.execute(parse_pipeline("stop()"))
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
@@ -0,0 +1,40 @@
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import create_dataset
+from rule_parser import RuleBasedParser
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "massage_robot_dataset_v2.json")
+GENERATORS = [create_dataset.cmd_start, create_dataset.cmd_stop, create_dataset.cmd_home, create_dataset.cmd_detect,
+              create_dataset.cmd_move, create_dataset.cmd_change_force_relative,
+              create_dataset.cmd_change_force_absolute, create_dataset.cmd_automatic_massage]
+
+def test_v1_layout_replays_the_v2_dataset():
+    parser = RuleBasedParser()
+    with open(DATASET, "r", encoding="utf-8") as f:
+        samples = json.load(f)
+    answered = [(parser.respond(sample["input"], layout="python_list"), sample["response"]) for sample in samples]
+    answered = [(response, reference) for response, reference in answered if response is not None]
+    assert len(answered) > len(samples) // 3
+    assert [response for response, _ in answered] == [reference for _, reference in answered]
+
+def test_lines_layout_replays_the_context_generators():
+    parser = RuleBasedParser()
+    rng_state = random.getstate()
+    random.seed(0)
+    try:
+        samples = [random.choice(GENERATORS)() for _ in range(2000)]
+    finally:
+        random.setstate(rng_state)
+    answered = [(parser.respond(text), "\n".join(pipeline)) for text, pipeline in samples]
+    answered = [(response, reference) for response, reference in answered if response is not None]
+    assert len(answered) > len(samples) // 2
+    assert [response for response, _ in answered] == [reference for _, reference in answered]
+
+def test_absolute_force_goes_to_the_model():
+    result = RuleBasedParser().parse("Set massage intensity to 54%")
+    assert result.lines is None and "absolute force" in result.reason
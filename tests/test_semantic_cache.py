@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from semantic_cache import SemanticCache
+
+class ConstantEncoder:
+    """Worst case for the cache: every utterance gets the same embedding."""
+    dim = 4
+
+    def encode(self, texts, batch_size=64):
+        return np.tile(np.array([1, 0, 0, 0], dtype=np.float32), (len(texts), 1))
+
+def test_stop_never_hits_cached_start():
+    cache = SemanticCache(ConstantEncoder(), max_size=16)
+    cache.add("start the massage", "start()")
+    assert cache.lookup("stop the massage") == (None, 0.0)
+    assert cache.lookup("start the massage")[0] == "start()"
+
+def test_opposite_force_changes_do_not_share_a_bucket():
+    cache = SemanticCache(ConstantEncoder(), max_size=16)
+    cache.add("increase massage pressure by 20%", "change_force('relative', 0.2)")
+    assert cache.lookup("reduce massage pressure by 20%")[0] is None
+    assert cache.lookup("turn off the massage robot")[0] is None
+
+def test_seed_refuses_python_list_responses_for_lines_layout():
+    cache = SemanticCache(ConstantEncoder(), max_size=16)
+    with pytest.raises(ValueError):
+        cache.seed_from_dataset(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "massage_robot_dataset_v2.json"), layout="lines")
+
+def test_seed_from_context_dataset_keeps_lines_and_skips_history(tmp_path):
+    samples = [
+        {"instruction": "", "conversation_history": "", "latest_user_input": "massage my neck",
+         "response": "detect_body_part('neck')\nmove_to([x, y, z])\nautomatic_massage('neck')"},
+        {"instruction": "", "conversation_history": "User: massage my neck", "latest_user_input": "stop the massage",
+         "response": "stop()"},
+    ]
+    path = tmp_path / "context.json"
+    path.write_text(json.dumps(samples))
+    cache = SemanticCache(ConstantEncoder(), max_size=16)
+    cache.seed_from_dataset(str(path), layout="lines")
+    assert cache.lookup("massage my neck")[0] == samples[0]["response"]
+    assert cache.lookup("stop the massage")[0] is None
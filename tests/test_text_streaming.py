@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from text_streaming import CapturingTextStreamer, IncrementalDetokenizer
+from tiny_model import tiny_tokenizer
+
+# Byte-level tokens, so every accented character and emoji spans several tokens
+TOKENIZER = tiny_tokenizer()
+TEXT = "automatic_massage('neck') — vielen Dank, ça va 👍\nstop()"
+
+def test_one_token_at_a_time_never_splits_a_character():
+    detokenizer = IncrementalDetokenizer(TOKENIZER)
+    chunks = [detokenizer.add([token_id]) for token_id in TOKENIZER(TEXT).input_ids]
+    chunks.append(detokenizer.flush())
+    assert "".join(chunks) == TEXT == detokenizer.text
+    assert not any("�" in chunk for chunk in chunks)
+
+def test_flush_emits_a_truncated_character():
+    detokenizer = IncrementalDetokenizer(TOKENIZER)
+    assert detokenizer.add(TOKENIZER("ok ").input_ids) == "ok "
+    partial = TOKENIZER("👍").input_ids[:-1]
+    assert detokenizer.add(partial) == ""
+    assert detokenizer.flush() == TOKENIZER.decode(partial)
+
+def test_streamer_skips_the_prompt_and_forwards_text():
+    pieces = []
+    streamer = CapturingTextStreamer(TOKENIZER, on_text=pieces.append, print_output=False)
+    streamer.put([TOKENIZER("### Response:\n").input_ids])
+    for token_id in TOKENIZER(TEXT).input_ids + [TOKENIZER.eos_token_id]:
+        streamer.put([token_id])
+    streamer.end()
+    assert streamer.generated_text == "".join(pieces) == TEXT
+    with pytest.raises(ValueError):
+        streamer.put([[1], [2]])
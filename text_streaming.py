@@ -0,0 +1,105 @@
+from transformers.generation.streamers import BaseStreamer
+
+# ------------------------------
+# Incremental detokenizer
+# ------------------------------
+class IncrementalDetokenizer:
+    """
+    Turns a growing list of token ids into text in O(n) overall.
+
+    Decoding tokens one by one breaks multi-byte characters and drops the leading space of
+    SentencePiece tokens, while decoding the whole buffer on every token is quadratic. Instead,
+    only the short window since the last emitted text is decoded: tokens[prefix_offset:read_offset]
+    is the already-emitted context and everything after read_offset is new. Text is emitted once
+    it no longer ends in an incomplete UTF-8 sequence ("�").
+    """
+    def __init__(self, tokenizer, skip_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.reset()
+
+    def reset(self):
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.chunks = []
+
+    def _decode(self, token_ids):
+        return self.tokenizer.decode(token_ids, skip_special_tokens=self.skip_special_tokens)
+
+    def add(self, token_ids):
+        """Appends token ids; returns the newly stable text (possibly empty)."""
+        self.token_ids.extend(token_ids)
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+        if len(new_text) > len(prefix_text) and not new_text.endswith("�"):
+            delta = new_text[len(prefix_text):]
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.token_ids)
+            self.chunks.append(delta)
+            return delta
+        return ""
+
+    def flush(self):
+        """Emits whatever is still held back at the end of the stream."""
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+        delta = new_text[len(prefix_text):]
+        self.prefix_offset = self.read_offset = len(self.token_ids)
+        if delta:
+            self.chunks.append(delta)
+        return delta
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+# ------------------------------
+# Streamer for model.generate / constrained_generate
+# ------------------------------
+class CapturingTextStreamer(BaseStreamer):
+    """
+    Prints the response as it is generated, keeps the full text in generated_text and forwards
+    every new piece to on_text (e.g. IncrementalPipelineParser.feed). Set print_output=False when
+    streaming somewhere other than the terminal (server mode, benchmarks).
+    """
+    def __init__(self, tokenizer, skip_prompt=True, skip_special_tokens=True, on_text=None, print_output=True):
+        self.detokenizer = IncrementalDetokenizer(tokenizer, skip_special_tokens=skip_special_tokens)
+        self.skip_prompt = skip_prompt
+        self.on_text = on_text
+        self.print_output = print_output
+        self.next_tokens_are_prompt = True
+
+    def put(self, value):
+        if hasattr(value, "tolist"):
+            value = value.tolist()
+        if isinstance(value, int):
+            value = [value]
+        if value and isinstance(value[0], list):
+            if len(value) > 1:
+                raise ValueError("CapturingTextStreamer only supports batch size 1")
+            value = value[0]
+        if self.skip_prompt and self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+        self.on_finalized_text(self.detokenizer.add(value))
+
+    def end(self):
+        self.on_finalized_text(self.detokenizer.flush())
+        self.next_tokens_are_prompt = True
+
+    def on_finalized_text(self, text):
+        if not text:
+            return
+        if self.print_output:
+            print(text, end="", flush=True)
+        if self.on_text is not None:
+            self.on_text(text)
+
+    @property
+    def generated_text(self):
+        return self.detokenizer.text
+
+    def reset(self):
+        self.detokenizer.reset()
+        self.next_tokens_are_prompt = True